@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import numpy as np
+
+from query_cache import normalizuj_dotaz
+
+
+class CacheOdpovedi:
+    """
+    Perzistentní sémantická cache hotových odpovědí (SQLite).
+
+    Klíčem je embedding dotazu: odpověď se vrátí, pokud je kosinová podobnost
+    k některému uloženému dotazu alespoň `prah` a zároveň se přesně shodují entity dotazu
+    (zmíněné banky a čísla) – „Akceptuje KB výživné?“ a „… ČS …“ mají embedding skoro stejný,
+    odpověď ale jinou. Stará data bez entit se nepoužijí. Záznamy jsou vázané na verzi
+    indexu a na dimenzi embeddingu – po přeindexování nebo změně modelu se staré odpovědi
+    nepoužijí a při dalším uložení smažou.
+    Uložené odpovědi jsou seznam {"banka", "markdown"} v pořadí bank.
+    """
+
+    def __init__(self, cesta: str, prah: float = 0.95):
+        self.cesta = cesta
+        self.prah = prah
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(cesta) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(cesta, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS odpovedi (
+                id INTEGER PRIMARY KEY,
+                dotaz TEXT NOT NULL,
+                dotaz_norm TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                index_verze TEXT NOT NULL,
+                odpovedi TEXT NOT NULL,
+                vytvoreno REAL NOT NULL,
+                entity TEXT
+            )"""
+        )
+        sloupce = {r[1] for r in self._conn.execute("PRAGMA table_info(odpovedi)")}
+        if "entity" not in sloupce:
+            self._conn.execute("ALTER TABLE odpovedi ADD COLUMN entity TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_odpovedi_verze ON odpovedi(index_verze)")
+        self._conn.commit()
+        # Embeddingy aktuální verze držíme v paměti jako normalizovanou matici
+        self._stav = None
+        self._ids = []
+        self._entity = []
+        self._matice = None
+
+    @staticmethod
+    def _normalizuj(embedding) -> np.ndarray:
+        v = np.asarray(embedding, dtype=np.float32)
+        return v / (np.linalg.norm(v) or 1.0)
+
+    def _obnov_matici(self, verze: str, velikost: int):
+        # Jiný worker mohl mezitím něco uložit nebo smazat – stav poznáme z MAX(id) a COUNT(*)
+        # Vektory jiné délky (jiný model) se do matice nenačtou – násobení by selhalo
+        stav = (verze, velikost) + self._conn.execute(
+            "SELECT MAX(id), COUNT(*) FROM odpovedi WHERE index_verze = ? AND length(embedding) = ?", (verze, velikost)
+        ).fetchone()
+        if stav == self._stav:
+            return
+        radky = self._conn.execute(
+            "SELECT id, embedding, entity FROM odpovedi WHERE index_verze = ? AND length(embedding) = ? ORDER BY id",
+            (verze, velikost),
+        ).fetchall()
+        self._ids = [r[0] for r in radky]
+        self._entity = np.asarray([r[2] for r in radky], dtype=object)
+        self._matice = np.stack([np.frombuffer(r[1], dtype=np.float32) for r in radky]) if radky else None
+        self._stav = stav
+
+    def najdi(self, embedding, verze: str, entity: str):
+        """Vrátí uložené odpovědi nejpodobnějšího dotazu se stejnými entitami nad prahem, jinak None."""
+        cil = self._normalizuj(embedding)
+        with self._lock:
+            self._obnov_matici(verze, cil.nbytes)
+            if self._matice is None:
+                self.misses += 1
+                return None
+            podobnosti = np.where(self._entity == entity, self._matice @ cil, -1.0)
+            nejlepsi = int(np.argmax(podobnosti))
+            if podobnosti[nejlepsi] < self.prah:
+                self.misses += 1
+                return None
+            radek = self._conn.execute(
+                "SELECT odpovedi FROM odpovedi WHERE id = ?", (self._ids[nejlepsi],)
+            ).fetchone()
+            if radek is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return json.loads(radek[0])
+
+    def uloz(self, dotaz: str, embedding, verze: str, odpovedi: list[dict], entity: str):
+        vektor = self._normalizuj(embedding)
+        with self._lock:
+            # Odpovědi ke starším verzím indexu nebo jinému modelu už nikdy nepoužijeme
+            self._conn.execute(
+                "DELETE FROM odpovedi WHERE index_verze != ? OR length(embedding) != ?", (verze, vektor.nbytes)
+            )
+            self._conn.execute(
+                "INSERT INTO odpovedi (dotaz, dotaz_norm, embedding, index_verze, odpovedi, vytvoreno, entity) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    dotaz,
+                    normalizuj_dotaz(dotaz),
+                    vektor.tobytes(),
+                    verze,
+                    json.dumps(odpovedi, ensure_ascii=False),
+                    time.time(),
+                    entity,
+                ),
+            )
+            self._conn.commit()
+
+    def zneplatni(self, dotaz: str, embedding, entity: str) -> int:
+        """
+        Smaže odpovědi na tentýž dotaz, nebo na dostatečně podobný se stejnými entitami (např. po 👎
+        u odpovědi pro KB zůstanou odpovědi na stejnou otázku pro jiné banky). Vrací počet smazaných.
+        """
+        cil = self._normalizuj(embedding)
+        with self._lock:
+            radky = self._conn.execute("SELECT id, dotaz_norm, embedding, entity FROM odpovedi").fetchall()
+            klic = normalizuj_dotaz(dotaz)
+            smazat = [
+                id_ for id_, dotaz_norm, blob, entity_radku in radky
+                if dotaz_norm == klic or (
+                    entity_radku == entity and len(blob) == cil.nbytes
+                    and float(np.frombuffer(blob, dtype=np.float32) @ cil) >= self.prah
+                )
+            ]
+            if smazat:
+                self._conn.executemany("DELETE FROM odpovedi WHERE id = ?", [(id_,) for id_ in smazat])
+                self._conn.commit()
+            return len(smazat)
+
+    def statistiky(self) -> dict:
+        with self._lock:
+            pocet = self._conn.execute("SELECT COUNT(*) FROM odpovedi").fetchone()[0]
+            return {"nazev": "odpovedi", "velikost": pocet, "hits": self.hits, "misses": self.misses, "prah": self.prah}
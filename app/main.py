@@ -1,20 +1,26 @@
+import asyncio
 import markdown
 import re
 import urllib.parse
 
 from fastapi import FastAPI, Request, Form, Depends, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, PlainTextResponse, FileResponse, Response
 from fastapi.templating import Jinja2Templates
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from starlette.background import BackgroundTask
 from starlette.status import HTTP_401_UNAUTHORIZED
-from sentence_transformers import SentenceTransformer
 from pydantic import BaseModel
 import chromadb
-import openai
 import os
 import secrets
 import csv
+import json
+import time
+import zlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from fulltext_validator import analyzuj_relevantni_banky_fulltextem
 
@@ -92,27 +98,72 @@ BANK_NAME_MAP = {
     "unicreditbank": "UniCredit Bank",
     "ucb": "UniCredit Bank",
     "raiffeisenbank": "Raiffeisenbank",
+    "raiffeisen": "Raiffeisenbank",
     "rb": "Raiffeisenbank",
+    "unicredit": "UniCredit Bank",
+    # skloňované tvary, jak se objevují v dotazech („u Komerční banky“)
+    "komercnibanky": "Komerční banka",
+    "komercnibance": "Komerční banka",
+    "komercnibankou": "Komerční banka",
+    "ceskesporitelny": "Česká spořitelna",
+    "ceskesporitelne": "Česká spořitelna",
+    "ceskousporitelnou": "Česká spořitelna",
+    "raiffeisenbanky": "Raiffeisenbank",
+    "raiffeisenbance": "Raiffeisenbank",
+    "unicreditbanky": "UniCredit Bank",
+    "unicreditbance": "UniCredit Bank",
+    "mbanky": "mBank",
+    "mbance": "mBank",
+    "oberbanky": "Oberbank AG",
+    "oberbance": "Oberbank AG",
     # přidej další podle potřeby
 }
 
-def normalizuj_nazev_banky(banka_raw):
+def odstran_diakritiku(text):
     import unicodedata
-    if not banka_raw or "neznámá" in banka_raw.lower():
-        return "Neznámá banka"
-    banka = banka_raw.strip().lower()
-    banka = ''.join(
-        c for c in unicodedata.normalize('NFD', banka)
+    return ''.join(
+        c for c in unicodedata.normalize('NFD', text)
         if unicodedata.category(c) != 'Mn'
     )
+
+def normalizuj_nazev_banky(banka_raw):
+    if not banka_raw or "neznámá" in banka_raw.lower():
+        return "Neznámá banka"
+    banka = odstran_diakritiku(banka_raw.strip().lower())
     banka = banka.replace(" ", "")
     return BANK_NAME_MAP.get(banka, banka_raw.strip())
 
+def najdi_banky_v_dotazu(dotaz):
+    """Oficiální názvy bank zmíněných v dotazu (jednotlivá slova i spojení až tří slov)."""
+    slova = re.findall(r"[a-z0-9]+", odstran_diakritiku(dotaz.lower()))
+    banky = set()
+    for delka in (1, 2, 3):
+        for i in range(len(slova) - delka + 1):
+            banka = BANK_NAME_MAP.get("".join(slova[i:i + delka]))
+            if banka:
+                banky.add(banka)
+    return banky
+
 # --- Přidáno: zpřístupnění modulu z root složky ---
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from fulltext_validator import analyzuj_relevantni_banky_fulltextem
+from query_cache import CacheDotazu, VerzeIndexu, normalizuj_dotaz
+from answer_cache import CacheOdpovedi
+from dedup import cisla
+from inverted_index import InvertovanyIndex, reciprocal_rank_fusion
+from reranker import vytvor_reranker, preranguj_banky
+from structured_answer import rozloz_odpoved_json
+from prompts import prompt_vyber, prompt_odpoved, prompt_json, citace_z_metadat
+from embeddings import vytvor_enkoder
+from vector_store import NumpyUloziste, ChromaUloziste
+from tabulky import TabulkovyIndex, odpovez_z_tabulek, podklady_z_tabulek
+from verze_dokumentu import dnes, parsuj_datum, platne_soubory, VERZE_PLATNOSTI
+from router import Router, PRIKLADY_PATH
+from llm_client import vytvor_klienta, LLMNedostupne
+from metodiky import METODIKY_PATH, VYTAHY_PATH, najdi_soubor, verze_souboru, cesta_vytahu
+from metrics import registr, mereni, zacni_trasu, zaznamenej_tokeny, zaznamenej_vlastnosti, DOBA_POZADAVKU, LLM_VOLANI
 
 # === Zvýraznění a prolinkování citací ===
 def highlight_citations(text: str) -> str:
@@ -127,10 +178,16 @@ def highlight_citations(text: str) -> str:
             return citation
 
         filename = doc_match.group(1).strip()
-        safe_filename = urllib.parse.quote(filename)
-        url = f"/metodiky/{safe_filename}"
 
-        return f"<a href='{url}' target='_blank' class='citation'>{citation}</a>"
+        # U PDF skočí prohlížeč rovnou na citovanou stránku (nebo otevře jen výtah této strany)
+        strana_match = re.search(r'strana: (\d+)', citation)
+        strana = int(strana_match.group(1)) if strana_match and filename.lower().endswith(".pdf") else None
+        url, url_celeho = odkazy_na_metodiku(filename, strana)
+
+        odkaz = f"<a href='{url}' target='_blank' class='citation'>{citation}</a>"
+        if url_celeho:
+            odkaz += f" <a href='{url_celeho}' target='_blank' class='citation-dokument'>celý dokument</a>"
+        return odkaz
 
     pattern = r"\(dokument: [^)]+\)"
     return re.sub(pattern, replace, text)
@@ -143,15 +200,88 @@ PASSWORD = os.getenv("APP_PASSWORD")
 # === Inicializace aplikace ===
 app = FastAPI()
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
-app.mount("/metodiky", StaticFiles(directory="metodiky_bank"), name="metodiky")
 
 templates = Jinja2Templates(directory="app/templates")
 security = HTTPBasic()
 
 # === Embed model a vektorová DB ===
-model = SentenceTransformer("intfloat/multilingual-e5-large")
-client = chromadb.PersistentClient(path="./chroma_db")
-collection = client.get_collection("hypoteky_all")
+CHROMA_PATH = "./chroma_db"
+MANIFEST_PATH = os.path.join(CHROMA_PATH, "manifest_hypoteky_all.json")
+
+# Model ani Chroma se při importu nenačítají – až warm-up po startu nebo první dotaz.
+# S EMBED_SERVICE_URL kóduje sdílená služba (embed_server.py) a worker model nedrží vůbec.
+enkoder = vytvor_enkoder()
+# Kódování a rerank jsou CPU-bound – běží jen v tomto omezeném poolu, ať souběžné dotazy
+# nepřetíží CPU ani nezaberou threadpool, ve kterém běží ostatní blokující práce
+ENCODE_WORKERS = int(os.getenv("ENCODE_WORKERS", "2"))
+vypocet_executor = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix="vypocet")
+
+def spust_vypocet(funkce, *args):
+    """Spustí funkci ve vypocet_executoru a počká na výsledek (volat z jiných vláken, ne z executoru samotného)."""
+    return vypocet_executor.submit(funkce, *args).result()
+_kolekce = None
+_kolekce_lock = threading.Lock()
+
+def ziskej_kolekci():
+    global _kolekce
+    with _kolekce_lock:
+        if _kolekce is None:
+            _kolekce = chromadb.PersistentClient(path=CHROMA_PATH).get_collection("hypoteky_all")
+    return _kolekce
+
+# === Cache embeddingů dotazů a výsledků vyhledávání ===
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", str(24 * 3600)))
+
+cache_embeddingu = CacheDotazu("embedding", QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+cache_vyhledavani = CacheDotazu("vyhledavani", QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+# Po přeindexování (nová verze v manifestu) se výsledky vyhledávání zahodí
+verze_indexu = VerzeIndexu(MANIFEST_PATH, pri_zmene=cache_vyhledavani.vymaz)
+
+def _zakoduj(dotaz: str) -> list[float]:
+    with mereni("embed"):
+        return spust_vypocet(enkoder.encode, f"query: {dotaz.strip()}").tolist()
+
+def zakoduj_dotaz(dotaz: str) -> list[float]:
+    return cache_embeddingu.ziskej(normalizuj_dotaz(dotaz), lambda: _zakoduj(dotaz))
+
+# === Sémantická cache hotových odpovědí ===
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+cache_odpovedi = (
+    CacheOdpovedi(os.path.join(CHROMA_PATH, "answer_cache.sqlite"), prah=ANSWER_CACHE_THRESHOLD)
+    if ANSWER_CACHE_ENABLED else None
+)
+
+def verze_odpovedi() -> str:
+    """Verze pro cache odpovědí: index + sada dnes platných vydání (mění se i s datem účinnosti nového vydání)."""
+    verze = verze_indexu.aktualni()
+    k_datu = k_datu_vyhledavani()
+    if k_datu is None:
+        return verze
+    platne = platne_soubory(verze_indexu.manifest().get("soubory", {}), k_datu)
+    return f"{verze}:{zlib.crc32(chr(10).join(sorted(platne)).encode('utf-8')):08x}"
+
+def entity_dotazu(dotaz: str) -> str:
+    """Banky a čísla z dotazu – cache odpovědí vyžaduje jejich přesnou shodu (KB vs. ČS, LTV 80 % vs. 90 %)."""
+    return f"{'|'.join(sorted(najdi_banky_v_dotazu(dotaz)))}#{cisla(dotaz)}"
+
+def najdi_odpoved_v_cache(dotaz: str):
+    """Vrátí (embedding, verze, odpovedi | None); embedding a verzi použijeme i pro uložení."""
+    embedding = zakoduj_dotaz(dotaz)
+    verze = verze_odpovedi()
+    with mereni("cache_odpovedi"):
+        odpovedi = cache_odpovedi.najdi(embedding, verze, entity_dotazu(dotaz)) if cache_odpovedi else None
+    return embedding, verze, odpovedi
+
+def uloz_odpoved_do_cache(dotaz: str, embedding, verze: str, banky_map: dict, odpovedi: list[dict]):
+    # Ukládáme jen úplné odpovědi – při selhání některé banky se dotaz příště zopakuje
+    # (strukturovaná odpověď jedním voláním je úplná vždy – banky bez informací model vynechá záměrně)
+    pocet_bank = sum(1 for data in banky_map.values() if data["chunks"])
+    uplna = odpovedi and (odpovedi[0].get("strukturovana") or len(odpovedi) == pocet_bank)
+    if cache_odpovedi and uplna:
+        cache_odpovedi.uloz(dotaz, embedding, verze, odpovedi, entity_dotazu(dotaz))
 
 # === Autentizace ===
 def check_auth(credentials: HTTPBasicCredentials = Depends(security)):
@@ -173,168 +303,773 @@ class Feedback(BaseModel):
     feedback: str
     comment: str = ""
 
+feedback_lock = threading.Lock()
+
+def zapis_feedback(data: Feedback):
+    # Zámek: souběžné zápisy z více vláken by se v CSV prokládaly
+    feedback_file = "feedback.csv"
+    with feedback_lock:
+        file_exists = os.path.isfile(feedback_file)
+        with open(feedback_file, mode="a", encoding="cp1250", newline="") as f:
+            writer = csv.writer(f)
+            if not file_exists:
+                writer.writerow(["question", "answer", "feedback", "comment"])
+            writer.writerow([data.question, data.answer, data.feedback, data.comment])
+
 @app.post("/feedback")
 async def receive_feedback(data: Feedback):
-    feedback_file = "feedback.csv"
-    file_exists = os.path.isfile(feedback_file)
+    # Zápis na disk neblokuje event loop
+    await run_in_threadpool(zapis_feedback, data)
 
-    with open(feedback_file, mode="a", encoding="cp1250", newline="") as f:
-        writer = csv.writer(f)
-        if not file_exists:
-            writer.writerow(["question", "answer", "feedback", "comment"])
-        writer.writerow([data.question, data.answer, data.feedback, data.comment])
+    # Špatně hodnocenou odpověď už z cache nevracíme
+    if data.feedback == "down" and cache_odpovedi and data.question.strip():
+        embedding = await run_in_threadpool(zakoduj_dotaz, data.question)
+        smazano = await run_in_threadpool(cache_odpovedi.zneplatni, data.question, embedding, entity_dotazu(data.question))
+        if smazano:
+            print(f"🗑️ Z cache odpovědí odstraněno {smazano} záznamů po negativní zpětné vazbě")
 
     return JSONResponse(content={"status": "success"})
 
+# === Statistiky cache ===
+@app.get("/cache")
+def cache_stats(username: str = Depends(check_auth)):
+    return JSONResponse(content={
+        "index_verze": verze_indexu.aktualni(),
+        "dotazy": prijem_dotazu.statistiky(),
+        "cache": [cache_embeddingu.statistiky(), cache_vyhledavani.statistiky()]
+                 + ([cache_odpovedi.statistiky()] if cache_odpovedi else []),
+    })
+
 # === GET ===
 @app.get("/", response_class=HTMLResponse)
 def form_get(request: Request, username: str = Depends(check_auth)):
     return templates.TemplateResponse("index.html", {"request": request, "result": None})
 
-# === POST ===
-@app.post("/", response_class=HTMLResponse)
-def form_post(request: Request, dotaz: str = Form(...), username: str = Depends(check_auth)):
-    embedding = model.encode(f"query: {dotaz.strip()}").tolist()
-    results = collection.query(query_embeddings=[embedding], n_results=80, include=["documents", "metadatas"])
+# === Metodiky: citované dokumenty s ETagem, Range a verzovanou cache ===
+CITACE_VYTAHY = os.getenv("CITATION_PAGE_EXTRACTS", "1") == "1"   # citace vede na výtah strany, pokud ho prepare_db.py vytvořil
+CACHE_VERZOVANE = "private, max-age=31536000, immutable"          # URL s aktuální ?v= se s novou verzí souboru změní
+CACHE_BEZ_VERZE = "no-cache"                                      # jinak vždy ověřit ETagem (304 bez přenosu dat)
+
+def verzovany_odkaz(url: str, cesta: str) -> str:
+    return f"{url}?v={verze_souboru(os.stat(cesta))}"
+
+def odkazy_na_metodiku(filename: str, strana: int | None) -> tuple[str, str | None]:
+    """
+    (odkaz citace, odkaz na celý dokument, pokud citace vede jen na výtah strany).
+    Odkazy nesou verzi souboru, takže je prohlížeč i service worker mohou cachovat natrvalo.
+    """
+    url = f"/metodiky/{urllib.parse.quote(filename)}"
+    cesta = najdi_soubor(METODIKY_PATH, filename)
+    if cesta is None:
+        return url + (f"#page={strana}" if strana else ""), None
+    url = verzovany_odkaz(url, cesta)
+    if strana is None:
+        return url, None
+    cely = f"{url}#page={strana}"
+    vytah = najdi_soubor(VYTAHY_PATH, cesta_vytahu(filename, strana)) if CITACE_VYTAHY else None
+    if vytah is None:
+        return cely, None
+    return verzovany_odkaz(f"/metodiky/{urllib.parse.quote(filename)}/strana/{strana}", vytah), cely
+
+def posli_soubor(request: Request, cesta: str | None) -> Response:
+    """
+    Soubor s ETagem podle verze: If-None-Match → 304, Range a If-Range obslouží FileResponse (206).
+    Odkaz s aktuální ?v= se cachuje natrvalo, ostatní se při každém otevření ověří.
+    """
+    if cesta is None:
+        raise HTTPException(status_code=404, detail="Dokument nenalezen")
+    stat_result = os.stat(cesta)
+    verze = verze_souboru(stat_result)
+    hlavicky = {
+        "ETag": f'"{verze}"',
+        "Cache-Control": CACHE_VERZOVANE if request.query_params.get("v") == verze else CACHE_BEZ_VERZE,
+    }
+    if_none_match = [etag.strip().removeprefix("W/") for etag in request.headers.get("if-none-match", "").split(",")]
+    if hlavicky["ETag"] in if_none_match or "*" in if_none_match:
+        return Response(status_code=304, headers=hlavicky)
+    return FileResponse(cesta, headers=hlavicky, stat_result=stat_result)
+
+@app.api_route("/metodiky/{soubor}/strana/{strana}", methods=["GET", "HEAD"])
+def metodika_strana(request: Request, soubor: str, strana: int):
+    return posli_soubor(request, najdi_soubor(VYTAHY_PATH, cesta_vytahu(soubor, strana)))
+
+@app.api_route("/metodiky/{soubor:path}", methods=["GET", "HEAD"])
+def metodika(request: Request, soubor: str):
+    return posli_soubor(request, najdi_soubor(METODIKY_PATH, soubor))
+
+# === Service worker ===
+def nacti_service_worker() -> str:
+    """Skript s verzí podle obsahu app/static – změna statických souborů založí v prohlížeči novou cache."""
+    crc = 0
+    for nazev in sorted(os.listdir("app/static")):
+        if not os.path.isfile(os.path.join("app/static", nazev)):
+            continue
+        with open(os.path.join("app/static", nazev), "rb") as f:
+            crc = zlib.crc32(f.read(), zlib.crc32(nazev.encode(), crc))
+    with open("app/static/service-worker.js", "r", encoding="utf-8") as f:
+        return f.read().replace("__VERZE__", f"{crc:08x}")
+
+SERVICE_WORKER = nacti_service_worker()
+
+@app.get("/service-worker.js")
+def service_worker():
+    # Z kořene webu, aby rozsah workeru pokryl i /metodiky; prohlížeč si ho při každé návštěvě ověří
+    return Response(SERVICE_WORKER, media_type="application/javascript", headers={"Cache-Control": "no-cache"})
+
+# === Souběžné dotazy na OpenAI ===
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o")
+LLM_MODEL_MINI = os.getenv("LLM_MODEL_MINI", "gpt-4o-mini")       # levnější model pro jednoduché dotazy (router.py)
+LLM_MAX_SOUBEZNYCH = int(os.getenv("LLM_MAX_CONCURRENCY", "6"))   # max. současně běžících volání
+LLM_TIMEOUT_BANKY = float(os.getenv("LLM_BANK_TIMEOUT", "90"))    # sekundy na celou banku (výběr + odpověď)
+
+llm_semafor = asyncio.Semaphore(LLM_MAX_SOUBEZNYCH)
+# Pool spojení, limity RPM/TPM, opakování a jistič (llm_client.py); LLM_BACKEND=stub = bez sítě
+llm = vytvor_klienta()
+
+async def zavolej_llm(
+    messages, on_token=None, banka: str = "", etapa: str = "odpoved", model: str | None = None, **parametry
+) -> str:
+    """
+    Jedno volání chat completion. Pokud je zadán on_token, odpověď se streamuje
+    a každý přírůstek textu se předá do on_token (async callback).
+    Další parametry (např. response_format) jdou beze změny do API.
+    banka a etapa slouží jen jako štítky metrik (čekání ve frontě, doba volání, tokeny).
+    Bez model se použije LLM_MODEL.
+    """
+    model = model or LLM_MODEL
+    with mereni("llm_fronta", banka):
+        await llm_semafor.acquire()
+    try:
+        with mereni(etapa, banka):
+            try:
+                text, usage = await llm.vytvor(messages, model, on_token=on_token, **parametry)
+            except asyncio.CancelledError:
+                LLM_VOLANI.pricti(banka=banka, etapa=etapa, vysledek="zruseno")
+                raise
+            except LLMNedostupne:
+                LLM_VOLANI.pricti(banka=banka, etapa=etapa, vysledek="jistic")
+                raise
+            except Exception:
+                LLM_VOLANI.pricti(banka=banka, etapa=etapa, vysledek="chyba")
+                raise
+    finally:
+        llm_semafor.release()
+
+    LLM_VOLANI.pricti(banka=banka, etapa=etapa, vysledek="ok")
+    if usage is not None:
+        zaznamenej_tokeny(banka, etapa, usage.prompt_tokens, usage.completion_tokens, model)
+    return text
+
+async def odpovez_za_banku(dotaz: str, banka_nazev: str, banka_data: dict, on_token=None) -> str:
+    """
+    Výběr nejrelevantnějšího úryvku a odpověď pro jednu banku (prompty v rozpočtu tokenů, viz prompts.py).
+    Typ dotazu a model určil router v priprav_podklady; bez něj obecný prompt a LLM_MODEL.
+    """
+    typ, model = banka_data.get("typ"), banka_data.get("model")
+    if banka_data.get("prerankovano"):
+        # Lokální reranker už úryvky seřadil – výběr přes GPT odpadá
+        messages = prompt_odpoved(dotaz, banka_nazev, banka_data=banka_data, typ=typ)
+    else:
+        vybrany_chunk_a_citace = (
+            await zavolej_llm(prompt_vyber(dotaz, banka_data), banka=banka_nazev, etapa="vyber", model=model)
+        ).strip()
+        messages = prompt_odpoved(dotaz, banka_nazev, vybrany_uryvek=vybrany_chunk_a_citace, typ=typ)
+    return await zavolej_llm(messages, on_token=on_token, banka=banka_nazev, model=model)
+
+async def odpovez_za_banku_bezpecne(dotaz: str, banka_nazev: str, banka_data: dict, on_token=None):
+    """Jako odpovez_za_banku, ale s timeoutem; při chybě vrací None místo výjimky."""
+    try:
+        return await asyncio.wait_for(
+            odpovez_za_banku(dotaz, banka_nazev, banka_data, on_token=on_token),
+            timeout=LLM_TIMEOUT_BANKY
+        )
+    except asyncio.TimeoutError:
+        print(f"⏱️ Timeout odpovědi pro banku {banka_nazev}")
+    except Exception as e:
+        print(f"❌ Chyba odpovědi pro banku {banka_nazev}: {e}")
+    return None
+
+async def odpovez_za_banky(dotaz: str, banky_map: dict) -> list[dict]:
+    """
+    Spustí odpovědi pro všechny banky souběžně. Banka, která selže nebo nestihne
+    LLM_TIMEOUT_BANKY, se přeskočí – ostatní odpovědi se vrátí v pořadí banky_map
+    jako seznam {"banka", "markdown"}.
+    """
+    banky = [(nazev, data) for nazev, data in banky_map.items() if data["chunks"]]
+    vysledky = await asyncio.gather(*(odpovez_za_banku_bezpecne(dotaz, nazev, data) for nazev, data in banky))
+    return [
+        {"banka": nazev, "markdown": odpoved}
+        for (nazev, _), odpoved in zip(banky, vysledky) if odpoved
+    ]
+
+# === Jedno volání pro všechny banky (strukturovaný JSON) ===
+ANSWER_MODE = os.getenv("ANSWER_MODE", "banky")   # "banky" = volání pro každou banku, "jeden" = jedno JSON volání
+
+async def odpovez_jednim_volanim(dotaz: str, banky_map: dict):
+    """
+    Úryvky všech bank v jednom promptu, odpověď jako JSON validovaný přes pydantic.
+    Vrací seznam {"banka", "markdown", "strukturovana"} v pořadí banky_map, při chybě None.
+    """
+    banky = [nazev for nazev, data in banky_map.items() if data["chunks"]]
+    messages = prompt_json(dotaz, [(nazev, banky_map[nazev]) for nazev in banky])
+    model = banky_map[banky[0]].get("model") if banky else None
+    try:
+        text = await asyncio.wait_for(
+            zavolej_llm(
+                messages, banka="vse", etapa="odpoved_json", model=model, response_format={"type": "json_object"}
+            ),
+            timeout=LLM_TIMEOUT_BANKY
+        )
+        odpovedi = rozloz_odpoved_json(text)
+    except asyncio.TimeoutError:
+        print("⏱️ Timeout strukturované odpovědi")
+        return None
+    except Exception as e:
+        print(f"❌ Chyba strukturované odpovědi: {e}")
+        return None
+    poradi = {nazev: i for i, nazev in enumerate(banky)}
+    return sorted(odpovedi, key=lambda o: poradi.get(normalizuj_nazev_banky(o["banka"]), len(banky)))
+
+async def odpovez(dotaz: str, banky_map: dict) -> list[dict]:
+    """Odpovědi podle ANSWER_MODE; když jedno JSON volání selže, použije se volání po bankách."""
+    if ANSWER_MODE == "jeden":
+        odpovedi = await odpovez_jednim_volanim(dotaz, banky_map)
+        if odpovedi is not None:
+            return odpovedi
+    return await odpovez_za_banky(dotaz, banky_map)
+
+def vyrenderuj_odpoved(odpoved_markdown: str) -> str:
+    """Agregace bloků bank, prolinkování citací a převod Markdown → HTML."""
+    with mereni("agregace"):
+        agregovano = agreguj_banky_v_odpovedi(odpoved_markdown)
+    with mereni("render"):
+        return markdown.markdown(highlight_citations(agregovano))
+
+def vyrenderuj_odpovedi(odpovedi: list[dict]) -> str:
+    """HTML celé odpovědi; strukturované bloky jsou už sloučené, takže regexová agregace odpadá."""
+    if odpovedi and all(o.get("strukturovana") for o in odpovedi):
+        with mereni("render"):
+            return "\n".join(markdown.markdown(highlight_citations(o["markdown"])) for o in odpovedi)
+    return vyrenderuj_odpoved("\n\n".join(o["markdown"] for o in odpovedi))
+
+# === Vyhledání chunků ===
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "banky")            # "banky" = top-k pro každou banku, "globalni" = top-N přes vše
+RETRIEVAL_N_RESULTS = int(os.getenv("RETRIEVAL_N_RESULTS", "80"))   # pro globální režim
+RETRIEVAL_K_NA_BANKU = int(os.getenv("RETRIEVAL_K_NA_BANKU", "6"))  # pro režim po bankách
+
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"              # BM25 z invertovaného indexu + RRF
+BM25_PATH = os.path.join(CHROMA_PATH, "bm25_hypoteky_all.sqlite")
+
+CHROMA_WORKERS = int(os.getenv("CHROMA_WORKERS", "8"))
+chroma_executor = ThreadPoolExecutor(max_workers=CHROMA_WORKERS, thread_name_prefix="chroma")
+# Invertovaný index vytváří prepare_db.py; bez něj se hledá jen vektorově
+invertovany_index = InvertovanyIndex(BM25_PATH) if HYBRID_SEARCH and os.path.isfile(BM25_PATH) else None
+
+# === Vektorové úložiště: ChromaDB, nebo mmapovaná NumPy matice exportovaná z prepare_db.py ===
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")   # "chroma" nebo "numpy"
+NUMPY_STORE_PATH = os.path.join(CHROMA_PATH, "numpy_hypoteky_all")
+
+chroma_uloziste = ChromaUloziste(ziskej_kolekci, chroma_executor)
+_numpy_uloziste = None
+_numpy_verze_pokusu = None
+_uloziste_lock = threading.Lock()
+
+def ziskej_uloziste():
+    """Aktivní backend; NumPy export se po přeindexování (nová verze v manifestu) načte znovu."""
+    global _numpy_uloziste, _numpy_verze_pokusu
+    if VECTOR_BACKEND != "numpy":
+        return chroma_uloziste
+    verze = verze_indexu.aktualni()
+    with _uloziste_lock:
+        # Načítáme jednou pro každou verzi indexu, i když se načtení nepovede
+        if _numpy_verze_pokusu != verze:
+            _numpy_verze_pokusu = verze
+            try:
+                _numpy_uloziste = NumpyUloziste(NUMPY_STORE_PATH)
+                print(f"✅ NumPy úložiště načteno ({len(_numpy_uloziste)} chunků, {_numpy_uloziste.dtype}, verze {_numpy_uloziste.verze})")
+                if _numpy_uloziste.verze != verze:
+                    print(f"⚠️ NumPy export má verzi {_numpy_uloziste.verze}, index {verze} – spusťte prepare_db.py")
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️ NumPy úložiště nelze načíst ({e})")
+        if _numpy_uloziste is None:
+            return chroma_uloziste
+        return _numpy_uloziste
+
+# === Přímé odpovědi z tabulkových seznamů (rizikoví zaměstnavatelé, rizikové země, odhadci, produkty) ===
+TABLE_LOOKUP = os.getenv("TABLE_LOOKUP", "1") == "1"
+TABULKY_PATH = os.path.join(CHROMA_PATH, "tabulky_hypoteky_all.sqlite")
+# Tabulky plní prepare_db.py; bez nich jdou i tyto dotazy přes RAG
+tabulkovy_index = TabulkovyIndex(TABULKY_PATH) if TABLE_LOOKUP and os.path.isfile(TABULKY_PATH) else None
+TABULKOVE_ZASAHY = registr.citac(
+    "gepard_tabulky_zasahy_total", "Dotazy s nálezem v tabulkách: přímá odpověď, nebo podklad pro RAG", ("pouziti",)
+)
+
+def odpovez_tabulkou(dotaz: str) -> list[dict] | None:
+    """
+    Přímá odpověď z tabulek jen na čistý dotaz na seznam bez jmenované banky, jinak None
+    (dotaz jde přes RAG a nalezené řádky doplní dopln_z_tabulek). Jde o indexový lookup v SQLite.
+    """
+    if tabulkovy_index is None:
+        return None
+    with mereni("tabulky"):
+        odpovedi = odpovez_z_tabulek(tabulkovy_index, dotaz, normalizuj_nazev_banky, najdi_banky_v_dotazu(dotaz))
+    if odpovedi is not None:
+        TABULKOVE_ZASAHY.pricti(pouziti="odpoved")
+    return odpovedi
+
+def dopln_z_tabulek(dotaz: str, banky_map: dict):
+    """
+    Řádky tabulek zmíněné v dotazu (riziková země, zaměstnavatel…) přidá na začátek úryvků své banky,
+    aby je LLM vzal v úvahu spolu s metodikou. Banky mimo výsledky vyhledávání se přidají, jen pokud
+    dotaz banky nejmenuje, nebo jmenuje i tuto.
+    """
+    if tabulkovy_index is None:
+        return
+    with mereni("tabulky"):
+        podklady = podklady_z_tabulek(tabulkovy_index, dotaz)
+    zminene = najdi_banky_v_dotazu(dotaz)
+    for podklad in reversed(podklady):
+        banka_nazev = normalizuj_nazev_banky(podklad["banka"])
+        if banka_nazev not in banky_map:
+            if zminene and banka_nazev not in zminene:
+                continue
+            banky_map[banka_nazev] = {"chunks": [], "citace": [], "metadata": []}
+        data = banky_map[banka_nazev]
+        data["chunks"].insert(0, podklad["text"])
+        data["citace"].insert(0, podklad["citace"])
+        data["metadata"].insert(0, podklad["metadata"])
+    if podklady:
+        TABULKOVE_ZASAHY.pricti(pouziti="podklad")
+
+# === Platnost vydání (prepare_db.py, verze_dokumentu.py) ===
+VALIDITY_FILTER = os.getenv("VALIDITY_FILTER", "1") == "1"   # hledat jen ve vydáních platných dnes
+
+def k_datu_vyhledavani(as_of: int | None = None) -> int | None:
+    """Datum RRRRMMDD, ke kterému se filtrují vydání; None = bez filtru (vypnuto, nebo index bez platností)."""
+    if verze_indexu.manifest().get("verze_platnosti") != VERZE_PLATNOSTI:
+        return None
+    if as_of is not None:
+        return as_of
+    return dnes() if VALIDITY_FILTER else None
+
+def over_as_of(as_of: str) -> int | None:
+    """Volitelné datum z formuláře (RRRR-MM-DD nebo D. M. RRRR); neplatné → 400."""
+    if not as_of.strip():
+        return None
+    try:
+        return parsuj_datum(as_of)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def banky_v_indexu() -> list[str]:
+    """Hodnoty metadat "banka", které jsou v indexu (podle manifestu z prepare_db.py)."""
+    soubory = verze_indexu.manifest().get("soubory", {})
+    return sorted({z["banka"] for z in soubory.values() if z.get("banka") and z.get("pocet_chunku")})
+
+def dopln_dokumenty(ids: list[str], zname: dict) -> list[tuple]:
+    """(chunk, metadata) pro zadaná ID; co nevrátilo vektorové hledání, dotáhne jedním čtením z úložiště."""
+    chybi = [chunk_id for chunk_id in ids if chunk_id not in zname]
+    if chybi:
+        with mereni("vektory"):
+            doplnene = ziskej_uloziste().nacti(chybi)
+        for chunk_id, chunk, meta in doplnene:
+            zname[chunk_id] = (chunk, meta)
+    return [zname[chunk_id] for chunk_id in ids if chunk_id in zname]
+
+def platne_soubory_k_datu(k_datu: int | None) -> set | None:
+    if k_datu is None:
+        return None
+    return platne_soubory(verze_indexu.manifest().get("soubory", {}), k_datu)
+
+def vyhledej_globalne(embedding, dotaz: str, k_datu: int | None = None) -> list[tuple]:
+    with mereni("vektory"):
+        vysledky = ziskej_uloziste().hledej(embedding, RETRIEVAL_N_RESULTS, k_datu=k_datu)
+    ids = [chunk_id for chunk_id, _, _, _ in vysledky]
+    zname = {chunk_id: (chunk, meta) for chunk_id, chunk, meta, _ in vysledky}
+    if invertovany_index:
+        with mereni("bm25"):
+            bm25 = sorted(
+                invertovany_index.hledej(dotaz, platne_soubory_k_datu(k_datu)).items(), key=lambda polozka: -polozka[1][0]
+            )
+        ids = reciprocal_rank_fusion(ids, [chunk_id for chunk_id, _ in bm25[:RETRIEVAL_N_RESULTS]])[:RETRIEVAL_N_RESULTS]
+    return dopln_dokumenty(ids, zname)
+
+def vyhledej_po_bankach(
+    embedding, banky: list[str], dotaz: str, k_datu: int | None = None,
+    k_na_banku: int = RETRIEVAL_K_NA_BANKU, max_bank: int | None = None,
+) -> list[tuple]:
+    """
+    Top-k pro každou banku zvlášť, aby velké dokumenty nevytlačily malé banky.
+    S invertovaným indexem se vektorové a BM25 pořadí slučují přes RRF.
+    Nahrazená vydání (mimo platnost k datu) se vynechají už ve vyhledávání.
+    max_bank ponechá jen banky s nejlepšími zásahy (každá banka = jedno volání LLM).
+    """
+    k_kandidatu = k_na_banku * 2 if invertovany_index else k_na_banku
+
+    with mereni("bm25"):
+        bm25 = (
+            invertovany_index.hledej_po_bankach(dotaz, k_kandidatu, platne_soubory_k_datu(k_datu))
+            if invertovany_index else {}
+        )
+    with mereni("vektory"):
+        po_bankach = [
+            (banka, vysledky)
+            for banka, vysledky in ziskej_uloziste().hledej_po_bankach(embedding, banky, k_kandidatu, k_datu).items()
+            if vysledky
+        ]
+    # Banky seřadíme podle nejlepšího zásahu – pořadí je deterministické a relevantní banky jdou první
+    po_bankach.sort(key=lambda polozka: polozka[1][0][3])
+    if max_bank:
+        po_bankach = po_bankach[:max_bank]
+
+    zname, poradi = {}, []
+    for banka, vysledky in po_bankach:
+        vektorove = [chunk_id for chunk_id, _, _, _ in vysledky]
+        zname.update({chunk_id: (chunk, meta) for chunk_id, chunk, meta, _ in vysledky})
+        poradi.extend(reciprocal_rank_fusion(vektorove, bm25.get(banka, []))[:k_na_banku])
+    return dopln_dokumenty(poradi, zname)
+
+# === Směrování podle typu dotazu (router.py) ===
+QUERY_ROUTER = os.getenv("QUERY_ROUTER", "1") == "1"   # "0" = všechny dotazy stejnou cestou (obecný prompt, LLM_MODEL)
 
-    # Krok 2: příprava chunků a metadat
-    relevant_chunks = results["documents"][0]
-    metadatas = results["metadatas"][0]
+router = (
+    Router(lambda texty: spust_vypocet(enkoder.encode, [f"query: {t}" for t in texty]))
+    if QUERY_ROUTER and os.path.isfile(PRIKLADY_PATH) else None
+)
+SMEROVANE_DOTAZY = registr.citac(
+    "gepard_router_dotazy_total", "Dotazy podle typu z routeru a zvoleného modelu", ("typ", "model")
+)
 
-    for i, meta in enumerate(metadatas[:3]):
-        print(f"Metadata {i}: {meta}")
+def nasmeruj_dotaz(dotaz: str) -> dict | None:
+    """Typ dotazu a parametry pipeline (hloubka, počet bank, model), nebo None bez routeru."""
+    if router is None:
+        return None
+    embedding = zakoduj_dotaz(dotaz)
+    with mereni("router"):
+        smer = router.nasmeruj(dotaz, embedding, najdi_banky_v_dotazu(dotaz))
+    SMEROVANE_DOTAZY.pricti(typ=smer["typ"] or "nejisty", model=smer["model"])
+    zaznamenej_vlastnosti(typ=smer["typ"] or "nejisty", jistota=smer["jistota"], model=smer["model"])
+    return smer
+
+def vyhledej_vysledky(dotaz: str, as_of: int | None = None, smer: dict | None = None) -> list[tuple]:
+    """
+    Seznam (chunk, metadata) v pořadí, v jakém se mají zpracovat (jen vydání platná k as_of, výchozí dnes).
+    Hloubku vyhledávání a počet bank může upravit router (smer).
+    """
+    smer = smer or {}
+    embedding = zakoduj_dotaz(dotaz)
+    k_datu = k_datu_vyhledavani(as_of)
+    banky = banky_v_indexu()
+    if RETRIEVAL_MODE != "banky" or not banky:
+        return vyhledej_globalne(embedding, dotaz, k_datu)
+
+    # Pokud dotaz jmenuje konkrétní banku, hledáme jen v jejích dokumentech
+    zminene = najdi_banky_v_dotazu(dotaz)
+    if zminene:
+        vybrane = [b for b in banky if normalizuj_nazev_banky(b) in zminene]
+        if vybrane:
+            banky = vybrane
+    return vyhledej_po_bankach(
+        embedding, banky, dotaz, k_datu,
+        k_na_banku=smer.get("k_na_banku") or RETRIEVAL_K_NA_BANKU, max_bank=smer.get("max_bank"),
+    )
+
+def vyhledej_chunky(dotaz: str, as_of: int | None = None, smer: dict | None = None) -> dict:
+    """Embedding dotazu + dotaz do ChromaDB, chunky seskupené podle banky."""
+    k_datu = k_datu_vyhledavani(as_of)
+    klic = (verze_indexu.aktualni(), k_datu, (smer or {}).get("typ"), normalizuj_dotaz(dotaz))
+    vysledky = cache_vyhledavani.ziskej(klic, lambda: vyhledej_vysledky(dotaz, k_datu, smer))
 
     # === Agregace chunků podle banky (už žádné duplicity) ===
     banky_map = {}
-    for chunk, meta in zip(relevant_chunks, metadatas):
+    for chunk, meta in vysledky:
         banka_raw = meta.get("banka", "Neznámá banka")
         banka_nazev = normalizuj_nazev_banky(banka_raw)
         if banka_nazev not in banky_map:
             banky_map[banka_nazev] = {
                 "chunks": [],
-                "citace": []
+                "citace": [],
+                "metadata": []
             }
         banky_map[banka_nazev]["chunks"].append(chunk)
-        banky_map[banka_nazev]["citace"].append(
-            f"(dokument: {meta.get('document_source', '?')}, strana: {meta.get('strana', '?')}, kapitola: {meta.get('kapitola', '?')})"
-        )
+        banky_map[banka_nazev]["metadata"].append(meta)
+        banky_map[banka_nazev]["citace"].append(citace_z_metadat(meta))
+    return banky_map
 
-    # === Odpovědi pro každou banku právě jednou ===
-    pridane_banky = set()
-    odpovedi_po_bankach = []
+# === Rerank kandidátních chunků ===
+RERANK_MODE = os.getenv("RERANK_MODE", "cross")      # "cross", "bi" nebo "gpt" (původní výběr úryvku přes GPT)
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "3"))   # kolik úryvků na banku jde do promptu
 
-    for banka_nazev, banka_data in banky_map.items():
-        chunks_banky = banka_data["chunks"]
-        citace_banky = banka_data["citace"]
+reranker = vytvor_reranker(RERANK_MODE, RERANK_MODEL, enkoder)
 
-        if not chunks_banky:
-            continue
+def priprav_podklady(dotaz: str, as_of: int | None = None) -> dict:
+    """
+    Směrování, vyhledání chunků a (pokud je zapnutý) lokální rerank – vše blokující, volá se mimo event loop.
+    Typ dotazu a model z routeru dostane každá banka v banky_map ("typ", "model").
+    """
+    smer = nasmeruj_dotaz(dotaz)
+    banky_map = vyhledej_chunky(dotaz, as_of, smer)
+    if reranker and banky_map:
+        with mereni("rerank"):
+            spust_vypocet(preranguj_banky, reranker, dotaz, banky_map, RERANK_TOP_N)
+    # Až po reranku – řádek tabulky je krátký a reranker by ho mezi úryvky metodik odsunul
+    dopln_z_tabulek(dotaz, banky_map)
+    if smer:
+        model = LLM_MODEL_MINI if smer["model"] == "mini" else LLM_MODEL
+        for data in banky_map.values():
+            data["typ"], data["model"] = smer["typ"], model
+    return banky_map
 
-        # GPT prompt pro výběr nejrelevantnějšího chunku
-        select_prompt = [
-            {
-                "role": "system",
-                "content": (
-                    "Jsi asistent pro výběr nejrelevantnějšího úryvku textu k danému dotazu. "
-                    "Dostaneš dotaz a několik úryvků s citacemi. Vyber jen ten jeden úryvek, "
-                    "který je pro zodpovězení dotazu nejrelevantnější. Pokud je to možné, upřednostni chunk, "
-                    "který obsahuje nejvíce konkrétních informací k dotazu. V odpovědi vypiš přesně vybraný úryvek "
-                    "a jeho citaci ve formátu: <chunk>\nUmístění: <citace>."
-                )
-            },
-            {
-                "role": "user",
-                "content":
-                    f"Dotaz: {dotaz}\n\nÚryvky:\n\n" +
-                    "\n\n".join([f"{chunk}\nUmístění: {cit}" for chunk, cit in zip(chunks_banky, citace_banky)])
-            }
-        ]
+# === Warm-up a připravenost ===
+EMBED_WARMUP = os.getenv("EMBED_WARMUP", "1") == "1"   # "0" = vše se načte až s prvním dotazem
+WARMUP_MAX_PAUZA_S = float(os.getenv("WARMUP_MAX_BACKOFF", "60"))   # strop prodlevy mezi pokusy o warm-up
+pripraveno = threading.Event()
 
-        select_response = openai.chat.completions.create(
-            model="gpt-4o",
-            messages=select_prompt,
-            temperature=0
-        )
-        vybrany_chunk_a_citace = select_response.choices[0].message.content.strip()
-
-        # Hlavní prompt pro banku (zůstává stejný)
-        messages = [
-            {
-                "role": "system",
-                "content": (
-                    "Jsi expertní asistent na hypotéky a posuzování bonity klientů podle interních metodik bank.\n\n"
-                        "🔍 Nejprve zjisti, co je vstupem uživatele:\n"
-                        "1. Pokud jde o plnohodnotný dotaz, klasifikuj ho interně do jedné z těchto kategorií:\n"
-                        "   - výčtový\n"
-                        "   - Dotazy typu „které banky…“ vždy považuj za výčtové bez ohledu na další strukturu dotazu.\n"
-                        "   - srovnávací\n"
-                        "   - faktický\n"
-                        "   - podmínkový\n"
-                        "   - kombinovaný\n"
-                        "2. Pokud vstup není úplným dotazem (např. jen fragment jako „výživné jako příjem žadatele“), logicky odvoď, co uživatel pravděpodobně zjišťuje, a pokračuj podle odpovídající logiky.\n"
-                        "3. Pokud dotaz neobsahuje název konkrétní banky, agreguj odpovědi napříč všemi dostupnými dokumenty. Nikdy se nespokojuj pouze s jedním úryvkem nebo jednou bankou.\n"
-                        "4. Pokud dotaz obsahuje konkrétní banku, pracuj primárně s dokumenty této banky. Ostatní dokumenty zvaž pouze tehdy, pokud je tato banka výslovně zmíněna jinde nebo pokud vlastní dokument chybí.\n\n"
-                        "🧩 Instrukce podle typu dotazu:\n"
-                        "- Výčtový: Vypiš každou banku, která podmínku splňuje. Každou zvlášť se stručným shrnutím a citací.\n"
-                        "  ➕ Pokud máš chunk pro danou banku, ale nenacházíš v něm přímou zmínku k dotazu, zvaž možnost odpovědi založené na kombinaci dotazu a názvu banky. Shrň i nepřímé nebo kontextové informace, pokud jsou v chuncích uvedeny.\n"
-                        "  ➕ Pokud dotaz směřuje na to, **které banky něco umožňují, akceptují, podporují, tolerují nebo zohledňují**, vždy jej považuj za výčtový – i když se zdá být podmínkový nebo faktický.\n"
-                        "- Srovnávací: Porovnej hodnoty napříč bankami a uveď pouze tu nejlepší (nebo několik s nejvyšší hodnotou).\n"
-                        "- Faktický: Odpověz přesně a s citací. Pokud informace chybí, napiš to jasně.\n"
-                        "- Podmínkový: Popiš okolnosti, za kterých situace nastává. Přidej citace.\n"
-                        "  ➕ Pokud dotaz obsahuje podmínku („pokud...“, „za jakých podmínek...“), ale cílí na více subjektů (např. „které banky“), nejprve vyfiltruj všechny relevantní banky jako ve výčtovém dotazu a pak u každé z nich uveď podmínky.\n"
-                        "- Kombinovaný: Vyfiltruj banky splňující podmínku a mezi nimi srovnej výhodnost. Výsledek uveď jen pro ty nejlepší.\n\n"
-                        "🛑 Pravidla přesnosti:\n"
-                        "- Vycházej výhradně z úryvků z dokumentů v databázi (ChromaDB).\n"
-                        "- Nevymýšlej informace. Nepoužívej web ani obecné znalosti.\n"
-                        "- Nepřiřazuj informace k bankám, které je výslovně neuvádějí.\n"
-                        "- V odpovědi používej názvy bank přesně dle dokumentů:\n"
-                        "  • Hypoteky_KB.pdf → Komerční banka\n"
-                        "  • Hypoteky_mB.pdf → mBank\n"
-                        "  • Hypoteky_CS.pdf → Česká spořitelna\n"
-                        "  • Hypoteky_ČSOBHB.pdf → ČSOB Hypoteční banka\n"
-                        "  • Hypoteky_UCB.pdf → UniCredit Bank\n"
-                        "  • Hypoteky_OB.pdf → Oberbank AG\n"
-                        "  • Hypoteky_RB_bonita_podnikani.pdf → Raiffeisenbank\n\n"
-                        "♻️ Zaměnitelné výrazy:\n"
-                        "- „americká hypotéka“ = „neúčelový hypoteční úvěr“ = „neúčelová hypotéka“ = „neúčelová část hypotečního úvěru“\n"
-                        "- „účelová hypotéka“ není totéž jako „americká hypotéka“. Nezaměňuj tyto pojmy.\n"
-                        "  Pokud je v dotazu zmíněna americká hypotéka, ignoruj informace o účelových hypotékách.\n\n"
-                        "📋 Struktura odpovědi:\n"
-                        "- Použij přehledný formát ve stylu Markdown:\n"
-                        "  • Každou banku začni nadpisem třetí úrovně: ### 🏦 [Název banky]\n"
-                        "  • Každou část označ tučně: **Podmínky:**, **Výpočet:**, **Doložení:** apod.\n"
-                        "  • Podmínky a detaily strukturovaně ve formě odrážek: - ...\n"
-                        "  • Pokud existuje více oblastí, rozděl je logicky a vizuálně\n"
-                        "  • Na konec každého bloku přidej citaci: 📄 Citace: (dokument: <název>, strana: <číslo>, kapitola: <číslo>)\n\n"
-                        "🧠 Poznámka:\n"
-                        "- Interní úvahy (např. „Dotaz je výčtový“) nezobrazuj uživateli.\n"
-                        "- Odpověď začni rovnou užitečnou informací.\n"
-                        "  Například místo:\n"
-                        "  „Dotaz je výčtový. Uživatel se ptá, které banky akceptují výživné...“\n"
-                        "  napiš přímo:\n"
-                        "  „Banky, které akceptují výživné jako příjem žadatele:“\n"
-                )
-            },
-            {
-                "role": "user",
-                "content": f"Dotaz: {dotaz}\n\nZde je nejrelevantnější úryvek pro banku {banka_nazev}:\n\n{vybrany_chunk_a_citace}"
-            }
-        ]
+def zahrej():
+    """
+    Načte Chromu, enkodér a reranker a jednou je prožene, aby první dotaz neplatil inicializaci.
+    Při chybě (nedostupný disk, model se ještě stahuje…) se zkouší znovu s rostoucí prodlevou,
+    jinak by /ready vracel 503 až do restartu.
+    """
+    pauza = 1.0
+    while True:
+        try:
+            ziskej_uloziste() if VECTOR_BACKEND == "numpy" else ziskej_kolekci()
+            enkoder.encode("query: zahřátí modelu")
+            if reranker:
+                reranker.skoruj("zahřátí", ["zahřátí modelu"])
+            if router:
+                router.klasifikuj("zahřátí", enkoder.encode("query: zahřátí modelu"))
+            pripraveno.set()
+            print("✅ Warm-up dokončen")
+            return
+        except Exception as e:
+            print(f"❌ Warm-up selhal: {e}, další pokus za {pauza:.0f} s")
+            time.sleep(pauza)
+            pauza = min(pauza * 2, WARMUP_MAX_PAUZA_S)
+
+@app.on_event("startup")
+async def startup():
+    if EMBED_WARMUP:
+        # Ve vlákně – server mezitím odpovídá na /ready (503), takže balancer ví, že ještě nemá posílat dotazy
+        threading.Thread(target=zahrej, daemon=True).start()
+    else:
+        pripraveno.set()
+
+@app.get("/ready")
+def ready():
+    if not pripraveno.is_set():
+        return JSONResponse(content={"pripraveno": False}, status_code=503)
+    return JSONResponse(content={"pripraveno": True, "enkoder": enkoder.popis(), "llm": llm.popis()})
 
-        response = openai.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            temperature=0
+# === Omezení počtu souběžných dotazů ===
+MAX_SOUBEZNYCH_DOTAZU = int(os.getenv("MAX_CONCURRENT_REQUESTS", "24"))
+RETRY_AFTER_S = os.getenv("BUSY_RETRY_AFTER", "5")
+ZPRAVA_OBSAZENO = "Asistent je právě vytížený. Zkuste to prosím za pár vteřin znovu."
+
+class PrijemDotazu:
+    """
+    Admission control: nejvýše `limit` rozpracovaných dotazů, další dostanou hned 503
+    místo čekání v neomezené frontě. Běží jen v event loopu, takže nepotřebuje zámek.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.aktivni = 0
+        self.odmitnuto = 0
+
+    def prijmi(self):
+        """Vrátí funkci pro uvolnění místa (lze volat opakovaně), nebo None, pokud je plno."""
+        if self.aktivni >= self.limit:
+            self.odmitnuto += 1
+            return None
+        self.aktivni += 1
+        uvolneno = False
+
+        def uvolni():
+            nonlocal uvolneno
+            if not uvolneno:
+                uvolneno = True
+                self.aktivni -= 1
+        return uvolni
+
+    def statistiky(self) -> dict:
+        return {"aktivni": self.aktivni, "limit": self.limit, "odmitnuto": self.odmitnuto}
+
+prijem_dotazu = PrijemDotazu(MAX_SOUBEZNYCH_DOTAZU)
+
+# === Metriky a trasování ===
+DEBUG_HLAVICKY = os.getenv("DEBUG_HEADERS", "1") == "1"   # Server-Timing, X-Debug-Tokens/-Trace a SSE událost "metriky"
+ODMITNUTE_DOTAZY = registr.citac(
+    "gepard_odmitnute_dotazy_total", "Dotazy odmítnuté kvůli limitu souběžnosti", ("endpoint",)
+)
+
+@app.get("/metrics")
+def metrics(username: str = Depends(check_auth)):
+    return PlainTextResponse(registr.export(), media_type="text/plain; version=0.0.4")
+
+# === POST ===
+@app.post("/", response_class=HTMLResponse)
+async def form_post(
+    request: Request, dotaz: str = Form(...), as_of: str = Form(""), username: str = Depends(check_auth)
+):
+    k_datu = over_as_of(as_of)
+    trasa = zacni_trasu()
+    # Dotaz na tabulkový seznam je otázka milisekund – odpovíme hned, bez místa v limitu souběžnosti
+    odpovedi_po_bankach = await run_in_threadpool(odpovez_tabulkou, dotaz)
+    if odpovedi_po_bankach is not None:
+        return vyrenderuj_stranku(request, dotaz, odpovedi_po_bankach, trasa, as_of)
+
+    uvolni = prijem_dotazu.prijmi()
+    if uvolni is None:
+        ODMITNUTE_DOTAZY.pricti(endpoint="/")
+        return templates.TemplateResponse(
+            "index.html",
+            {"request": request, "result": f"<p>⏳ {ZPRAVA_OBSAZENO}</p>", "dotaz": dotaz, "as_of": as_of},
+            status_code=503,
+            headers={"Retry-After": RETRY_AFTER_S},
         )
-        if banka_nazev in pridane_banky:
+    try:
+        # Embedding a ChromaDB jsou blokující – poběží mimo event loop
+        # Dotaz k jinému datu jde mimo cache odpovědí – ta drží odpovědi podle dnes platných vydání
+        odpovedi_po_bankach = None
+        if k_datu is None:
+            embedding, verze, odpovedi_po_bankach = await run_in_threadpool(najdi_odpoved_v_cache, dotaz)
+
+        if odpovedi_po_bankach is None:
+            banky_map = await run_in_threadpool(priprav_podklady, dotaz, k_datu)
+
+            # === Odpovědi pro každou banku právě jednou (souběžně, nebo jedním JSON voláním) ===
+            odpovedi_po_bankach = await odpovez(dotaz, banky_map)
+            if k_datu is None:
+                await run_in_threadpool(uloz_odpoved_do_cache, dotaz, embedding, verze, banky_map, odpovedi_po_bankach)
+    finally:
+        uvolni()
+
+    return vyrenderuj_stranku(request, dotaz, odpovedi_po_bankach, trasa, as_of)
+
+def vyrenderuj_stranku(request: Request, dotaz: str, odpovedi_po_bankach: list[dict], trasa, as_of: str = ""):
+    # Krok 5: Vytvoř HTML výstup (agregace bloků + citace)
+    odpoved_html = vyrenderuj_odpovedi(odpovedi_po_bankach)
+
+    response = templates.TemplateResponse(
+        "index.html", {"request": request, "result": odpoved_html, "dotaz": dotaz, "as_of": as_of}
+    )
+    DOBA_POZADAVKU.zaznamenej(time.perf_counter() - trasa.start, endpoint="/")
+    if DEBUG_HLAVICKY:
+        response.headers.update(trasa.hlavicky())
+    return response
+
+# === POST se streamováním (SSE) ===
+def sse_udalost(udalost: str, data: dict) -> str:
+    return f"event: {udalost}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def streamuj_odpoved_s_limitem(dotaz: str, uvolni, k_datu: int | None = None):
+    # Hlavičky odešly dřív, než práce začala – souhrn trasy jde na konec jako událost "metriky"
+    trasa = zacni_trasu()
+    try:
+        async for udalost in streamuj_odpoved(dotaz, k_datu):
+            yield udalost
+        if DEBUG_HLAVICKY:
+            yield sse_udalost("metriky", trasa.souhrn())
+    finally:
+        uvolni()
+        DOBA_POZADAVKU.zaznamenej(time.perf_counter() - trasa.start, endpoint="/stream")
+
+def streamuj_hotove(odpovedi: list[dict]):
+    """SSE události pro odpověď, která je už celá k dispozici (cache, tabulky)."""
+    yield sse_udalost("banky", {"banky": [o["banka"] for o in odpovedi]})
+    for idx, odpoved in enumerate(odpovedi):
+        yield sse_udalost("banka", {"id": idx, "html": vyrenderuj_odpovedi([odpoved])})
+    yield sse_udalost("hotovo", {"html": vyrenderuj_odpovedi(odpovedi)})
+
+async def streamuj_odpoved(dotaz: str, k_datu: int | None = None):
+    """
+    Generátor SSE událostí:
+      banky  – seznam bank v pořadí, v jakém budou zobrazeny
+      token  – přírůstek textu odpovědi dané banky
+      banka  – hotový blok banky jako HTML (prázdné = banka selhala)
+      hotovo – finální agregovaná odpověď (stejná jako z form_post)
+    Dotaz k zadanému datu (k_datu) cache odpovědí nečte ani neplní.
+    """
+    pouzij_cache = k_datu is None
+    if pouzij_cache:
+        embedding, verze, z_cache = await run_in_threadpool(najdi_odpoved_v_cache, dotaz)
+        if z_cache is not None:
+            for udalost in streamuj_hotove(z_cache):
+                yield udalost
+            return
+
+    banky_map = await run_in_threadpool(priprav_podklady, dotaz, k_datu)
+    banky = [nazev for nazev, data in banky_map.items() if data["chunks"]]
+    yield sse_udalost("banky", {"banky": banky})
+
+    if ANSWER_MODE == "jeden":
+        # JSON se nedá vykreslovat po tokenech – bloky bank pošleme najednou po dokončení volání
+        odpovedi = await odpovez(dotaz, banky_map)
+        po_bankach = {normalizuj_nazev_banky(o["banka"]): o for o in odpovedi}
+        for idx, nazev in enumerate(banky):
+            odpoved = po_bankach.get(nazev)
+            yield sse_udalost("banka", {"id": idx, "html": vyrenderuj_odpovedi([odpoved]) if odpoved else ""})
+        yield sse_udalost("hotovo", {"html": vyrenderuj_odpovedi(odpovedi)})
+        if pouzij_cache:
+            await run_in_threadpool(uloz_odpoved_do_cache, dotaz, embedding, verze, banky_map, odpovedi)
+        return
+
+    fronta = asyncio.Queue()
+
+    async def zpracuj_banku(idx: int, banka_nazev: str):
+        async def on_token(text):
+            await fronta.put(("token", {"id": idx, "text": text}))
+        odpoved = await odpovez_za_banku_bezpecne(dotaz, banka_nazev, banky_map[banka_nazev], on_token=on_token)
+        await fronta.put(("banka", {"id": idx, "markdown": odpoved}))
+
+    ulohy = [asyncio.create_task(zpracuj_banku(idx, nazev)) for idx, nazev in enumerate(banky)]
+    odpovedi = [None] * len(banky)
+    try:
+        hotove = 0
+        while hotove < len(ulohy):
+            udalost, data = await fronta.get()
+            if udalost == "token":
+                yield sse_udalost("token", data)
                 continue
-        
-        odpovedi_po_bankach.append(response.choices[0].message.content)
-        pridane_banky.add(banka_nazev)
-        
-    # Krok 5: Vytvoř HTML výstup
-    final_answer = "\n\n".join(odpovedi_po_bankach)
-    final_answer = agreguj_banky_v_odpovedi(final_answer)   # <-- agregace bloků
-    odpoved_html = markdown.markdown(highlight_citations(final_answer))
-
-    return templates.TemplateResponse("index.html", {"request": request, "result": odpoved_html, "dotaz": dotaz})
+            hotove += 1
+            odpovedi[data["id"]] = data["markdown"]
+            html = vyrenderuj_odpoved(data["markdown"]) if data["markdown"] else ""
+            yield sse_udalost("banka", {"id": data["id"], "html": html})
+
+        odpoved_html = vyrenderuj_odpoved("\n\n".join(o for o in odpovedi if o))
+        yield sse_udalost("hotovo", {"html": odpoved_html})
+
+        hotove_odpovedi = [{"banka": b, "markdown": o} for b, o in zip(banky, odpovedi) if o]
+        if pouzij_cache:
+            await run_in_threadpool(uloz_odpoved_do_cache, dotaz, embedding, verze, banky_map, hotove_odpovedi)
+    finally:
+        # Klient se odpojil nebo je hotovo – nedokončená volání zrušíme
+        for uloha in ulohy:
+            uloha.cancel()
+
+@app.post("/stream")
+async def form_post_stream(dotaz: str = Form(...), as_of: str = Form(""), username: str = Depends(check_auth)):
+    k_datu = over_as_of(as_of)
+    z_tabulek = await run_in_threadpool(odpovez_tabulkou, dotaz)
+    if z_tabulek is not None:
+        return StreamingResponse(
+            streamuj_hotove(z_tabulek),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    uvolni = prijem_dotazu.prijmi()
+    if uvolni is None:
+        ODMITNUTE_DOTAZY.pricti(endpoint="/stream")
+        return JSONResponse(
+            content={"detail": ZPRAVA_OBSAZENO}, status_code=503, headers={"Retry-After": RETRY_AFTER_S}
+        )
+    # Místo se uvolní po doběhnutí generátoru; background pokryje i odpojení klienta před jeho startem
+    return StreamingResponse(
+        streamuj_odpoved_s_limitem(dotaz, uvolni, k_datu),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(uvolni),
+    )
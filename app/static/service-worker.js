@@ -1,9 +1,145 @@
+// Verzi doplní server při servírování z /service-worker.js (otisk obsahu app/static)
+const VERZE = "__VERZE__";
+const STATICKA_CACHE = `gepard-static-${VERZE}`;
+// Dokumenty mají vlastní verzi v ?v= – jejich cache přežije nasazení nové verze aplikace
+const METODIKY_CACHE = "gepard-metodiky-v1";
+const MAX_METODIK = 40;   // kolik naposledy otevřených dokumentů a výtahů stran držet
+const STATICKE = [
+  "/static/manifest.json",
+  "/static/logo.svg",
+  "/static/mic.svg",
+  "/static/favicon.ico",
+  "/static/icon-192.png",
+];
+
 self.addEventListener("install", (e) => {
-  console.log("Service Worker installed");
+  e.waitUntil(
+    caches.open(STATICKA_CACHE)
+      .then((cache) => cache.addAll(STATICKE))
+      .then(() => self.skipWaiting())
+  );
 });
 
-self.addEventListener("fetch", (e) => {
-  e.respondWith(
-    fetch(e.request).catch(() => new Response("Offline"))
+self.addEventListener("activate", (e) => {
+  // Cache předchozích verzí statických souborů se zahodí
+  e.waitUntil(
+    caches.keys()
+      .then((nazvy) => Promise.all(
+        nazvy
+          .filter((nazev) => nazev.startsWith("gepard-") && nazev !== STATICKA_CACHE && nazev !== METODIKY_CACHE)
+          .map((nazev) => caches.delete(nazev))
+      ))
+      .then(() => self.clients.claim())
   );
-});
\ No newline at end of file
+});
+
+self.addEventListener("fetch", (e) => {
+  const url = new URL(e.request.url);
+  // Odeslání dotazu (POST, SSE stream) jde přímo na server
+  if (e.request.method !== "GET" || url.origin !== self.location.origin) {
+    return;
+  }
+  if (url.pathname.startsWith("/static/")) {
+    e.respondWith(statickySoubor(e.request));
+  } else if (url.pathname.startsWith("/metodiky/")) {
+    e.respondWith(metodika(e));
+  } else {
+    e.respondWith(
+      fetch(e.request).catch(() => new Response("Offline"))
+    );
+  }
+});
+
+async function statickySoubor(request) {
+  const cache = await caches.open(STATICKA_CACHE);
+  const ulozena = await cache.match(request);
+  if (ulozena) {
+    return ulozena;
+  }
+  const odpoved = await fetch(request);
+  if (odpoved.ok) {
+    await cache.put(request, odpoved.clone());
+  }
+  return odpoved;
+}
+
+// Dokument z cache hned; odkaz bez ?v= se na pozadí ověří ETagem (304 nestahuje data)
+async function metodika(e) {
+  const cache = await caches.open(METODIKY_CACHE);
+  const klic = e.request.url;
+  const rozsah = e.request.headers.get("range");
+  const ulozena = await cache.match(klic);
+  if (ulozena) {
+    if (!new URL(klic).searchParams.has("v")) {
+      e.waitUntil(obnov(cache, klic));
+    }
+    return rozsah ? vyrizni(ulozena, rozsah) : ulozena;
+  }
+  try {
+    const odpoved = await fetch(e.request);
+    // Části souboru (206) se neukládají – jen celý dokument
+    if (odpoved.status === 200 && !rozsah) {
+      e.waitUntil(uloz(cache, klic, odpoved.clone()));
+    }
+    return odpoved;
+  } catch (chyba) {
+    return new Response("Offline", { status: 503 });
+  }
+}
+
+async function obnov(cache, klic) {
+  try {
+    const odpoved = await fetch(klic, { cache: "no-cache" });
+    if (odpoved.status === 200) {
+      await uloz(cache, klic, odpoved);
+    }
+  } catch (chyba) {
+    // Offline – zůstane uložená verze
+  }
+}
+
+// Nová verze dokumentu nahradí předchozí; nejstarší dokumenty nad limit se zahodí
+async function uloz(cache, klic, odpoved) {
+  const cesta = new URL(klic).pathname;
+  for (const stary of await cache.keys()) {
+    if (stary.url !== klic && new URL(stary.url).pathname === cesta) {
+      await cache.delete(stary);
+    }
+  }
+  await cache.put(klic, odpoved);
+  const klice = await cache.keys();
+  for (const nadbytecny of klice.slice(0, Math.max(0, klice.length - MAX_METODIK))) {
+    await cache.delete(nadbytecny);
+  }
+}
+
+// Range nad uloženým dokumentem (PDF prohlížeč si čte části souboru); víc rozsahů najednou = celý soubor
+async function vyrizni(odpoved, rozsah) {
+  const typ = odpoved.headers.get("Content-Type") || "application/pdf";
+  const data = await odpoved.blob();
+  const shoda = /^bytes=(\d*)-(\d*)$/.exec(rozsah.trim());
+  if (!shoda || (shoda[1] === "" && shoda[2] === "")) {
+    return new Response(data, { status: 200, headers: { "Content-Type": typ, "Accept-Ranges": "bytes" } });
+  }
+  let zacatek, konec;
+  if (shoda[1] === "") {
+    zacatek = Math.max(0, data.size - Number(shoda[2]));
+    konec = data.size - 1;
+  } else {
+    zacatek = Number(shoda[1]);
+    konec = shoda[2] === "" ? data.size - 1 : Math.min(Number(shoda[2]), data.size - 1);
+  }
+  if (zacatek >= data.size || zacatek > konec) {
+    return new Response(null, { status: 416, headers: { "Content-Range": `bytes */${data.size}` } });
+  }
+  const cast = data.slice(zacatek, konec + 1);
+  return new Response(cast, {
+    status: 206,
+    headers: {
+      "Content-Type": typ,
+      "Content-Length": String(cast.size),
+      "Content-Range": `bytes ${zacatek}-${konec}/${data.size}`,
+      "Accept-Ranges": "bytes",
+    },
+  });
+}
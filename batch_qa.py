@@ -0,0 +1,274 @@
+import os
+import io
+import csv
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+from query_cache import normalizuj_dotaz
+from verze_dokumentu import parsuj_datum
+from metrics import zacni_trasu
+from benchmark import percentily
+from llm_client import vytvor_klienta
+
+# Hromadný běh chce odpovědi z aktuálního indexu, ne podobné dotazy z cache (ANSWER_CACHE=1 ji zapne)
+os.environ.setdefault("ANSWER_CACHE", "0")
+
+SOUBEZNOST = 4          # dotazů zpracovávaných současně (volání LLM dál omezuje LLM_MAX_CONCURRENCY)
+VELIKOST_DAVKY = 32     # dotazů kódovaných jedním voláním enkodéru
+SLOUPCE_DOTAZU = ("dotaz", "question", "otazka", "otázka")
+# USD za 1M tokenů (vstup, výstup); jinou cenu hlavního modelu (LLM_MODEL) zadá --cena-vstup/--cena-vystup
+CENY_ZA_MILION = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+
+# === Vstup ===
+def nacti_dotazy(cesta: str) -> list[dict]:
+    """
+    Dotazy z JSONL ({"dotaz" | "question", volitelně "id", "as_of"}) nebo CSV se sloupcem
+    dotaz/question (jinak první sloupec). Bez "id" je ID pořadové číslo řádku.
+    """
+    with open(cesta, "r", encoding="utf-8-sig") as f:
+        text = f.read()
+    if cesta.lower().endswith((".jsonl", ".ndjson")):
+        zaznamy = [json.loads(radek) for radek in text.splitlines() if radek.strip()]
+    else:
+        ctenar = csv.DictReader(io.StringIO(text))
+        zaznamy = list(ctenar)
+        if ctenar.fieldnames and not any(s in ctenar.fieldnames for s in SLOUPCE_DOTAZU):
+            prvni = ctenar.fieldnames[0]
+            zaznamy = [{"dotaz": prvni}] + [{"dotaz": z[prvni]} for z in zaznamy]
+
+    dotazy = []
+    for cislo, zaznam in enumerate(zaznamy, start=1):
+        dotaz = next((zaznam[s] for s in SLOUPCE_DOTAZU if zaznam.get(s)), "").strip()
+        if not dotaz:
+            continue
+        dotazy.append({
+            "id": str(zaznam.get("id") or cislo),
+            "dotaz": dotaz,
+            "as_of": (zaznam.get("as_of") or "").strip(),
+        })
+    return dotazy
+
+
+def nacti_hotove(cesta: str) -> set[str]:
+    """ID úspěšně zodpovězených dotazů z dřívějšího běhu; rozepsaný poslední řádek se ignoruje."""
+    if not os.path.isfile(cesta):
+        return set()
+    stav = {}
+    with open(cesta, "r", encoding="utf-8") as f:
+        for radek in f:
+            try:
+                zaznam = json.loads(radek)
+            except ValueError:
+                continue
+            stav[zaznam["id"]] = zaznam.get("stav")
+    return {id_ for id_, s in stav.items() if s == "ok"}
+
+
+def otevri_vystup(cesta: str, znovu: bool):
+    if znovu or not os.path.isfile(cesta):
+        return open(cesta, "w", encoding="utf-8")
+    with open(cesta, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        neukonceny = False
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            neukonceny = f.read(1) != b"\n"
+    vystup = open(cesta, "a", encoding="utf-8")
+    if neukonceny:
+        # Běh spadl uprostřed zápisu – useknutý řádek uzavřeme, nacti_hotove ho přeskočí
+        vystup.write("\n")
+    return vystup
+
+
+# === Zpracování ===
+def predkoduj(m, dotazy: list[str]):
+    """Embeddingy celé dávky jedním voláním enkodéru; uloží se do cache, odkud si je vezme zakoduj_dotaz."""
+    unikatni = list(dict.fromkeys(dotazy))
+    vektory = m.spust_vypocet(m.enkoder.encode, [f"query: {d.strip()}" for d in unikatni], len(unikatni))
+    for dotaz, vektor in zip(unikatni, vektory):
+        m.cache_embeddingu.ziskej(normalizuj_dotaz(dotaz), lambda vektor=vektor: vektor.tolist())
+
+
+async def odpovez_na_dotaz(m, polozka: dict, k_datu: int | None) -> dict:
+    """Stejná cesta jako form_post: tabulky → cache odpovědí → vyhledání, rerank a odpovědi bank."""
+    trasa = zacni_trasu()
+    dotaz = polozka["dotaz"]
+    zaznam = {"id": polozka["id"], "dotaz": dotaz, "as_of": polozka["as_of"] or None}
+    try:
+        odpovedi, zdroj, citace, bez_odpovedi = m.odpovez_tabulkou(dotaz), "tabulky", {}, []
+        if odpovedi is None:
+            zdroj = "cache"
+            if k_datu is None:
+                embedding, verze, odpovedi = await asyncio.to_thread(m.najdi_odpoved_v_cache, dotaz)
+            if odpovedi is None:
+                zdroj = "rag"
+                banky_map = await asyncio.to_thread(m.priprav_podklady, dotaz, k_datu)
+                odpovedi = await m.odpovez(dotaz, banky_map)
+                if k_datu is None:
+                    await asyncio.to_thread(m.uloz_odpoved_do_cache, dotaz, embedding, verze, banky_map, odpovedi)
+                citace = {nazev: data["citace"] for nazev, data in banky_map.items() if data["chunks"]}
+                odpovezene = {m.normalizuj_nazev_banky(o["banka"]) for o in odpovedi}
+                if not any(o.get("strukturovana") for o in odpovedi):
+                    bez_odpovedi = [nazev for nazev in citace if m.normalizuj_nazev_banky(nazev) not in odpovezene]
+        zaznam.update(
+            stav="castecne" if bez_odpovedi else "ok",
+            zdroj=zdroj,
+            odpovedi=[{"banka": o["banka"], "markdown": o["markdown"]} for o in odpovedi],
+            citace=citace,
+            bez_odpovedi=bez_odpovedi,
+        )
+    except Exception as e:
+        zaznam.update(stav="chyba", chyba=f"{type(e).__name__}: {e}")
+
+    souhrn = trasa.souhrn()
+    zaznam["tokeny"] = {
+        "prompt": sum(t["prompt"] for t in souhrn["tokeny"].values()),
+        "completion": sum(t["completion"] for t in souhrn["tokeny"].values()),
+        "modely": souhrn["modely"],
+    }
+    zaznam["doba_s"] = round(souhrn["celkem_ms"] / 1000, 3)
+    return zaznam
+
+
+async def zpracuj(m, polozky: list[dict], vystup, soubeznost: int, velikost_davky: int, as_of: int | None) -> list[dict]:
+    """
+    Enkodér kóduje po dávkách o krok napřed, `soubeznost` workerů odpovídá. Každý hotový
+    záznam se hned zapíše a flushne – přerušený běh tak přijde nejvýš o rozpracované dotazy.
+    """
+    fronta = asyncio.Queue(maxsize=max(velikost_davky, soubeznost))
+    hotove = []
+
+    async def koduj():
+        for i in range(0, len(polozky), velikost_davky):
+            davka = polozky[i:i + velikost_davky]
+            await asyncio.to_thread(predkoduj, m, [p["dotaz"] for p in davka])
+            for polozka in davka:
+                await fronta.put(polozka)
+        for _ in range(soubeznost):
+            await fronta.put(None)
+
+    async def pracuj():
+        while (polozka := await fronta.get()) is not None:
+            k_datu = parsuj_datum(polozka["as_of"]) if polozka["as_of"] else as_of
+            zaznam = await odpovez_na_dotaz(m, polozka, k_datu)
+            vystup.write(json.dumps(zaznam, ensure_ascii=False) + "\n")
+            vystup.flush()
+            hotove.append(zaznam)
+            ikona = {"ok": "✅", "castecne": "⚠️"}.get(zaznam["stav"], "❌")
+            print(f"{ikona} [{len(hotove)}/{len(polozky)}] {zaznam['id']} ({zaznam['doba_s']} s)", file=sys.stderr)
+
+    await asyncio.gather(koduj(), *(pracuj() for _ in range(soubeznost)))
+    return hotove
+
+
+# === Statistiky běhu ===
+def statistiky(zaznamy: list[dict], doba_s: float, preskoceno: int, ceny: dict) -> dict:
+    """Souhrn běhu; cena z tokenů po modelech (router posílá část dotazů levnějšímu modelu)."""
+    prompt = sum(z["tokeny"]["prompt"] for z in zaznamy)
+    completion = sum(z["tokeny"]["completion"] for z in zaznamy)
+    po_modelech = {}
+    for zaznam in zaznamy:
+        for model, tokeny in zaznam["tokeny"].get("modely", {}).items():
+            soucet = po_modelech.setdefault(model, {"prompt": 0, "completion": 0})
+            soucet["prompt"] += tokeny["prompt"]
+            soucet["completion"] += tokeny["completion"]
+    cena = sum(
+        (t["prompt"] * ceny.get(model, (0.0, 0.0))[0] + t["completion"] * ceny.get(model, (0.0, 0.0))[1]) / 1_000_000
+        for model, t in po_modelech.items()
+    )
+    stavy = [z["stav"] for z in zaznamy]
+    return {
+        "zpracovano": len(zaznamy),
+        "preskoceno": preskoceno,
+        "ok": stavy.count("ok"),
+        "castecne": stavy.count("castecne"),
+        "chyb": stavy.count("chyba"),
+        "zdroje": {zdroj: sum(1 for z in zaznamy if z.get("zdroj") == zdroj) for zdroj in ("tabulky", "cache", "rag")},
+        "doba_s": round(doba_s, 1),
+        "dotazu_za_minutu": round(len(zaznamy) / doba_s * 60, 1) if doba_s else 0.0,
+        "latence": percentily([z["doba_s"] for z in zaznamy]),
+        "tokeny": {"prompt": prompt, "completion": completion},
+        "tokeny_po_modelech": po_modelech,
+        "cena_usd": round(cena, 4),
+        "cena_za_dotaz_usd": round(cena / len(zaznamy), 5) if zaznamy else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hromadné zodpovězení dotazů (CSV/JSONL) stejnou cestou jako webový formulář.")
+    parser.add_argument("vstup", help="CSV (sloupec dotaz/question) nebo JSONL s dotazy")
+    parser.add_argument("vystup", help="JSONL s odpověďmi; existující soubor se doplní (hotová ID se přeskočí)")
+    parser.add_argument("--znovu", action="store_true", help="ignorovat dřívější výstup a začít od začátku")
+    parser.add_argument("--soubeznost", type=int, default=SOUBEZNOST, help="kolik dotazů běží současně")
+    parser.add_argument("--llm-soubeznost", type=int, help="max. současných volání OpenAI (jinak LLM_MAX_CONCURRENCY)")
+    parser.add_argument("--davka", type=int, default=VELIKOST_DAVKY, help="dotazů na jedno volání enkodéru")
+    parser.add_argument("--as-of", help="stav metodik k datu (RRRR-MM-DD) pro dotazy bez vlastního as_of")
+    parser.add_argument("--llm", choices=["stub", "openai"], default="openai", help="stub = bez sítě (zkouška vstupu)")
+    parser.add_argument("--cena-vstup", type=float, help="USD za 1M tokenů promptu")
+    parser.add_argument("--cena-vystup", type=float, help="USD za 1M tokenů odpovědi")
+    parser.add_argument("--statistiky", help="kam uložit JSON se statistikami běhu (jinak jen stderr)")
+    args = parser.parse_args()
+
+    polozky = nacti_dotazy(args.vstup)
+    try:
+        as_of = parsuj_datum(args.as_of) if args.as_of else None
+        for polozka in polozky:
+            if polozka["as_of"]:
+                parsuj_datum(polozka["as_of"])
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+    hotove = set() if args.znovu else nacti_hotove(args.vystup)
+    zbyva = [p for p in polozky if p["id"] not in hotove]
+    print(f"▶️ {len(polozky)} dotazů, {len(polozky) - len(zbyva)} už hotových, zbývá {len(zbyva)}", file=sys.stderr)
+    if not zbyva:
+        return
+
+    import app.main as m
+    if args.llm_soubeznost:
+        m.llm_semafor = asyncio.Semaphore(args.llm_soubeznost)
+    if args.llm == "stub":
+        m.llm = vytvor_klienta("stub")
+    ceny = dict(CENY_ZA_MILION)
+    vychozi_ceny = ceny.get(m.LLM_MODEL, (0.0, 0.0))
+    ceny[m.LLM_MODEL] = (
+        args.cena_vstup if args.cena_vstup is not None else vychozi_ceny[0],
+        args.cena_vystup if args.cena_vystup is not None else vychozi_ceny[1],
+    )
+
+    start = time.perf_counter()
+    with otevri_vystup(args.vystup, args.znovu) as vystup:
+        try:
+            zaznamy = asyncio.run(zpracuj(m, zbyva, vystup, args.soubeznost, args.davka, as_of))
+        except KeyboardInterrupt:
+            print(f"⏸️ Přerušeno – hotové odpovědi jsou v {args.vystup}, spusťte znovu se stejnými argumenty.", file=sys.stderr)
+            sys.exit(130)
+
+    vysledek = statistiky(zaznamy, time.perf_counter() - start, len(polozky) - len(zbyva), ceny)
+    print(
+        f"📊 {vysledek['ok']} ok, {vysledek['castecne']} částečně, {vysledek['chyb']} chyb | "
+        f"{vysledek['dotazu_za_minutu']} dotazů/min | p50 {vysledek['latence'].get('p50_ms')} ms, "
+        f"p95 {vysledek['latence'].get('p95_ms')} ms",
+        file=sys.stderr,
+    )
+    print(
+        f"💰 tokeny {vysledek['tokeny']['prompt']} + {vysledek['tokeny']['completion']} | "
+        f"{vysledek['cena_usd']} USD ({', '.join(vysledek['tokeny_po_modelech']) or m.LLM_MODEL})",
+        file=sys.stderr,
+    )
+    if args.statistiky:
+        with open(args.statistiky, "w", encoding="utf-8") as f:
+            json.dump(vysledek, f, ensure_ascii=False, indent=2)
+        print(f"💾 Statistiky uloženy do {args.statistiky}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
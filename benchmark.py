@@ -0,0 +1,314 @@
+import os
+import io
+import csv
+import sys
+import json
+import time
+import asyncio
+import argparse
+import unicodedata
+from collections import defaultdict
+
+from prompts import pocet_tokenu, tokenizer_popis, dalsi_zdroje, PROMPT_MAX_TOKENU
+
+# Benchmark nesmí číst ani plnit cache odpovědí produkční aplikace
+os.environ.setdefault("ANSWER_CACHE", "0")
+
+FEEDBACK_PATH = "feedback.csv"
+GOLD_PATH = os.path.join("data", "benchmark_gold.json")
+K_HODNOTY = (1, 3, 5, 10, 20)
+PRAHY_ODSTUPU = (0.0, 0.01, 0.02, 0.03, 0.05, 0.08)   # kandidáti na MIN_ODSTUP routeru
+
+# === Vstupní data ===
+def nacti_feedback_zaznamy(cesta: str) -> list[dict]:
+    """
+    Řádky feedback.csv (question, answer, feedback). Soubor vznikal v různých kódováních
+    (řádky v UTF-8 i cp1250), proto se dekóduje po řádcích.
+    """
+    if not os.path.isfile(cesta):
+        return []
+    radky = []
+    with open(cesta, "rb") as f:
+        for radek in f:
+            try:
+                radky.append(radek.decode("utf-8"))
+            except UnicodeDecodeError:
+                radky.append(radek.decode("cp1250"))
+    return list(csv.DictReader(io.StringIO("".join(radky))))
+
+
+def nacti_feedback(cesta: str) -> list[str]:
+    """Unikátní dotazy z feedback.csv."""
+    dotazy = []
+    for zaznam in nacti_feedback_zaznamy(cesta):
+        dotaz = (zaznam.get("question") or "").strip()
+        if dotaz and dotaz not in dotazy:
+            dotazy.append(dotaz)
+    return dotazy
+
+
+def nacti_gold(cesta: str) -> list[dict]:
+    """Kurátorovaná sada: dotaz → očekávané dokumenty (volitelně strana)."""
+    if not os.path.isfile(cesta):
+        return []
+    with open(cesta, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# === Metriky ===
+def _nazev(nazev: str) -> str:
+    return unicodedata.normalize("NFC", nazev).strip().casefold()
+
+
+def je_zasah(meta: dict, ocekavany: dict) -> bool:
+    """
+    Chunk je relevantní, pokud je z očekávaného dokumentu (a pokrývá očekávanou stranu, je-li zadaná).
+    Počítají se i zdroje duplikátů sloučených do chunku.
+    """
+    if any(je_zasah(zdroj, ocekavany) for zdroj in dalsi_zdroje(meta)):
+        return True
+    if _nazev(meta.get("document_source", "")) != _nazev(ocekavany["dokument"]):
+        return False
+    strana = ocekavany.get("strana")
+    if strana is None or not isinstance(meta.get("strana"), int):
+        return True
+    return meta["strana"] <= strana <= meta.get("strana_do", meta["strana"])
+
+
+def ocekavane_polozky(zaznam: dict) -> list[dict]:
+    return [{"dokument": d, "strana": zaznam.get("strana")} for d in zaznam["dokumenty"]]
+
+
+def vyhodnot_poradi(metadata: list[dict], ocekavane: list[dict]) -> dict:
+    """recall@k (podíl nalezených očekávaných dokumentů v top-k) a reciproční pořadí prvního zásahu."""
+    pozice = []
+    for ocekavany in ocekavane:
+        pozice.append(next((i for i, meta in enumerate(metadata) if je_zasah(meta, ocekavany)), None))
+    nalezene = [p for p in pozice if p is not None]
+    return {
+        "recall": {k: sum(1 for p in nalezene if p < k) / len(ocekavane) for k in K_HODNOTY},
+        "rr": 1.0 / (min(nalezene) + 1) if nalezene else 0.0,
+        "prvni_zasah": min(nalezene) + 1 if nalezene else None,
+    }
+
+
+def percentily(hodnoty_s: list[float]) -> dict:
+    if not hodnoty_s:
+        return {}
+    serazene = sorted(h * 1000 for h in hodnoty_s)
+
+    def p(q):
+        return round(serazene[min(len(serazene) - 1, int(q * len(serazene)))], 1)
+
+    return {"n": len(serazene), "p50_ms": p(0.50), "p95_ms": p(0.95), "p99_ms": p(0.99), "max_ms": round(serazene[-1], 1)}
+
+
+def prumer(hodnoty: list[float]) -> float:
+    return round(sum(hodnoty) / len(hodnoty), 4) if hodnoty else 0.0
+
+
+def vyhodnot_router(router) -> dict:
+    """
+    Odstupy routeru na sadě příkladů (leave-one-out): pro každý práh podíl dotazů, které dostanou
+    typ (pokrytí), a přesnost mezi nimi. Nejistý dotaz jde plnou cestou, chybný typ ji zúží.
+    """
+    odstupy = router.odstupy_prikladu()
+
+    def pri_prahu(prah: float) -> dict:
+        jiste = [x for x in odstupy if x["odstup"] >= prah]
+        return {
+            "pokryti": round(len(jiste) / len(odstupy), 3) if odstupy else 0.0,
+            "presnost": prumer([1.0 if x["typ"] == x["predikce"] else 0.0 for x in jiste]),
+        }
+
+    jiste = [x for x in odstupy if x["odstup"] >= router.min_odstup]
+    # Přesnost typu = kolik dotazů, kterým router přidělil tento typ, ho opravdu má (ty dostanou jeho profil);
+    # úplnost = kolik dotazů typu router pozná (ostatní jdou plnou cestou)
+    po_typech = {
+        typ: {
+            "presnost": prumer([1.0 if x["typ"] == typ else 0.0 for x in jiste if x["predikce"] == typ]),
+            "uplnost": prumer([
+                1.0 if x["predikce"] == typ and x["odstup"] >= router.min_odstup else 0.0
+                for x in odstupy if x["typ"] == typ
+            ]),
+        }
+        for typ in sorted({x["typ"] for x in odstupy})
+    }
+    chybne = sorted(x["odstup"] for x in odstupy if x["typ"] != x["predikce"])
+    return {
+        "min_odstup": router.min_odstup,
+        "prikladu": len(odstupy),
+        "max_odstup_chyby": chybne[-1] if chybne else None,
+        "aktualni": pri_prahu(router.min_odstup),
+        "po_typech": po_typech,
+        "prahy": {str(prah): pri_prahu(prah) for prah in PRAHY_ODSTUPU},
+    }
+
+
+# === Stub LLM ===
+def vytvor_llm(backend: str, puvodni, zaznam: list):
+    """
+    Náhrada zavolej_llm: každé volání zaznamená (počet tokenů promptu). Backend "stub"
+    vrací pevnou odpověď bez sítě, "openai" volání předá skutečnému API.
+    """
+    async def zavolej(messages, on_token=None, **parametry):
+        zaznam.append(sum(pocet_tokenu(m["content"]) for m in messages))
+        if backend == "openai":
+            return await puvodni(messages, on_token=on_token, **parametry)
+        if parametry.get("response_format", {}).get("type") == "json_object":
+            return json.dumps({"banky": []})
+        return "### 🏦 Stub\n- odpověď"
+    return zavolej
+
+
+# === Běh ===
+async def proved(m, dotazy: list[dict], llm_backend: str) -> dict:
+    zaznam_llm = []
+    m.zavolej_llm = vytvor_llm(llm_backend, m.zavolej_llm, zaznam_llm)
+    soubory = m.verze_indexu.manifest().get("soubory", {})
+
+    casy = defaultdict(list)
+    tokeny, volani = [], []
+    po_bankach = defaultdict(list)
+    vysledky = []
+
+    for polozka in dotazy:
+        dotaz = polozka["dotaz"]
+        # Každý dotaz měříme „za studena“ – bez cache embeddingů a vyhledávání
+        m.cache_embeddingu.vymaz()
+        m.cache_vyhledavani.vymaz()
+
+        start = time.perf_counter()
+        m.zakoduj_dotaz(dotaz)
+        casy["encode"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        nalezene = m.vyhledej_vysledky(dotaz)
+        casy["vyhledani"].append(time.perf_counter() - start)
+
+        # Stejná cesta jako form_post: vyhledání (už z cache) + rerank
+        start = time.perf_counter()
+        banky_map = m.priprav_podklady(dotaz)
+        casy["rerank"].append(time.perf_counter() - start)
+
+        pred = len(zaznam_llm)
+        start = time.perf_counter()
+        await m.odpovez(dotaz, banky_map)
+        casy["llm"].append(time.perf_counter() - start)
+        tokeny.append(sum(zaznam_llm[pred:]))
+        volani.append(len(zaznam_llm) - pred)
+
+        vysledek = {
+            "dotaz": dotaz,
+            "zdroj": polozka["zdroj"],
+            "chunku": len(nalezene),
+            "bank_v_promptu": sum(1 for data in banky_map.values() if data["chunks"]),
+            "tokeny_promptu": tokeny[-1],
+            "llm_volani": volani[-1],
+        }
+        if polozka.get("dokumenty"):
+            ocekavane = ocekavane_polozky(polozka)
+            metriky = vyhodnot_poradi([meta for _, meta in nalezene], ocekavane)
+            citace = " ".join(c for data in banky_map.values() for c in data["citace"])
+            metriky["v_promptu"] = any(
+                _nazev(f"dokument: {o['dokument']},") in _nazev(citace) for o in ocekavane
+            )
+            vysledek.update(metriky)
+            banka = soubory.get(polozka["dokumenty"][0], {}).get("banka", "Neznámá banka")
+            po_bankach[m.normalizuj_nazev_banky(banka)].append(metriky)
+        vysledky.append(vysledek)
+
+    def souhrn(metriky: list[dict]) -> dict:
+        return {
+            "dotazu": len(metriky),
+            **{f"recall@{k}": prumer([x["recall"][k] for x in metriky]) for k in K_HODNOTY},
+            "mrr": prumer([x["rr"] for x in metriky]),
+            "v_promptu": prumer([1.0 if x["v_promptu"] else 0.0 for x in metriky]),
+        }
+
+    vsechny = [x for metriky in po_bankach.values() for x in metriky]
+    return {
+        "konfigurace": {
+            "index_verze": m.verze_indexu.aktualni(),
+            "retrieval_mode": m.RETRIEVAL_MODE,
+            "retrieval_n_results": m.RETRIEVAL_N_RESULTS,
+            "retrieval_k_na_banku": m.RETRIEVAL_K_NA_BANKU,
+            "vector_backend": m.VECTOR_BACKEND,
+            "hybrid": m.invertovany_index is not None,
+            "router": m.router is not None,
+            "rerank_mode": m.RERANK_MODE,
+            "rerank_top_n": m.RERANK_TOP_N,
+            "answer_mode": m.ANSWER_MODE,
+            "prompt_max_tokenu": PROMPT_MAX_TOKENU,
+            "llm": llm_backend,
+            "tokenizer": tokenizer_popis(),
+        },
+        "kvalita": souhrn(vsechny) if vsechny else {},
+        "router": vyhodnot_router(m.router) if m.router is not None else {},
+        "kvalita_po_bankach": {banka: souhrn(metriky) for banka, metriky in sorted(po_bankach.items())},
+        "latence": {nazev: percentily(hodnoty) for nazev, hodnoty in casy.items()},
+        "prompt": {
+            "tokeny_prumer": prumer(tokeny),
+            "tokeny_max": max(tokeny, default=0),
+            "llm_volani_prumer": prumer(volani),
+        },
+        "dotazy": vysledky,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark vyhledávání a promptů (feedback.csv + zlatá sada).")
+    parser.add_argument("--feedback", default=FEEDBACK_PATH, help="CSV se zpětnou vazbou (sloupec question)")
+    parser.add_argument("--gold", default=GOLD_PATH, help="JSON se zlatou sadou dotaz → dokumenty")
+    parser.add_argument("--llm", choices=["stub", "openai"], default="stub", help="stub = bez sítě (CI), openai = skutečná volání")
+    parser.add_argument("--jen-gold", action="store_true", help="nepřehrávat dotazy z feedback.csv")
+    parser.add_argument("--vystup", help="kam uložit JSON s výsledky (jinak stdout)")
+    args = parser.parse_args()
+
+    gold = [dict(z, zdroj="gold") for z in nacti_gold(args.gold)]
+    zname = {z["dotaz"] for z in gold}
+    feedback = [] if args.jen_gold else [
+        {"dotaz": d, "zdroj": "feedback"} for d in nacti_feedback(args.feedback) if d not in zname
+    ]
+    dotazy = gold + feedback
+    if not dotazy:
+        print("❌ Žádné dotazy k přehrání.", file=sys.stderr)
+        sys.exit(1)
+
+    import app.main as m
+    print(f"▶️ Přehrávám {len(gold)} dotazů ze zlaté sady a {len(feedback)} z feedbacku (LLM: {args.llm})", file=sys.stderr)
+    vysledek = asyncio.run(proved(m, dotazy, args.llm))
+
+    kvalita = vysledek["kvalita"]
+    if kvalita:
+        print(
+            f"📊 recall@5 {kvalita['recall@5']:.2f} | recall@10 {kvalita['recall@10']:.2f} | "
+            f"MRR {kvalita['mrr']:.3f} | v promptu {kvalita['v_promptu']:.2f}",
+            file=sys.stderr,
+        )
+    router = vysledek["router"]
+    if router:
+        print(
+            f"🧭 router: práh {router['min_odstup']} | pokrytí {router['aktualni']['pokryti']:.2f} | "
+            f"přesnost {router['aktualni']['presnost']:.2f} | největší odstup chybného typu {router['max_odstup_chyby']}",
+            file=sys.stderr,
+        )
+        print(
+            "🧭 přesnost po typech: " + ", ".join(f"{typ} {t['presnost']:.2f}" for typ, t in router["po_typech"].items()),
+            file=sys.stderr,
+        )
+    print(f"⏱️ encode p50 {vysledek['latence']['encode']['p50_ms']} ms | vyhledání p50 "
+          f"{vysledek['latence']['vyhledani']['p50_ms']} ms | tokeny promptu Ø {vysledek['prompt']['tokeny_prumer']}",
+          file=sys.stderr)
+
+    text = json.dumps(vysledek, ensure_ascii=False, indent=2)
+    if args.vystup:
+        with open(args.vystup, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"💾 Výsledky uloženy do {args.vystup}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import re
+
+# Nadpis kapitoly: "2", "2.1", "2.1.1" následované textem začínajícím velkým písmenem
+NADPIS_RE = re.compile(r"^(\d{1,2}(?:\.\d{1,2}){0,4})(\.?)\s+([A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ].{2,80})$")
+# Řádek obsahu ("2.1 Identifikace ........ 7") není nadpis
+OBSAH_RE = re.compile(r"(\.{4,}|…{2,})\s*\d+\s*$")
+# Začátek odrážky nebo bodu výčtu
+ODRAZKA_RE = re.compile(r"^([-–•●▪■◦*]|\d{1,2}\)|[a-z]\))\s")
+# Hranice vět: interpunkce, mezera a velké písmeno / číslice / uvozovky
+VETA_RE = re.compile(r"(?<=[.!?])\s+(?=[A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ0-9„\"])")
+
+
+def odhadni_tokeny(text: str) -> int:
+    """Hrubý odhad počtu tokenů pro češtinu, když není k dispozici tokenizer."""
+    return len(text) // 3 + 1
+
+
+def _je_nadpis(radek: str):
+    if OBSAH_RE.search(radek):
+        return None
+    m = NADPIS_RE.match(radek)
+    if not m:
+        return None
+    cislo, tecka, nazev = m.group(1), m.group(2), m.group(3).strip()
+    # Bod číslovaného výčtu ("1. Potvrzení o pobytu.", "3. EXPA je povinen …") nadpisem není
+    if nazev.endswith((".", ",", ";")):
+        return None
+    if tecka and "." not in cislo and len(nazev) > 50:
+        return None
+    return cislo, nazev
+
+
+def _odstavce(stranky):
+    """
+    Rozloží stránky na odstavce. Vrací slovníky
+    {"strana", "text", "nadpis": (cislo, nazev) | None}.
+    Řádky z PDF se skládají do odstavců; prázdný řádek, nadpis
+    nebo začátek odrážky začíná odstavec nový. Na stránkách obsahu
+    se nadpisy nehledají.
+    """
+    for strana, text in stranky:
+        vsechny_radky = text.splitlines()
+        je_obsah = sum(1 for r in vsechny_radky if OBSAH_RE.search(r)) >= 3
+        radky = []
+        for radek in vsechny_radky:
+            radek = radek.strip()
+            if not radek:
+                if radky:
+                    yield {"strana": strana, "text": " ".join(radky), "nadpis": None}
+                    radky = []
+                continue
+            nadpis = None if je_obsah else _je_nadpis(radek)
+            if nadpis or ODRAZKA_RE.match(radek):
+                if radky:
+                    yield {"strana": strana, "text": " ".join(radky), "nadpis": None}
+                    radky = []
+                if nadpis:
+                    yield {"strana": strana, "text": radek, "nadpis": nadpis}
+                    continue
+            radky.append(radek)
+        if radky:
+            yield {"strana": strana, "text": " ".join(radky), "nadpis": None}
+
+
+def _rozdel_dlouhy_text(text: str, max_tokenu: int, pocitej_tokeny):
+    """Text delší než rozpočet rozdělí po větách, příliš dlouhé věty po slovech."""
+    casti = []
+    for veta in VETA_RE.split(text):
+        if pocitej_tokeny(veta) <= max_tokenu:
+            casti.append(veta)
+            continue
+        slova, kus = veta.split(), []
+        for slovo in slova:
+            if kus and pocitej_tokeny(" ".join(kus + [slovo])) > max_tokenu:
+                casti.append(" ".join(kus))
+                kus = []
+            kus.append(slovo)
+        if kus:
+            casti.append(" ".join(kus))
+    return casti
+
+
+def rozdel_na_chunky(stranky, max_tokenu: int = 300, pocitej_tokeny=odhadni_tokeny) -> list[dict]:
+    """
+    Rozdělí dokument na chunky podle nadpisů, odstavců a vět v rámci rozpočtu tokenů.
+
+    stranky: seznam (strana, text); strana je None u dokumentů bez stránek (DOCX, XLSX).
+    Vrací seznam {"text", "strana", "strana_do", "kapitola", "nadpis"} – strana je
+    skutečná stránka, kde chunk začíná, kapitola číslo posledního nadpisu před ním.
+    """
+    chunky = []
+    kapitola, nadpis_kapitoly = "?", ""
+    kapitola_chunku, nadpis_chunku = kapitola, nadpis_kapitoly
+    aktualni, tokeny, strany = [], 0, []
+    jen_nadpisy = True
+
+    def uzavri():
+        nonlocal aktualni, tokeny, strany, jen_nadpisy
+        if aktualni and not jen_nadpisy:
+            cisla = [s for s in strany if s is not None]
+            chunky.append({
+                "text": "\n".join(aktualni),
+                "strana": cisla[0] if cisla else None,
+                "strana_do": cisla[-1] if cisla else None,
+                "kapitola": kapitola_chunku,
+                "nadpis": nadpis_chunku,
+            })
+        aktualni, tokeny, strany, jen_nadpisy = [], 0, [], True
+
+    for odstavec in _odstavce(stranky):
+        text = odstavec["text"]
+        n = pocitej_tokeny(text)
+
+        if odstavec["nadpis"]:
+            # Nový nadpis uzavírá předchozí chunk; po sobě jdoucí nadpisy zůstávají spolu
+            if not jen_nadpisy:
+                uzavri()
+            kapitola, nadpis_kapitoly = odstavec["nadpis"]
+            if not aktualni:
+                kapitola_chunku, nadpis_chunku = kapitola, nadpis_kapitoly
+            aktualni.append(text)
+            tokeny += n
+            strany.append(odstavec["strana"])
+            continue
+
+        if n > max_tokenu:
+            casti = _rozdel_dlouhy_text(text, max_tokenu, pocitej_tokeny)
+        else:
+            casti = [text]
+
+        for cast in casti:
+            n = pocitej_tokeny(cast)
+            if tokeny + n > max_tokenu and not jen_nadpisy:
+                uzavri()
+            if not aktualni:
+                kapitola_chunku, nadpis_chunku = kapitola, nadpis_kapitoly
+            aktualni.append(cast)
+            tokeny += n
+            strany.append(odstavec["strana"])
+            jen_nadpisy = False
+
+    uzavri()
+    return chunky
@@ -0,0 +1,223 @@
+import os
+import re
+import json
+import zlib
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+import numpy as np
+
+SLOVO_RE = re.compile(r"\w+")
+CISLO_RE = re.compile(r"\d+(?:[.,]\d+)?")
+DELKA_SINGLU = 5         # shingle = 5 po sobě jdoucích slov
+POCET_PERMUTACI = 128
+POCET_PASEM = 16         # LSH: 16 pásem po 8 hodnotách → kandidáti zhruba od Jaccardu 0,7
+PRAH = 0.85              # odhad Jaccardovy podobnosti, od kterého jsou chunky duplicitní
+
+_rng = np.random.default_rng(20240703)
+# Multiply-shift hashování: (a·x + b) mod 2^64, horních 32 bitů; a liché
+_A = _rng.integers(1, 2 ** 63, size=POCET_PERMUTACI, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_B = _rng.integers(0, 2 ** 63, size=POCET_PERMUTACI, dtype=np.uint64)
+
+
+def slova(text: str) -> list[str]:
+    text = unicodedata.normalize("NFD", text.lower())
+    text = "".join(c for c in text if unicodedata.category(c) != "Mn")
+    return SLOVO_RE.findall(text)
+
+
+def cisla(text: str) -> str:
+    """Čísla v textu – duplicitní chunky se v nich musí shodovat („80 %“ vs. „90 %“ není duplicita)."""
+    return " ".join(sorted(set(CISLO_RE.findall(text))))
+
+
+def podpis(text: str) -> np.ndarray:
+    """MinHash podpis (POCET_PERMUTACI × uint32) nad shingly slov."""
+    s = slova(text)
+    singly = {" ".join(s[i:i + DELKA_SINGLU]) for i in range(max(1, len(s) - DELKA_SINGLU + 1))}
+    x = np.fromiter((zlib.crc32(sh.encode("utf-8")) for sh in singly), dtype=np.uint64, count=len(singly))
+    with np.errstate(over="ignore"):
+        hodnoty = (x[:, None] * _A[None, :] + _B[None, :]) >> np.uint64(32)
+    return hodnoty.min(axis=0).astype(np.uint32)
+
+
+def podobnost(a: np.ndarray, b: np.ndarray) -> float:
+    """Odhad Jaccardovy podobnosti dvou podpisů."""
+    return float(np.mean(a == b))
+
+
+def _pasma(sig: np.ndarray) -> list[tuple[int, int]]:
+    radku = POCET_PERMUTACI // POCET_PASEM
+    return [
+        (p, int.from_bytes(hashlib.blake2b(sig[p * radku:(p + 1) * radku].tobytes(), digest_size=8).digest(), "little", signed=True))
+        for p in range(POCET_PASEM)
+    ]
+
+
+def zdroj_z_metadat(meta: dict) -> dict:
+    """Citace zdroje duplicitního chunku (ve stejném tvaru jako metadata chunku)."""
+    zdroj = {"document_source": meta.get("document_source", "?"), "kapitola": meta.get("kapitola", "?")}
+    for pole in ("strana", "strana_do"):
+        if meta.get(pole) is not None:
+            zdroj[pole] = meta[pole]
+    return zdroj
+
+
+class Deduplikace:
+    """
+    Detekce téměř duplicitních chunků při indexaci (MinHash + LSH, SQLite).
+
+    Eviduje podpisy kanonických chunků (těch, které jsou v ChromaDB) a pro každý
+    sloučený duplikát jeho zdroj. Duplikát se do kolekce nezapisuje – kanonický chunk
+    dostane v metadatech "dalsi_zdroje" (JSON seznam) s citacemi všech sloučených míst.
+    Slučuje se jen v rámci jedné banky: stejný text u dvou bank jsou dvě různá pravidla.
+    """
+
+    def __init__(self, cesta: str, prah: float = PRAH):
+        self.prah = prah
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(cesta) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(cesta, check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS podpisy (
+                chunk_id TEXT PRIMARY KEY,
+                soubor TEXT NOT NULL,
+                banka TEXT NOT NULL,
+                cisla TEXT NOT NULL,
+                podpis BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pasma (
+                pasmo INTEGER NOT NULL,
+                hodnota INTEGER NOT NULL,
+                chunk_id TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS duplikaty (
+                chunk_id TEXT PRIMARY KEY,
+                soubor TEXT NOT NULL,
+                kanonicky_id TEXT NOT NULL,
+                zdroj TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_pasma ON pasma(pasmo, hodnota);
+            CREATE INDEX IF NOT EXISTS idx_pasma_chunk ON pasma(chunk_id);
+            CREATE INDEX IF NOT EXISTS idx_podpisy_soubor ON podpisy(soubor);
+            CREATE INDEX IF NOT EXISTS idx_duplikaty_soubor ON duplikaty(soubor);
+            CREATE INDEX IF NOT EXISTS idx_duplikaty_kanonicky ON duplikaty(kanonicky_id);
+            """
+        )
+        self._conn.commit()
+
+    def _pridej_kanonicky(self, chunk_id: str, meta: dict, text: str, sig: np.ndarray):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO podpisy VALUES (?, ?, ?, ?, ?)",
+            (chunk_id, meta.get("document_source", "?"), meta.get("banka", "Neznámá banka"), cisla(text), sig.tobytes()),
+        )
+        self._conn.executemany(
+            "INSERT INTO pasma VALUES (?, ?, ?)", [(p, h, chunk_id) for p, h in _pasma(sig)]
+        )
+
+    def _najdi_kanonicky(self, meta: dict, text: str, sig: np.ndarray) -> str | None:
+        kandidati = set()
+        for p, h in _pasma(sig):
+            kandidati.update(r[0] for r in self._conn.execute(
+                "SELECT chunk_id FROM pasma WHERE pasmo = ? AND hodnota = ?", (p, h)
+            ))
+        nejlepsi, nejlepsi_podobnost = None, self.prah
+        banka, cisla_textu = meta.get("banka", "Neznámá banka"), cisla(text)
+        for chunk_id in sorted(kandidati):
+            radek = self._conn.execute(
+                "SELECT banka, cisla, podpis FROM podpisy WHERE chunk_id = ?", (chunk_id,)
+            ).fetchone()
+            if radek is None or radek[0] != banka or radek[1] != cisla_textu:
+                continue
+            s = podobnost(sig, np.frombuffer(radek[2], dtype=np.uint32))
+            if s >= nejlepsi_podobnost:
+                nejlepsi, nejlepsi_podobnost = chunk_id, s
+        return nejlepsi
+
+    # === Zápis (prepare_db.py) ===
+    def zpracuj_soubor(self, ids: list[str], chunks: list[str], metadatas: list[dict]) -> tuple[list[int], dict]:
+        """
+        Projde chunky jednoho souboru (už bez jeho starých záznamů) a zaeviduje je.
+        Vrací (indexy chunků k zápisu, {kanonicke_id: [indexy duplikátů]}); kanonický chunk
+        může být z jiného souboru i dřívější chunk téhož souboru.
+        """
+        ponechane, sloucene = [], {}
+        with self._lock:
+            for i, (chunk_id, text, meta) in enumerate(zip(ids, chunks, metadatas)):
+                sig = podpis(text)
+                kanonicky = self._najdi_kanonicky(meta, text, sig)
+                if kanonicky is None:
+                    self._pridej_kanonicky(chunk_id, meta, text, sig)
+                    ponechane.append(i)
+                    continue
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO duplikaty VALUES (?, ?, ?, ?)",
+                    (chunk_id, meta.get("document_source", "?"), kanonicky,
+                     json.dumps(zdroj_z_metadat(meta), ensure_ascii=False)),
+                )
+                sloucene.setdefault(kanonicky, []).append(i)
+            self._conn.commit()
+        return ponechane, sloucene
+
+    def pridej_existujici(self, ids: list[str], chunks: list[str], metadatas: list[dict]):
+        """Chunky, které už v kolekci jsou (index z doby před deduplikací), jako kanonické."""
+        with self._lock:
+            for chunk_id, text, meta in zip(ids, chunks, metadatas):
+                self._pridej_kanonicky(chunk_id, meta, text, podpis(text))
+            self._conn.commit()
+
+    def smaz_soubor(self, soubor: str) -> list[str]:
+        """
+        Odstraní podpisy i duplikáty souboru. Vrací kanonické chunky jiných souborů,
+        kterým ubyl zdroj (je potřeba přepsat jejich "dalsi_zdroje").
+        """
+        with self._lock:
+            dotcene = [r[0] for r in self._conn.execute(
+                "SELECT DISTINCT kanonicky_id FROM duplikaty WHERE soubor = ? "
+                "AND kanonicky_id NOT IN (SELECT chunk_id FROM podpisy WHERE soubor = ?)",
+                (soubor, soubor),
+            )]
+            self._conn.execute(
+                "DELETE FROM pasma WHERE chunk_id IN (SELECT chunk_id FROM podpisy WHERE soubor = ?)", (soubor,)
+            )
+            # Duplikáty ukazující na chunky souboru zmizí s ním; jejich soubory přeindexuje prepare_db.py
+            self._conn.execute(
+                "DELETE FROM duplikaty WHERE soubor = ? OR kanonicky_id IN (SELECT chunk_id FROM podpisy WHERE soubor = ?)",
+                (soubor, soubor),
+            )
+            self._conn.execute("DELETE FROM podpisy WHERE soubor = ?", (soubor,))
+            self._conn.commit()
+        return dotcene
+
+    # === Čtení ===
+    def dalsi_zdroje(self, kanonicky_id: str) -> list[dict]:
+        with self._lock:
+            radky = self._conn.execute(
+                "SELECT zdroj FROM duplikaty WHERE kanonicky_id = ? ORDER BY soubor, chunk_id", (kanonicky_id,)
+            ).fetchall()
+        return [json.loads(r[0]) for r in radky]
+
+    def zavislosti(self, soubor: str) -> list[str]:
+        """Soubory, jejichž chunky jsou kanonické pro duplikáty ze `soubor` (bez něj samotného)."""
+        with self._lock:
+            radky = self._conn.execute(
+                "SELECT DISTINCT p.soubor FROM duplikaty d JOIN podpisy p ON p.chunk_id = d.kanonicky_id "
+                "WHERE d.soubor = ? AND p.soubor != ?",
+                (soubor, soubor),
+            ).fetchall()
+        return sorted(r[0] for r in radky)
+
+    def statistiky(self) -> dict:
+        with self._lock:
+            kanonickych = self._conn.execute("SELECT COUNT(*) FROM podpisy").fetchone()[0]
+            duplikatu = self._conn.execute("SELECT COUNT(*) FROM duplikaty").fetchone()[0]
+        celkem = kanonickych + duplikatu
+        return {
+            "chunku_celkem": celkem,
+            "chunku_v_indexu": kanonickych,
+            "sloucenych": duplikatu,
+            "uspora": round(duplikatu / celkem, 4) if celkem else 0.0,
+        }
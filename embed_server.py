@@ -0,0 +1,57 @@
+"""
+Sdílená embedding služba pro všechny workery aplikace.
+
+Spouští ji proces "embed" v Procfile (jedna instance na stroj, port EMBED_PORT, výchozí 8001):
+    uvicorn embed_server:app --host 127.0.0.1 --port 8001
+Proces "web" v Procfile na ni míří přes EMBED_SERVICE_URL=http://127.0.0.1:8001.
+Backend modelu se volí stejně jako v aplikaci (EMBED_BACKEND, EMBED_ONNX_FILE).
+"""
+import os
+import threading
+
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from dotenv import load_dotenv
+
+from embeddings import vytvor_lokalni_enkoder
+
+load_dotenv()
+
+app = FastAPI()
+enkoder = vytvor_lokalni_enkoder()
+ENCODE_BATCH = int(os.getenv("EMBED_BATCH", "32"))
+pripraveno = threading.Event()
+
+
+class Pozadavek(BaseModel):
+    texty: list[str]
+    normalizovat: bool = False
+
+
+def zahrej():
+    # Načtení modelu + jedno kódování, aby první skutečný dotaz neplatil inicializaci
+    enkoder.encode(["query: zahřátí modelu"])
+    pripraveno.set()
+    print("✅ Embedding model připraven")
+
+
+@app.on_event("startup")
+async def startup():
+    threading.Thread(target=zahrej, daemon=True).start()
+
+
+@app.post("/encode")
+async def encode(pozadavek: Pozadavek):
+    vektory = await run_in_threadpool(
+        enkoder.encode, pozadavek.texty, ENCODE_BATCH, pozadavek.normalizovat
+    )
+    return {"vektory": vektory.tolist()}
+
+
+@app.get("/ready")
+async def ready():
+    if not pripraveno.is_set():
+        return JSONResponse({"pripraveno": False}, status_code=503)
+    return {"pripraveno": True, **enkoder.popis()}
@@ -0,0 +1,143 @@
+import os
+import re
+import zlib
+import threading
+import unicodedata
+import importlib.util
+import numpy as np
+import httpx
+
+from chunker import odhadni_tokeny
+
+EMBED_MODEL = "intfloat/multilingual-e5-large"
+
+
+class LokalniEnkoder:
+    """
+    SentenceTransformer načtený až při prvním použití (nebo při warm-upu).
+    backend="onnx" použije ONNX Runtime na CPU (sentence-transformers + optimum);
+    onnx_soubor vybere konkrétní export, např. kvantizovaný "onnx/model_qint8_avx512_vnni.onnx".
+    """
+
+    def __init__(self, nazev_modelu: str = EMBED_MODEL, backend: str = "torch", onnx_soubor: str | None = None):
+        self.nazev_modelu = nazev_modelu
+        self.backend = backend
+        self.onnx_soubor = onnx_soubor
+        # Bez optimum by ONNX backend spadl až na ImportError u prvního dotazu – raději hned při startu
+        if backend == "onnx" and importlib.util.find_spec("optimum") is None:
+            raise RuntimeError("EMBED_BACKEND=onnx vyžaduje balíček optimum (pip install \"optimum[onnxruntime]\")")
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _nacti(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                kwargs = {}
+                if self.backend == "onnx":
+                    kwargs["backend"] = "onnx"
+                    if self.onnx_soubor:
+                        kwargs["model_kwargs"] = {"file_name": self.onnx_soubor}
+                self._model = SentenceTransformer(self.nazev_modelu, **kwargs)
+        return self._model
+
+    def encode(self, texty, batch_size: int = 32, normalize_embeddings: bool = False, show_progress_bar: bool = False):
+        return self._nacti().encode(
+            texty,
+            batch_size=batch_size,
+            normalize_embeddings=normalize_embeddings,
+            show_progress_bar=show_progress_bar,
+        )
+
+    def pocet_tokenu(self, text: str) -> int:
+        """Tokeny podle tokenizeru modelu – rozpočet chunků v prepare_db.py."""
+        return len(self._nacti().tokenizer.tokenize(text))
+
+    def pripraven(self) -> bool:
+        return self._model is not None
+
+    def popis(self) -> dict:
+        return {"typ": "lokalni", "model": self.nazev_modelu, "backend": self.backend, "nacteno": self.pripraven()}
+
+
+class VzdalenyEnkoder:
+    """
+    Enkodér přes sdílenou embedding službu (embed_server.py). Workery aplikace pak
+    model vůbec nenačítají – v paměti je jen jedna kopie ve službě.
+    """
+
+    def __init__(self, url: str, timeout: float = 30.0):
+        self.url = url.rstrip("/")
+        self._http = httpx.Client(timeout=timeout)
+
+    def encode(self, texty, batch_size: int = 32, normalize_embeddings: bool = False, show_progress_bar: bool = False):
+        jeden = isinstance(texty, str)
+        response = self._http.post(
+            f"{self.url}/encode",
+            json={"texty": [texty] if jeden else list(texty), "normalizovat": normalize_embeddings},
+        )
+        response.raise_for_status()
+        vektory = np.asarray(response.json()["vektory"], dtype=np.float32)
+        return vektory[0] if jeden else vektory
+
+    def pripraven(self) -> bool:
+        try:
+            return self._http.get(f"{self.url}/ready").status_code == 200
+        except httpx.HTTPError:
+            return False
+
+    def popis(self) -> dict:
+        return {"typ": "sluzba", "url": self.url, "nacteno": self.pripraven()}
+
+
+class StubEnkoder:
+    """
+    Deterministický enkodér bez modelu (zátěžové testy, vývoj): slova bez diakritiky
+    hashovaná do pevné dimenze. Texty se společnými slovy jsou si podobné, takže
+    vyhledávání i rerank vracejí smysluplné pořadí, jen bez sémantiky.
+    """
+
+    def __init__(self, dimenze: int = 384):
+        self.dimenze = dimenze
+
+    def _vektor(self, text: str) -> np.ndarray:
+        text = unicodedata.normalize("NFD", text.lower())
+        text = "".join(c for c in text if unicodedata.category(c) != "Mn")
+        vektor = np.zeros(self.dimenze, dtype=np.float32)
+        for slovo in re.findall(r"\w+", text.removeprefix("query: ").removeprefix("passage: ")):
+            vektor[zlib.crc32(slovo.encode()) % self.dimenze] += 1.0
+        norma = np.linalg.norm(vektor)
+        return vektor / norma if norma else vektor
+
+    def encode(self, texty, batch_size: int = 32, normalize_embeddings: bool = False, show_progress_bar: bool = False):
+        if isinstance(texty, str):
+            return self._vektor(texty)
+        return np.stack([self._vektor(text) for text in texty]) if texty else np.zeros((0, self.dimenze), np.float32)
+
+    def pocet_tokenu(self, text: str) -> int:
+        return odhadni_tokeny(text)
+
+    def pripraven(self) -> bool:
+        return True
+
+    def popis(self) -> dict:
+        return {"typ": "stub", "dimenze": self.dimenze, "nacteno": True}
+
+
+def vytvor_lokalni_enkoder() -> LokalniEnkoder | StubEnkoder:
+    """EMBED_BACKEND = "torch" | "onnx" | "stub" (bez modelu), EMBED_ONNX_FILE = volitelný ONNX soubor."""
+    if os.getenv("EMBED_BACKEND") == "stub":
+        return StubEnkoder()
+    return LokalniEnkoder(
+        os.getenv("EMBED_MODEL", EMBED_MODEL),
+        backend=os.getenv("EMBED_BACKEND", "torch"),
+        onnx_soubor=os.getenv("EMBED_ONNX_FILE") or None,
+    )
+
+
+def vytvor_enkoder():
+    """EMBED_SERVICE_URL → sdílená služba, jinak lokální model."""
+    url = os.getenv("EMBED_SERVICE_URL")
+    if url:
+        return VzdalenyEnkoder(url, timeout=float(os.getenv("EMBED_SERVICE_TIMEOUT", "30")))
+    return vytvor_lokalni_enkoder()
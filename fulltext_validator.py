@@ -18,8 +18,19 @@ def extrahuj_banku(meta: dict) -> str:
 def analyzuj_banky_z_fulltextu(metadatas: list[dict]) -> set[str]:
     return {extrahuj_banku(meta) for meta in metadatas}
 
-def analyzuj_relevantni_banky_fulltextem(collection, hledane_slovo: str) -> set:
-    """Vrátí množinu bank (nebo názvů dokumentů), které obsahují hledané slovo."""
+def analyzuj_relevantni_banky_fulltextem(collection, hledane_slovo: str, index=None) -> set:
+    """
+    Vrátí množinu bank (nebo názvů dokumentů), které obsahují hledané slovo.
+    S invertovaným indexem (inverted_index.InvertovanyIndex) jde o vyhledání termů
+    bez diakritiky místo průchodu celou kolekcí.
+    """
+    if index is not None:
+        banky = set()
+        for banka, soubor in index.soubory_s_terminem(hledane_slovo):
+            print(f"✅ Fulltext: {banka} – dokument: {soubor}")
+            banky.add(banka.lower())
+        return banky
+
     vsechny = collection.get(limit=None)
     banky = set()
 
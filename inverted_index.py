@@ -0,0 +1,145 @@
+import os
+import re
+import math
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+TOKEN_RE = re.compile(r"\w+")
+DELKA_KMENE = 6    # čeština: prefix slova jako hrubý kmen („výživné“, „výživného“ → „vyzivn“)
+
+
+def tokenizuj(text: str) -> list[str]:
+    """Tokeny bez diakritiky, malými písmeny, zkrácené na prefix; jednoznakové se zahazují."""
+    text = unicodedata.normalize("NFD", text.lower())
+    text = "".join(c for c in text if unicodedata.category(c) != "Mn")
+    return [t[:DELKA_KMENE] for t in TOKEN_RE.findall(text) if len(t) > 1]
+
+
+class InvertovanyIndex:
+    """
+    Perzistentní invertovaný index nad stejnými ID chunků jako kolekce v ChromaDB (SQLite).
+    Plní ho prepare_db.py při indexaci, aplikace z něj počítá BM25 bez procházení korpusu.
+    """
+
+    def __init__(self, cesta: str, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(cesta) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(cesta, check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS chunky (
+                chunk_id TEXT PRIMARY KEY,
+                soubor TEXT NOT NULL,
+                banka TEXT NOT NULL,
+                delka INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tf INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_postings_term ON postings(term);
+            CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings(chunk_id);
+            CREATE INDEX IF NOT EXISTS idx_chunky_soubor ON chunky(soubor);
+            """
+        )
+        self._conn.commit()
+
+    # === Zápis (prepare_db.py) ===
+    def pridej(self, ids, texty, metadatas):
+        chunky, postings = [], []
+        for chunk_id, text, meta in zip(ids, texty, metadatas):
+            tokeny = tokenizuj(text)
+            chunky.append((chunk_id, meta.get("document_source", "?"), meta.get("banka", "Neznámá banka"), len(tokeny)))
+            postings.extend((term, chunk_id, tf) for term, tf in Counter(tokeny).items())
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO chunky VALUES (?, ?, ?, ?)", chunky)
+            self._conn.executemany("INSERT INTO postings VALUES (?, ?, ?)", postings)
+            self._conn.commit()
+
+    def smaz_soubor(self, soubor: str):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM postings WHERE chunk_id IN (SELECT chunk_id FROM chunky WHERE soubor = ?)", (soubor,)
+            )
+            self._conn.execute("DELETE FROM chunky WHERE soubor = ?", (soubor,))
+            self._conn.commit()
+
+    def pocet_chunku(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunky").fetchone()[0]
+
+    # === Čtení (aplikace) ===
+    def _nacti_statistiky(self):
+        # Index může mezitím přepsat prepare_db.py – N a průměrnou délku ověřujeme při každém dotazu
+        n, soucet = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(delka), 0) FROM chunky").fetchone()
+        return n, (soucet / n) if n else 0.0
+
+    def hledej(self, dotaz: str, soubory: set | None = None) -> dict:
+        """
+        BM25 skóre všech chunků, které obsahují aspoň jeden term dotazu
+        (volitelně jen ze zadaných souborů, např. platných vydání).
+        Vrací {chunk_id: (skore, banka)}.
+        """
+        termy = set(tokenizuj(dotaz))
+        skore = defaultdict(float)
+        banky = {}
+        with self._lock:
+            n, prumerna_delka = self._nacti_statistiky()
+            if not n:
+                return {}
+            for term in termy:
+                radky = self._conn.execute(
+                    "SELECT p.chunk_id, p.tf, c.delka, c.banka, c.soubor FROM postings p "
+                    "JOIN chunky c ON c.chunk_id = p.chunk_id WHERE p.term = ?",
+                    (term,),
+                ).fetchall()
+                if not radky:
+                    continue
+                idf = math.log(1 + (n - len(radky) + 0.5) / (len(radky) + 0.5))
+                for chunk_id, tf, delka, banka, soubor in radky:
+                    if soubory is not None and soubor not in soubory:
+                        continue
+                    norma = tf + self.k1 * (1 - self.b + self.b * delka / prumerna_delka)
+                    skore[chunk_id] += idf * tf * (self.k1 + 1) / norma
+                    banky[chunk_id] = banka
+        return {chunk_id: (s, banky[chunk_id]) for chunk_id, s in skore.items()}
+
+    def hledej_po_bankach(self, dotaz: str, k: int, soubory: set | None = None) -> dict:
+        """Top-k chunk ID podle BM25 pro každou banku: {banka: [chunk_id, ...]}."""
+        po_bankach = defaultdict(list)
+        for chunk_id, (s, banka) in self.hledej(dotaz, soubory).items():
+            po_bankach[banka].append((s, chunk_id))
+        return {
+            banka: [chunk_id for _, chunk_id in sorted(zasahy, reverse=True)[:k]]
+            for banka, zasahy in po_bankach.items()
+        }
+
+    def soubory_s_terminem(self, slovo: str) -> list[tuple[str, str]]:
+        """(banka, soubor) pro všechny dokumenty, které obsahují všechny termy slova."""
+        termy = set(tokenizuj(slovo))
+        if not termy:
+            return []
+        with self._lock:
+            radky = self._conn.execute(
+                f"SELECT c.banka, c.soubor FROM postings p JOIN chunky c ON c.chunk_id = p.chunk_id "
+                f"WHERE p.term IN ({','.join('?' * len(termy))}) "
+                f"GROUP BY p.chunk_id HAVING COUNT(DISTINCT p.term) = ?",
+                (*termy, len(termy)),
+            ).fetchall()
+        return sorted(set(radky))
+
+
+def reciprocal_rank_fusion(*poradi: list, k: int = 60) -> list:
+    """Sloučí několik seřazených seznamů ID do jednoho (RRF: součet 1 / (k + pořadí))."""
+    skore = defaultdict(float)
+    for seznam in poradi:
+        for i, polozka in enumerate(seznam):
+            skore[polozka] += 1.0 / (k + i + 1)
+    # Při shodě skóre rozhoduje pořadí prvního seznamu (sorted je stabilní)
+    return sorted(skore, key=lambda polozka: -skore[polozka])
@@ -0,0 +1,348 @@
+import os
+import re
+import json
+import time
+import random
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+
+from metrics import registr
+from prompts import pocet_tokenu
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")                  # "openai", nebo "stub" = deterministické odpovědi bez sítě
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))               # sekundy na jeden pokus (čtení), spojení 5 s
+LLM_POKUSU = int(os.getenv("LLM_MAX_ATTEMPTS", "4"))              # včetně prvního
+LLM_SPOJENI = int(os.getenv("LLM_POOL_SIZE", "32"))               # keep-alive spojení k API
+LLM_RPM = int(os.getenv("LLM_RPM", "5000"))                       # limit požadavků za minutu (0 = bez limitu)
+LLM_TPM = int(os.getenv("LLM_TPM", "800000"))                     # limit tokenů za minutu (0 = bez limitu)
+LLM_ODHAD_ODPOVEDI = int(os.getenv("LLM_EXPECTED_COMPLETION", "600"))  # tokeny odpovědi do rezervace před voláním
+JISTIC_PRAH = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))        # po kolika selháních za sebou se jistič rozpojí
+JISTIC_PAUZA = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))     # sekundy, než se zkusí další volání
+STUB_LATENCE = float(os.getenv("LLM_STUB_LATENCY_MS", "0")) / 1000
+BACKOFF_ZAKLAD = 0.5
+BACKOFF_MAX = 20.0
+
+POKUSY = registr.citac(
+    "gepard_llm_pokusy_total", "Jednotlivé pokusy o volání LLM podle modelu a výsledku", ("model", "vysledek")
+)
+CEKANI_NA_LIMIT = registr.citac(
+    "gepard_llm_limit_cekani_seconds_total", "Čekání na lokální limity požadavků a tokenů", ("limit",)
+)
+DOBA_POKUSU = registr.histogram(
+    "gepard_llm_pokus_seconds", "Doba jednoho pokusu o volání LLM", ("model",)
+)
+
+
+class LLMNedostupne(Exception):
+    """Jistič je rozpojený – volání se vůbec neodeslalo."""
+
+
+# === Limity a jistič ===
+class TokenovyKyblik:
+    """
+    Token bucket s kapacitou a doplňováním „za minutu“. Rezervace se provede hned (stav může
+    jít do mínusu) a volající pak počká na vyrovnání – čekající jsou tak obslouženi v pořadí
+    příchodu bez zámku (vše běží v jednom event loopu).
+    """
+
+    def __init__(self, nazev: str, za_minutu: int):
+        self.nazev = nazev
+        self.za_minutu = za_minutu
+        self._rychlost = za_minutu / 60.0
+        self._stav = float(za_minutu)
+        self._cas = time.monotonic()
+
+    def _dopln(self):
+        ted = time.monotonic()
+        self._stav = min(self.za_minutu, self._stav + (ted - self._cas) * self._rychlost)
+        self._cas = ted
+
+    async def vezmi(self, n: float = 1):
+        if self.za_minutu <= 0:
+            return
+        n = min(n, self.za_minutu)
+        self._dopln()
+        self._stav -= n
+        if self._stav < 0:
+            cekani = -self._stav / self._rychlost
+            CEKANI_NA_LIMIT.pricti(cekani, limit=self.nazev)
+            try:
+                await asyncio.sleep(cekani)
+            except asyncio.CancelledError:
+                self._stav += n
+                raise
+
+    def uprav(self, rozdil: float):
+        """Doúčtování po volání: skutečná spotřeba minus rezervace (záporné = vrácení)."""
+        if self.za_minutu > 0:
+            self._dopln()
+            self._stav = min(self.za_minutu, self._stav - rozdil)
+
+
+class Jistic:
+    """
+    Circuit breaker: po `prah` selháních za sebou se volání `pauza` sekund vůbec neposílají.
+    Pak projde jedno zkušební; když uspěje, jistič se sepne, jinak se znovu rozpojí.
+    """
+
+    def __init__(self, prah: int = JISTIC_PRAH, pauza: float = JISTIC_PAUZA):
+        self.prah = prah
+        self.pauza = pauza
+        self.selhani = 0
+        self._rozpojeno_do = 0.0
+        self._zkousi_se = False
+
+    @property
+    def stav(self) -> str:
+        if self.selhani < self.prah:
+            return "sepnuty"
+        return "rozpojeny" if time.monotonic() < self._rozpojeno_do else "zkusebni"
+
+    def povol(self):
+        stav = self.stav
+        if stav == "rozpojeny" or (stav == "zkusebni" and self._zkousi_se):
+            raise LLMNedostupne(f"LLM je dočasně nedostupné (jistič rozpojen po {self.selhani} selháních)")
+        if stav == "zkusebni":
+            self._zkousi_se = True
+
+    def uspech(self):
+        self.selhani = 0
+        self._zkousi_se = False
+
+    def zruseno(self):
+        """Zkušební volání bylo zrušeno dřív, než se ukázalo, jestli API odpovídá."""
+        self._zkousi_se = False
+
+    def selhalo(self):
+        self.selhani += 1
+        self._zkousi_se = False
+        if self.selhani >= self.prah:
+            self._rozpojeno_do = time.monotonic() + self.pauza
+
+
+# === Backendy ===
+class OpenAIBackend:
+    """AsyncOpenAI nad sdíleným httpx poolem s keep-alive; vlastní opakování SDK je vypnuté (řeší KlientLLM)."""
+
+    def __init__(self, spojeni: int = LLM_SPOJENI, timeout: float = LLM_TIMEOUT):
+        self.spojeni = spojeni
+        self.timeout = timeout
+        self._klient = None
+
+    def _ziskej_klienta(self):
+        # Líně – import aplikace nesmí padat bez OPENAI_API_KEY
+        if self._klient is None:
+            import openai
+            self._klient = openai.AsyncOpenAI(
+                max_retries=0,
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=self.spojeni, max_keepalive_connections=self.spojeni, keepalive_expiry=60
+                    ),
+                    timeout=httpx.Timeout(self.timeout, connect=5.0),
+                ),
+            )
+        return self._klient
+
+    async def vytvor(self, messages, model: str, on_token, parametry: dict) -> tuple:
+        """(text, usage); u streamu si usage vyžádáme v posledním chunku."""
+        if on_token is None:
+            response = await self._ziskej_klienta().chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0,
+                **parametry
+            )
+            return response.choices[0].message.content, response.usage
+
+        stream = await self._ziskej_klienta().chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=0,
+            stream=True,
+            stream_options={"include_usage": True},
+            **parametry
+        )
+        casti, usage = [], None
+        async for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                casti.append(delta)
+                await on_token(delta)
+        return "".join(casti), usage
+
+    def je_docasna_chyba(self, chyba: Exception) -> bool:
+        import openai
+        if isinstance(chyba, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError)):
+            return True
+        return isinstance(chyba, openai.APIStatusError) and chyba.status_code >= 500
+
+    def retry_after(self, chyba: Exception) -> float | None:
+        hlavicky = getattr(getattr(chyba, "response", None), "headers", None) or {}
+        try:
+            if "retry-after-ms" in hlavicky:
+                return float(hlavicky["retry-after-ms"]) / 1000
+            if "retry-after" in hlavicky:
+                return float(hlavicky["retry-after"])
+        except ValueError:
+            pass
+        return None
+
+
+BANKA_RE = re.compile(r"pro banku (.+?):\n")
+CITACE_RE = re.compile(r"Umístění: (\(dokument: ([^,]*), strana: ([^,]*), kapitola: ([^)]*)\))")
+
+
+class StubBackend:
+    """
+    Deterministické odpovědi bez sítě (vývoj, testy, zátěžové testy): první úryvek z promptu
+    a jeho citace ve formátu, jaký vrací model. Volitelná latence LLM_STUB_LATENCY_MS.
+    """
+
+    def __init__(self, latence: float = STUB_LATENCE):
+        self.latence = latence
+
+    @staticmethod
+    def _prvni_uryvek(text: str) -> tuple[str, str]:
+        """První věta prvního úryvku a jeho citace."""
+        uryvek, _, zbytek = text.lstrip().partition("\nUmístění: ")
+        citace = CITACE_RE.search("Umístění: " + zbytek) if zbytek else None
+        veta = re.split(r"(?<=[.!?])\s", " ".join(uryvek.split()), maxsplit=1)[0][:300]
+        return veta, citace.group(1) if citace else ""
+
+    def _odpoved(self, messages, parametry: dict) -> str:
+        uzivatel = messages[-1]["content"]
+        if parametry.get("response_format", {}).get("type") == "json_object":
+            banky = []
+            for blok in uzivatel.split("## Banka: ")[1:]:
+                nazev, _, uryvky = blok.partition("\n\n")
+                veta, _ = self._prvni_uryvek(uryvky)
+                citace = [
+                    {"dokument": d, "strana": s, "kapitola": k} for _, d, s, k in CITACE_RE.findall(uryvky)[:1]
+                ]
+                banky.append({"banka": nazev.strip(), "podminky": [veta] if veta else [], "citace": citace})
+            return json.dumps({"banky": banky}, ensure_ascii=False)
+        if "\n\nÚryvky:\n\n" in uzivatel:
+            veta, citace = self._prvni_uryvek(uzivatel.split("\n\nÚryvky:\n\n", 1)[1])
+            return f"{veta}\nUmístění: {citace}"
+        banka = BANKA_RE.search(uzivatel)
+        veta, citace = self._prvni_uryvek(uzivatel[banka.end():] if banka else uzivatel)
+        radky = [f"### 🏦 {banka.group(1) if banka else 'Neznámá banka'}", "", "**Podmínky:**", "", f"- {veta}"]
+        if citace:
+            radky += ["", f"📄 Citace: {citace}"]
+        return "\n".join(radky)
+
+    async def vytvor(self, messages, model: str, on_token, parametry: dict) -> tuple:
+        if self.latence:
+            await asyncio.sleep(self.latence)
+        text = self._odpoved(messages, parametry)
+        if on_token is not None:
+            for slovo in re.findall(r"\S+\s*", text):
+                await on_token(slovo)
+        usage = SimpleNamespace(
+            prompt_tokens=sum(pocet_tokenu(m["content"]) for m in messages), completion_tokens=pocet_tokenu(text)
+        )
+        return text, usage
+
+    def je_docasna_chyba(self, chyba: Exception) -> bool:
+        return False
+
+    def retry_after(self, chyba: Exception) -> float | None:
+        return None
+
+
+# === Klient ===
+class KlientLLM:
+    """
+    Společná vrstva pro všechna volání LLM: lokální limity požadavků a tokenů za minutu,
+    timeout na pokus, opakování dočasných chyb (429, 5xx, timeout, spojení) s exponenciálním
+    backoffem a jitterem (Retry-After má přednost) a jistič proti zahlcení nedostupného API.
+    Streamované volání se opakuje jen tehdy, když ještě neodešel žádný token.
+    """
+
+    def __init__(self, backend, rpm: int = LLM_RPM, tpm: int = LLM_TPM, pokusu: int = LLM_POKUSU,
+                 timeout: float = LLM_TIMEOUT, jistic: Jistic | None = None):
+        self.backend = backend
+        self.pozadavky = TokenovyKyblik("pozadavky", rpm)
+        self.tokeny = TokenovyKyblik("tokeny", tpm)
+        self.pokusu = max(1, pokusu)
+        self.timeout = timeout
+        self.jistic = jistic or Jistic()
+
+    def _cekani(self, pokus: int, chyba: Exception) -> float:
+        retry_after = self.backend.retry_after(chyba)
+        backoff = random.uniform(0, min(BACKOFF_MAX, BACKOFF_ZAKLAD * 2 ** pokus))
+        return max(backoff, retry_after or 0.0)
+
+    async def vytvor(self, messages, model: str, on_token=None, **parametry) -> tuple:
+        """(text, usage) – stejné rozhraní jako backend, s limity, opakováním a jističem."""
+        odhad = sum(pocet_tokenu(m["content"]) for m in messages) + parametry.get("max_tokens", LLM_ODHAD_ODPOVEDI)
+        odeslano = False
+
+        async def sleduj(token):
+            nonlocal odeslano
+            odeslano = True
+            await on_token(token)
+
+        for pokus in range(self.pokusu):
+            self.jistic.povol()
+            await self.pozadavky.vezmi(1)
+            await self.tokeny.vezmi(odhad)
+            start = time.perf_counter()
+            try:
+                text, usage = await asyncio.wait_for(
+                    self.backend.vytvor(messages, model, sleduj if on_token else None, parametry),
+                    # Celý stream může trvat déle; u něj hlídá prodlevy mezi chunky read timeout httpx
+                    timeout=None if on_token else self.timeout,
+                )
+            except asyncio.CancelledError:
+                self.jistic.zruseno()
+                raise
+            except Exception as e:
+                DOBA_POKUSU.zaznamenej(time.perf_counter() - start, model=model)
+                # Neúspěšný pokus skutečnou spotřebu nevrací – rezervaci uvolníme pro další pokus i ostatní
+                self.tokeny.uprav(-odhad)
+                docasna = isinstance(e, asyncio.TimeoutError) or self.backend.je_docasna_chyba(e)
+                POKUSY.pricti(model=model, vysledek=type(e).__name__ if docasna else "chyba")
+                if not docasna:
+                    # API odpovědělo (např. 400) – je dostupné, opakovat ale nemá smysl
+                    self.jistic.uspech()
+                    raise
+                self.jistic.selhalo()
+                if odeslano or pokus == self.pokusu - 1:
+                    raise
+                cekani = self._cekani(pokus, e)
+                print(f"🔁 LLM {model}: {type(e).__name__}, pokus {pokus + 2}/{self.pokusu} za {cekani:.1f} s")
+                await asyncio.sleep(cekani)
+                continue
+
+            DOBA_POKUSU.zaznamenej(time.perf_counter() - start, model=model)
+            POKUSY.pricti(model=model, vysledek="ok")
+            self.jistic.uspech()
+            if usage is not None:
+                self.tokeny.uprav(usage.prompt_tokens + usage.completion_tokens - odhad)
+            return text, usage
+
+    def zavolej_sync(self, messages, model: str, **parametry) -> str:
+        """Pro skripty bez event loopu (main_gpt.py)."""
+        text, _ = asyncio.run(self.vytvor(messages, model, **parametry))
+        return text
+
+    def popis(self) -> dict:
+        return {
+            "backend": "stub" if isinstance(self.backend, StubBackend) else "openai",
+            "jistic": self.jistic.stav,
+            "rpm": self.pozadavky.za_minutu,
+            "tpm": self.tokeny.za_minutu,
+        }
+
+
+def vytvor_klienta(backend: str = LLM_BACKEND) -> KlientLLM:
+    """LLM_BACKEND=stub → deterministické odpovědi bez sítě, cokoli jiného → OpenAI."""
+    return KlientLLM(StubBackend() if backend == "stub" else OpenAIBackend())
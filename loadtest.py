@@ -0,0 +1,510 @@
+"""
+Zátěžový test celé aplikace: app.main:app v uvicornu (jako v Procfile) nad fixturou
+ChromaDB, se stub LLM (llm_client.py, LLM_BACKEND=stub) s nastavitelnou latencí
+a stub nebo malým enkodérem. Dotazy se losují z feedback.csv, souběžnost se postupně
+zvyšuje; pro každou úroveň se měří propustnost, latence, paměť workerů a určí se bod
+saturace. Výsledek je JSON, --porovnat ho srovná s během předchozí verze.
+
+    python loadtest.py --soubeznosti 1,2,4,8,16,32 --doba 20 --llm-latence-ms 1500
+    python loadtest.py --porovnat loadtest_predchozi.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+
+import httpx
+
+from benchmark import FEEDBACK_PATH, nacti_feedback_zaznamy, percentily
+from verze_dokumentu import VERZE_PLATNOSTI
+
+KOREN = os.path.dirname(os.path.abspath(__file__))
+KOLEKCE = "hypoteky_all"
+UZIVATEL, HESLO = "loadtest", "loadtest"
+
+# Dokumenty fixtury – názvy a banky jako z prepare_db.get_banka_from_filename
+DOKUMENTY = {
+    "Hypoteky_KB.pdf": "Komerční banka",
+    "Hypoteky_CS.pdf": "Česká spořitelna",
+    "Hypoteky_CSOB.pdf": "ČSOB",
+    "Hypoteky_RB.pdf": "Raiffeisen",
+    "Hypoteky_UCB.pdf": "UniCredit",
+    "Hypoteky_Moneta.pdf": "Moneta",
+    "Hypoteky_mBank.pdf": "mBank",
+    "Hypoteky_Oberbank.pdf": "Oberbank",
+}
+ENKODERY = {
+    "stub": {"EMBED_BACKEND": "stub"},                           # bez modelu – měří se jen aplikace
+    "maly": {"EMBED_MODEL": "intfloat/multilingual-e5-small"},   # stejná rodina e5 (prefixy query:/passage:)
+    "plny": {},                                                  # produkční multilingual-e5-large
+}
+SOUBEZNOSTI = "1,2,4,8,16,32"
+PRAH_NARUSTU = 1.10   # další úroveň musí zvýšit propustnost aspoň o 10 %, jinak je služba saturovaná
+PRAH_CHYB = 0.01      # víc než 1 % chybných nebo odmítnutých (503) dotazů = saturace
+TOLERANCE = 0.20      # --porovnat: horší propustnost / p95 o víc než 20 % = regrese
+
+# === Fixtura ===
+def vety_z_odpovedi(zaznamy: list[dict]) -> list[str]:
+    """Věty z odpovědí ve feedback.csv (bez citací) – text chunků ve slovníku skutečných metodik."""
+    vety = []
+    for zaznam in zaznamy:
+        text = re.sub(r"\s*\((?:dokument|zdroj):[^)]*\)", "", zaznam.get("answer") or "")
+        for veta in re.split(r"(?<=[.!?])\s+", " ".join(text.split())):
+            if len(veta) > 30 and veta not in vety:
+                vety.append(veta)
+    return vety
+
+
+def vytvor_fixturu(adresar: str, zaznamy: list[dict], chunku: int, seed: int, enkoder_nazev: str) -> dict:
+    """
+    Pracovní adresář serveru: chroma_db s kolekcí, BM25 indexem, NumPy exportem, prázdným indexem tabulek
+    a manifestem s platnostmi vydání (jako po prepare_db.py – server tedy filtruje podle platnosti
+    a zkouší tabulkový lookup), prázdné metodiky_bank a odkazy na app/ a data/ z repozitáře.
+    Stejná fixtura (počet chunků, seed, enkodér) se při dalším běhu použije znovu.
+    """
+    parametry = {"chunku": chunku, "seed": seed, "enkoder": enkoder_nazev}
+    chroma_path = os.path.join(adresar, "chroma_db")
+    manifest_path = os.path.join(chroma_path, f"manifest_{KOLEKCE}.json")
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("fixtura") == parametry and manifest.get("verze_platnosti") == VERZE_PLATNOSTI:
+            print(f"♻️ Používám existující fixturu v {adresar}", file=sys.stderr)
+            return manifest
+
+    import chromadb
+    from embeddings import vytvor_lokalni_enkoder
+    from inverted_index import InvertovanyIndex
+    from tabulky import TabulkovyIndex
+    from vector_store import exportuj_z_chromy
+    from verze_dokumentu import urci_platnosti, platnost_chunku
+
+    os.makedirs(os.path.join(adresar, "metodiky_bank"), exist_ok=True)
+    for nazev in ("app", "data"):
+        cil = os.path.join(adresar, nazev)
+        if not os.path.exists(cil):
+            os.symlink(os.path.join(KOREN, nazev), cil)
+
+    vety = vety_z_odpovedi(zaznamy)
+    if not vety:
+        raise RuntimeError("feedback.csv neobsahuje odpovědi, ze kterých by šla vytvořit fixtura")
+    rng = random.Random(seed)
+    soubory = list(DOKUMENTY)
+    platnosti = urci_platnosti(soubory)
+    ids, texty, metadatas = [], [], []
+    for i in range(chunku):
+        fname = soubory[i % len(soubory)]
+        cast = i // len(soubory)
+        ids.append(f"{fname}_{cast}")
+        texty.append(" ".join(rng.sample(vety, min(len(vety), rng.randint(3, 6)))))
+        metadatas.append({
+            "document_source": fname,
+            "banka": DOKUMENTY[fname],
+            "kapitola": "?",
+            "nadpis": "",
+            "cast": cast + 1,
+            "strana": cast // 3 + 1,
+            "strana_do": cast // 3 + 1,
+        })
+        metadatas[-1]["platnost_od"], metadatas[-1]["platnost_do"] = platnost_chunku(metadatas[-1], platnosti)
+
+    start = time.perf_counter()
+    enkoder = vytvor_lokalni_enkoder()
+    embeddings = enkoder.encode([f"passage: {text}" for text in texty], batch_size=32).tolist()
+
+    tabulky_path = os.path.join(chroma_path, f"tabulky_{KOLEKCE}.sqlite")
+    for cesta in (os.path.join(chroma_path, f"bm25_{KOLEKCE}.sqlite"), tabulky_path, manifest_path):
+        if os.path.isfile(cesta):
+            os.remove(cesta)
+    client = chromadb.PersistentClient(path=chroma_path)
+    if KOLEKCE in [c.name for c in client.list_collections()]:
+        client.delete_collection(KOLEKCE)
+    collection = client.create_collection(name=KOLEKCE)
+    for od in range(0, chunku, 1000):
+        collection.add(
+            ids=ids[od:od + 1000], documents=texty[od:od + 1000],
+            embeddings=embeddings[od:od + 1000], metadatas=metadatas[od:od + 1000],
+        )
+    InvertovanyIndex(os.path.join(chroma_path, f"bm25_{KOLEKCE}.sqlite")).pridej(ids, texty, metadatas)
+    # Prázdný index tabulek: aplikace ho otevře a každý dotaz projde lookupem, který nic nenajde (→ RAG)
+    TabulkovyIndex(tabulky_path)
+
+    verze = f"loadtest-{chunku}-{seed}-{enkoder_nazev}"
+    exportuj_z_chromy(collection, os.path.join(chroma_path, f"numpy_{KOLEKCE}"), verze)
+    manifest = {
+        "kolekce": KOLEKCE,
+        "index_verze": verze,
+        "fixtura": parametry,
+        "verze_platnosti": VERZE_PLATNOSTI,
+        "soubory": {
+            fname: {
+                "hash": None, "banka": banka,
+                "pocet_chunku": sum(1 for m in metadatas if m["document_source"] == fname),
+                **platnosti[fname],
+            }
+            for fname, banka in DOKUMENTY.items()
+        },
+    }
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    print(f"🧱 Fixtura: {chunku} chunků v {len(DOKUMENTY)} dokumentech za {time.perf_counter() - start:.1f} s", file=sys.stderr)
+    return manifest
+
+# === Server ===
+def volny_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spust_server(adresar: str, port: int, workers: int, env: dict) -> subprocess.Popen:
+    """Příkaz procesu web z Procfile, ale s enkodérem v procesu serveru; výstup jde do server.log ve fixtuře."""
+    with open(os.path.join(adresar, "server.log"), "ab") as log:
+        return subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--workers", str(workers)],
+            cwd=adresar, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+
+
+async def cekej_na_pripravenost(klient: httpx.AsyncClient, url: str, server: subprocess.Popen, timeout: float) -> dict:
+    """Čeká na /ready 200 (warm-up dokončen); vrací popis enkodéru a LLM klienta."""
+    konec = time.monotonic() + timeout
+    while time.monotonic() < konec:
+        if server.poll() is not None:
+            raise RuntimeError(f"server skončil s kódem {server.returncode} (viz server.log)")
+        try:
+            r = await klient.get(f"{url}/ready")
+            if r.status_code == 200:
+                return r.json()
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f"server nebyl připraven do {timeout:.0f} s (viz server.log)")
+
+
+def zastav_server(server: subprocess.Popen):
+    server.terminate()
+    try:
+        server.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+# === Paměť ===
+def potomci(pid: int) -> list[int]:
+    """PID procesu a všech jeho potomků (uvicorn --workers N spouští workery jako podprocesy)."""
+    rodice = {}
+    for polozka in os.listdir("/proc"):
+        if polozka.isdigit():
+            try:
+                with open(f"/proc/{polozka}/stat", "r") as f:
+                    # Název procesu je v závorkách a může obsahovat mezery – ppid je až za ním
+                    rodice[int(polozka)] = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+    vysledek, fronta = [], [pid]
+    while fronta:
+        p = fronta.pop()
+        vysledek.append(p)
+        fronta.extend(dite for dite, rodic in rodice.items() if rodic == p)
+    return vysledek
+
+
+def rss_mb(pid: int) -> float | None:
+    """Součet RSS serveru a workerů v MB z /proc; None mimo Linux."""
+    if not os.path.isdir("/proc"):
+        return None
+    celkem = 0
+    for p in potomci(pid):
+        try:
+            with open(f"/proc/{p}/status", "r") as f:
+                celkem += next((int(r.split()[1]) for r in f if r.startswith("VmRSS:")), 0)
+        except OSError:
+            continue
+    return round(celkem / 1024, 1)
+
+
+async def sleduj_pamet(pid: int, vzorky: list, interval: float = 0.5):
+    while True:
+        hodnota = await asyncio.to_thread(rss_mb, pid)
+        if hodnota is not None:
+            vzorky.append(hodnota)
+        await asyncio.sleep(interval)
+
+# === Zátěž ===
+async def posli_dotaz(klient: httpx.AsyncClient, url: str, endpoint: str, dotaz: str) -> tuple:
+    """(HTTP status, doba do prvního tokenu / první banky u /stream, Retry-After). Chyba přenosu = status 0."""
+    start = time.perf_counter()
+    data = {"dotaz": dotaz}
+    if endpoint == "/":
+        r = await klient.post(f"{url}/", data=data, auth=(UZIVATEL, HESLO))
+        return r.status_code, None, r.headers.get("Retry-After")
+    prvni = None
+    async with klient.stream("POST", f"{url}/stream", data=data, auth=(UZIVATEL, HESLO)) as r:
+        buffer = b""
+        async for chunk in r.aiter_bytes():
+            if prvni is None:
+                buffer += chunk
+                if b"event: token" in buffer or b"event: banka" in buffer:
+                    prvni = time.perf_counter() - start
+    return r.status_code, prvni, r.headers.get("Retry-After")
+
+
+async def zmer_uroven(klient, url: str, endpoint: str, dotazy: list[str], soubeznost: int, doba: float,
+                      pid: int, rng: random.Random) -> dict:
+    """
+    Uzavřená smyčka: `soubeznost` poradců, každý posílá další dotaz hned po odpovědi na předchozí;
+    po odmítnutí (503) počká, kolik říká Retry-After, jako poradce, který vidí hlášku o vytížení.
+    Měří se dotazy odeslané během `doba` sekund (rozpracované se dokončí a započítají).
+    """
+    latence, prvni, statusy = [], [], {}
+    pamet = []
+    sledovani = asyncio.create_task(sleduj_pamet(pid, pamet))
+    konec = time.perf_counter() + doba
+
+    async def poradce():
+        while time.perf_counter() < konec:
+            start = time.perf_counter()
+            try:
+                status, do_prvniho, retry_after = await posli_dotaz(klient, url, endpoint, rng.choice(dotazy))
+            except httpx.HTTPError:
+                status, do_prvniho, retry_after = 0, None, None
+            statusy[status] = statusy.get(status, 0) + 1
+            if status == 200:
+                latence.append(time.perf_counter() - start)
+                if do_prvniho is not None:
+                    prvni.append(do_prvniho)
+            elif status == 503 and retry_after:
+                await asyncio.sleep(min(float(retry_after), max(0.0, konec - time.perf_counter())))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(poradce() for _ in range(soubeznost)))
+    trvani = time.perf_counter() - start
+    sledovani.cancel()
+
+    pozadavku = sum(statusy.values())
+    odmitnuto = statusy.get(503, 0)
+    chyby = pozadavku - statusy.get(200, 0) - odmitnuto
+    vysledek = {
+        "soubeznost": soubeznost,
+        "trvani_s": round(trvani, 2),
+        "pozadavku": pozadavku,
+        "ok": statusy.get(200, 0),
+        "odmitnuto": odmitnuto,
+        "chyby": chyby,
+        "statusy": {str(k): v for k, v in sorted(statusy.items())},
+        "podil_chyb": round((odmitnuto + chyby) / pozadavku, 4) if pozadavku else 0.0,
+        "propustnost_rps": round(statusy.get(200, 0) / trvani, 2) if trvani else 0.0,
+        "latence": percentily(latence),
+        "rss_mb": {"max": max(pamet), "konec": pamet[-1]} if pamet else None,
+    }
+    if prvni:
+        vysledek["prvni_odpoved"] = percentily(prvni)
+    return vysledek
+
+
+def najdi_saturaci(urovne: list[dict]) -> dict:
+    """
+    Bod saturace = nejvyšší souběžnost, do které propustnost ještě rostla (o PRAH_NARUSTU)
+    a podíl chyb a odmítnutí nepřesáhl PRAH_CHYB. Další poradci už jen prodlužují latenci.
+    """
+    koleno = None
+    for uroven in urovne:
+        if uroven["podil_chyb"] > PRAH_CHYB:
+            duvod = f"chyby a odmítnutí {uroven['podil_chyb']:.1%} při souběžnosti {uroven['soubeznost']}"
+            break
+        if koleno and uroven["propustnost_rps"] < koleno["propustnost_rps"] * PRAH_NARUSTU:
+            duvod = f"propustnost při souběžnosti {uroven['soubeznost']} už nerostla"
+            break
+        koleno = uroven
+    else:
+        return {"dosazena": False, "soubeznost": koleno["soubeznost"] if koleno else None,
+                "duvod": "propustnost rostla až do nejvyšší testované souběžnosti"}
+    if koleno is None:
+        return {"dosazena": True, "soubeznost": None, "duvod": duvod}
+    return {
+        "dosazena": True,
+        "soubeznost": koleno["soubeznost"],
+        "propustnost_rps": koleno["propustnost_rps"],
+        "p95_ms": koleno["latence"].get("p95_ms"),
+        "duvod": duvod,
+    }
+
+# === Porovnání s předchozím během ===
+def porovnej(predchozi: dict, aktualni: dict, tolerance: float) -> list[str]:
+    """Regrese proti předchozímu výsledku: nižší propustnost nebo vyšší p95 na stejné úrovni, dřívější saturace."""
+    regrese = []
+    puvodni = {u["soubeznost"]: u for u in predchozi.get("urovne", [])}
+    for uroven in aktualni["urovne"]:
+        stara = puvodni.get(uroven["soubeznost"])
+        if not stara:
+            continue
+        if uroven["propustnost_rps"] < stara["propustnost_rps"] * (1 - tolerance):
+            regrese.append(
+                f"souběžnost {uroven['soubeznost']}: propustnost {stara['propustnost_rps']} → {uroven['propustnost_rps']} req/s"
+            )
+        p95, p95_stara = uroven["latence"].get("p95_ms"), stara["latence"].get("p95_ms")
+        if p95 and p95_stara and p95 > p95_stara * (1 + tolerance):
+            regrese.append(f"souběžnost {uroven['soubeznost']}: p95 {p95_stara} → {p95} ms")
+    stara_saturace = predchozi.get("saturace", {}).get("soubeznost")
+    nova_saturace = aktualni["saturace"].get("soubeznost")
+    if stara_saturace and nova_saturace and nova_saturace < stara_saturace:
+        regrese.append(f"saturace při souběžnosti {nova_saturace} místo {stara_saturace}")
+    return regrese
+
+# === Běh ===
+def git_revize() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=KOREN, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def proved(args, dotazy: list[str], env: dict) -> dict:
+    port = volny_port()
+    url = f"http://127.0.0.1:{port}"
+    server = spust_server(args.adresar, port, args.workers, env)
+    limity = httpx.Limits(max_connections=max(args.soubeznosti) + 4, max_keepalive_connections=max(args.soubeznosti))
+    try:
+        async with httpx.AsyncClient(timeout=args.timeout, limits=limity) as klient:
+            stav = await cekej_na_pripravenost(klient, url, server, args.start_timeout)
+            rss_start = rss_mb(server.pid)
+            print(f"🚀 Server připraven na {url} (RSS {rss_start} MB)", file=sys.stderr)
+
+            # Zahřátí: každý dotaz jednou, neměří se
+            for dotaz in dotazy:
+                await posli_dotaz(klient, url, args.endpoint, dotaz)
+
+            rng = random.Random(args.seed)
+            urovne = []
+            for soubeznost in args.soubeznosti:
+                uroven = await zmer_uroven(klient, url, args.endpoint, dotazy, soubeznost, args.doba, server.pid, rng)
+                urovne.append(uroven)
+                print(
+                    f"📈 {soubeznost:>3} souběžně: {uroven['propustnost_rps']:>6} req/s | "
+                    f"p50 {uroven['latence'].get('p50_ms')} ms | p95 {uroven['latence'].get('p95_ms')} ms | "
+                    f"p99 {uroven['latence'].get('p99_ms')} ms | chyby {uroven['podil_chyb']:.1%} | "
+                    f"RSS {(uroven['rss_mb'] or {}).get('max')} MB",
+                    file=sys.stderr,
+                )
+    finally:
+        zastav_server(server)
+
+    return {
+        "konfigurace": {
+            "datum": datetime.now().isoformat(timespec="seconds"),
+            "git": git_revize(),
+            "python": platform.python_version(),
+            "cpu": os.cpu_count(),
+            "endpoint": args.endpoint,
+            "workers": args.workers,
+            "doba_na_uroven_s": args.doba,
+            "llm_latence_ms": args.llm_latence_ms,
+            "enkoder": args.enkoder,
+            "chunku": args.chunku,
+            "dotazu_v_mixu": len(dotazy),
+            "cache": args.cache,
+            "server": {k: env[k] for k in sorted(env) if k in NASTAVENI_SERVERU},
+            "ready": stav,
+        },
+        "rss_mb_start": rss_start,
+        "urovne": urovne,
+        "saturace": najdi_saturaci(urovne),
+    }
+
+
+# Proměnné prostředí serveru, které se ukládají do výsledku (ovlivňují výkon)
+NASTAVENI_SERVERU = (
+    "ANSWER_CACHE", "ANSWER_MODE", "CHROMA_WORKERS", "EMBED_BACKEND", "EMBED_MODEL", "ENCODE_WORKERS",
+    "HYBRID_SEARCH", "LLM_BACKEND", "LLM_MAX_CONCURRENCY", "LLM_RPM", "LLM_STUB_LATENCY_MS", "LLM_TPM",
+    "MAX_CONCURRENT_REQUESTS", "QUERY_CACHE_TTL", "QUERY_ROUTER", "RERANK_MODE", "RETRIEVAL_MODE", "TABLE_LOOKUP",
+    "VALIDITY_FILTER", "VECTOR_BACKEND",
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zátěžový test aplikace se stub LLM nad fixturou ChromaDB.")
+    parser.add_argument("--soubeznosti", default=SOUBEZNOSTI, help="rostoucí úrovně souběžnosti, čárkami")
+    parser.add_argument("--doba", type=float, default=20.0, help="sekund na úroveň")
+    parser.add_argument("--endpoint", choices=["/", "/stream"], default="/", help="formulář, nebo SSE stream")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn --workers (Procfile běží s jedním)")
+    parser.add_argument("--llm-latence-ms", type=int, default=1500, help="latence stub LLM na volání")
+    parser.add_argument("--enkoder", choices=list(ENKODERY), default="stub", help="stub, malý e5, nebo produkční e5-large")
+    parser.add_argument("--vektory", choices=["chroma", "numpy"], default="chroma", help="VECTOR_BACKEND serveru")
+    parser.add_argument("--chunku", type=int, default=2000, help="velikost fixtury")
+    parser.add_argument("--cache", action="store_true", help="nechat zapnutou cache embeddingů, vyhledávání a odpovědí")
+    parser.add_argument("--feedback", default=os.path.join(KOREN, FEEDBACK_PATH), help="CSV se zpětnou vazbou (dotazy i text fixtury)")
+    parser.add_argument("--adresar", default=os.path.join(KOREN, ".loadtest"), help="pracovní adresář s fixturou")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=300.0, help="timeout jednoho dotazu v sekundách")
+    parser.add_argument("--start-timeout", type=float, default=600.0, help="jak dlouho čekat na /ready")
+    parser.add_argument("--vystup", help="kam uložit JSON (výchozí loadtest_<datum>.json)")
+    parser.add_argument("--porovnat", help="JSON z předchozího běhu – regrese ukončí běh s kódem 1")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="povolené zhoršení pro --porovnat")
+    args = parser.parse_args()
+    args.soubeznosti = sorted({int(s) for s in args.soubeznosti.split(",") if s.strip()})
+
+    zaznamy = nacti_feedback_zaznamy(args.feedback)
+    # Mix odpovídá četnosti dotazů ve feedbacku (opakované dotazy se losují častěji)
+    dotazy = [(z.get("question") or "").strip() for z in zaznamy if (z.get("question") or "").strip()]
+    if not dotazy:
+        print("❌ Žádné dotazy k přehrání.", file=sys.stderr)
+        sys.exit(1)
+
+    # Enkodér fixtury musí být stejný jako enkodér serveru
+    os.environ.update(ENKODERY[args.enkoder])
+    vytvor_fixturu(args.adresar, zaznamy, args.chunku, args.seed, args.enkoder)
+
+    env = dict(os.environ)
+    env.update({
+        "APP_USERNAME": UZIVATEL,
+        "APP_PASSWORD": HESLO,
+        "PYTHONPATH": os.pathsep.join(filter(None, [KOREN, env.get("PYTHONPATH")])),
+        "LLM_BACKEND": "stub",
+        "LLM_STUB_LATENCY_MS": str(args.llm_latence_ms),
+        "VECTOR_BACKEND": args.vektory,
+    })
+    # Cross-encoder by stahoval další model; s EMBED_BACKEND=stub by ho stejně nebylo čím nahradit
+    env.setdefault("RERANK_MODE", "bi")
+    if not args.cache:
+        # Mix z feedbacku je malý – bez toho by se po prvním kole měřily jen zásahy cache
+        env.update({"ANSWER_CACHE": "0", "QUERY_CACHE_TTL": "0"})
+
+    print(
+        f"▶️ {len(dotazy)} dotazů z {args.feedback}, souběžnost {args.soubeznosti}, {args.doba:.0f} s na úroveň, "
+        f"LLM stub {args.llm_latence_ms} ms, enkodér {args.enkoder}",
+        file=sys.stderr,
+    )
+    vysledek = asyncio.run(proved(args, dotazy, env))
+
+    saturace = vysledek["saturace"]
+    print(f"🧯 Saturace: {saturace['soubeznost']} souběžných ({saturace['duvod']})", file=sys.stderr)
+
+    vystup = args.vystup or f"loadtest_{datetime.now():%Y%m%d-%H%M%S}.json"
+    with open(vystup, "w", encoding="utf-8") as f:
+        json.dump(vysledek, f, ensure_ascii=False, indent=2)
+    print(f"💾 Výsledky uloženy do {vystup}", file=sys.stderr)
+
+    if args.porovnat:
+        with open(args.porovnat, "r", encoding="utf-8") as f:
+            regrese = porovnej(json.load(f), vysledek, args.tolerance)
+        for radek in regrese:
+            print(f"⚠️ Regrese: {radek}", file=sys.stderr)
+        if regrese:
+            sys.exit(1)
+        print(f"✅ Bez regrese proti {args.porovnat}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,10 @@
-import os
 from dotenv import load_dotenv
-import openai
 import chromadb
 from sentence_transformers import SentenceTransformer
+from llm_client import vytvor_klienta
 
 load_dotenv()
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
 model = SentenceTransformer("intfloat/multilingual-e5-large")
 client = chromadb.PersistentClient(path="./chroma_db")
 collection = client.get_or_create_collection(name="hypoteky_all")
@@ -65,17 +63,10 @@ messages = [
     {"role": "user", "content": dotaz}
 ]
 
-from openai import OpenAI
-
-client = OpenAI(api_key=openai.api_key)
-
-response = client.chat.completions.create(
-    model="gpt-4o",
-    messages=messages,
-    temperature=0
-)
+# Klíč si klient bere z OPENAI_API_KEY (načteného z .env); LLM_BACKEND=stub = bez sítě
+odpoved = vytvor_klienta().zavolej_sync(messages, model="gpt-4o")
 
 print("📘 Odpověď GPT-4o:")
 print("-" * 60)
-print(response.choices[0].message.content)
+print(odpoved)
 input("\nStiskni Enter pro ukončení...")
@@ -0,0 +1,63 @@
+import os
+import shutil
+import hashlib
+
+METODIKY_PATH = "metodiky_bank"
+VYTAHY_PATH = "metodiky_strany"   # předgenerované výtahy jednotlivých stran PDF (prepare_db.py --vytahy-stran)
+ZDROJ_VYTAHU = ".zdroj"           # hash PDF, ze kterého výtahy v adresáři vznikly
+
+
+def najdi_soubor(koren: str, relativni: str) -> str | None:
+    """Cesta k existujícímu souboru uvnitř kořene; None i pro cesty mířící mimo kořen (../, absolutní, symlinky ven)."""
+    koren = os.path.realpath(koren)
+    cesta = os.path.realpath(os.path.join(koren, relativni))
+    if os.path.commonpath([koren, cesta]) != koren or not os.path.isfile(cesta):
+        return None
+    return cesta
+
+
+def verze_souboru(stat_result: os.stat_result) -> str:
+    """Krátká verze podle času změny a velikosti – ETag a parametr ?v= v odkazech citací."""
+    return hashlib.sha1(f"{stat_result.st_mtime_ns}-{stat_result.st_size}".encode()).hexdigest()[:12]
+
+
+def cesta_vytahu(fname: str, strana: int) -> str:
+    """Cesta výtahu strany relativně ke složce výtahů."""
+    return os.path.join(fname, f"{strana}.pdf")
+
+
+def zdroj_vytahu(adresar: str, fname: str) -> str | None:
+    """Hash PDF, ze kterého jsou uložené výtahy; None = výtahy nejsou."""
+    try:
+        with open(os.path.join(adresar, fname, ZDROJ_VYTAHU), "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def vytvor_vytahy(pdf_cesta: str, adresar: str, fname: str, zdroj_hash: str) -> int:
+    """
+    Každou stranu PDF uloží jako samostatné jednostránkové PDF (adresar/fname/N.pdf).
+    Zapisuje se do dočasného adresáře, který nahradí předchozí výtahy až po dokončení.
+    """
+    from PyPDF2 import PdfReader, PdfWriter
+
+    cil = os.path.join(adresar, fname)
+    tmp = cil + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    reader = PdfReader(pdf_cesta)
+    for i, stranka in enumerate(reader.pages, start=1):
+        writer = PdfWriter()
+        writer.add_page(stranka)
+        with open(os.path.join(tmp, f"{i}.pdf"), "wb") as f:
+            writer.write(f)
+    with open(os.path.join(tmp, ZDROJ_VYTAHU), "w", encoding="utf-8") as f:
+        f.write(zdroj_hash)
+    shutil.rmtree(cil, ignore_errors=True)
+    os.replace(tmp, cil)
+    return len(reader.pages)
+
+
+def smaz_vytahy(adresar: str, fname: str):
+    shutil.rmtree(os.path.join(adresar, fname), ignore_errors=True)
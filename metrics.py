@@ -0,0 +1,217 @@
+import time
+import threading
+import contextvars
+import unicodedata
+from bisect import bisect_left
+from contextlib import contextmanager
+from collections import defaultdict
+
+VYCHOZI_HRANICE = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escapuj(hodnota) -> str:
+    return str(hodnota).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _stitky(nazvy: tuple, hodnoty: tuple) -> str:
+    if not nazvy:
+        return ""
+    return "{" + ",".join(f'{n}="{_escapuj(h)}"' for n, h in zip(nazvy, hodnoty)) + "}"
+
+
+class Citac:
+    def __init__(self, nazev: str, popis: str, stitky: tuple = ()):
+        self.nazev = nazev
+        self.popis = popis
+        self.stitky = stitky
+        self._hodnoty = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def pricti(self, hodnota: float = 1.0, **stitky):
+        klic = tuple(str(stitky.get(n, "")) for n in self.stitky)
+        with self._lock:
+            self._hodnoty[klic] += hodnota
+
+    def export(self) -> list[str]:
+        radky = [f"# HELP {self.nazev} {self.popis}", f"# TYPE {self.nazev} counter"]
+        with self._lock:
+            for klic, hodnota in sorted(self._hodnoty.items()):
+                radky.append(f"{self.nazev}{_stitky(self.stitky, klic)} {hodnota:g}")
+        return radky
+
+
+class Histogram:
+    def __init__(self, nazev: str, popis: str, stitky: tuple = (), hranice: tuple = VYCHOZI_HRANICE):
+        self.nazev = nazev
+        self.popis = popis
+        self.stitky = stitky
+        self.hranice = tuple(sorted(hranice))
+        # klíč štítků → [počty v košících (+Inf navíc), součet, počet]
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def zaznamenej(self, hodnota: float, **stitky):
+        klic = tuple(str(stitky.get(n, "")) for n in self.stitky)
+        with self._lock:
+            data = self._data.setdefault(klic, [[0] * (len(self.hranice) + 1), 0.0, 0])
+            data[0][bisect_left(self.hranice, hodnota)] += 1
+            data[1] += hodnota
+            data[2] += 1
+
+    def export(self) -> list[str]:
+        radky = [f"# HELP {self.nazev} {self.popis}", f"# TYPE {self.nazev} histogram"]
+        with self._lock:
+            for klic, (kose, soucet, pocet) in sorted(self._data.items()):
+                kumulativne = 0
+                for hranice, v_kosi in zip(self.hranice + (float("inf"),), kose):
+                    kumulativne += v_kosi
+                    le = "+Inf" if hranice == float("inf") else f"{hranice:g}"
+                    radky.append(
+                        f"{self.nazev}_bucket{_stitky(self.stitky + ('le',), klic + (le,))} {kumulativne}"
+                    )
+                radky.append(f"{self.nazev}_sum{_stitky(self.stitky, klic)} {soucet:.6f}")
+                radky.append(f"{self.nazev}_count{_stitky(self.stitky, klic)} {pocet}")
+        return radky
+
+
+class Registr:
+    """Metriky jednoho procesu; s více workery má každý vlastní registr (Prometheus je sečte)."""
+
+    def __init__(self):
+        self._metriky = []
+
+    def citac(self, nazev: str, popis: str, stitky: tuple = ()) -> Citac:
+        metrika = Citac(nazev, popis, stitky)
+        self._metriky.append(metrika)
+        return metrika
+
+    def histogram(self, nazev: str, popis: str, stitky: tuple = (), hranice: tuple = VYCHOZI_HRANICE) -> Histogram:
+        metrika = Histogram(nazev, popis, stitky, hranice)
+        self._metriky.append(metrika)
+        return metrika
+
+    def export(self) -> str:
+        """Textový formát Prometheus (text/plain; version=0.0.4)."""
+        return "\n".join(radek for metrika in self._metriky for radek in metrika.export()) + "\n"
+
+
+registr = Registr()
+DOBA_ETAPY = registr.histogram(
+    "gepard_etapa_seconds", "Doba jednotlivých etap zpracování dotazu", ("etapa", "banka")
+)
+DOBA_POZADAVKU = registr.histogram(
+    "gepard_pozadavek_seconds", "Celková doba zpracování dotazu", ("endpoint",)
+)
+TOKENY = registr.citac(
+    "gepard_llm_tokeny_total", "Tokeny promptu a odpovědi podle banky, etapy a modelu", ("banka", "etapa", "model", "druh")
+)
+LLM_VOLANI = registr.citac(
+    "gepard_llm_volani_total", "Volání LLM podle banky, etapy a výsledku", ("banka", "etapa", "vysledek")
+)
+
+
+# === Trasa jednoho požadavku ===
+class Trasa:
+    """Etapy a tokeny jednoho dotazu – pro Server-Timing a ladicí hlavičky."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.etapy = []      # (etapa, banka, sekundy)
+        self.tokeny = defaultdict(lambda: [0, 0])    # banka → [prompt, completion]
+        self.tokeny_modelu = defaultdict(lambda: [0, 0])    # model → [prompt, completion] (pro odhad ceny)
+        self.vlastnosti = {}    # popis zpracování (typ dotazu, model…) místo printu do logu
+        self._lock = threading.Lock()
+
+    def pridej_etapu(self, etapa: str, banka: str, doba: float):
+        with self._lock:
+            self.etapy.append((etapa, banka, doba))
+
+    def pridej_tokeny(self, banka: str, prompt: int, completion: int, model: str = ""):
+        with self._lock:
+            self.tokeny[banka][0] += prompt
+            self.tokeny[banka][1] += completion
+            self.tokeny_modelu[model][0] += prompt
+            self.tokeny_modelu[model][1] += completion
+
+    def nastav(self, **vlastnosti):
+        with self._lock:
+            self.vlastnosti.update(vlastnosti)
+
+    def souhrn(self) -> dict:
+        """Součet doby po etapách v ms (souběžné banky se sčítají) a tokeny po bankách."""
+        po_etapach = defaultdict(float)
+        with self._lock:
+            for etapa, _, doba in self.etapy:
+                po_etapach[etapa] += doba
+            tokeny = {banka: {"prompt": p, "completion": c} for banka, (p, c) in self.tokeny.items()}
+            modely = {model: {"prompt": p, "completion": c} for model, (p, c) in self.tokeny_modelu.items()}
+            vlastnosti = dict(self.vlastnosti)
+        return {
+            "celkem_ms": round((time.perf_counter() - self.start) * 1000, 1),
+            "etapy_ms": {etapa: round(doba * 1000, 1) for etapa, doba in po_etapach.items()},
+            "tokeny": tokeny,
+            "modely": modely,
+            "vlastnosti": vlastnosti,
+        }
+
+    def hlavicky(self) -> dict:
+        """Server-Timing (zobrazí DevTools prohlížeče) a X-Debug-Tokens; hodnoty jen v ASCII."""
+        souhrn = self.souhrn()
+        casovani = [f"{etapa};dur={ms}" for etapa, ms in souhrn["etapy_ms"].items()]
+        casovani.append(f"celkem;dur={souhrn['celkem_ms']}")
+        tokeny = [
+            f"{_ascii(banka)}={t['prompt']}/{t['completion']}" for banka, t in souhrn["tokeny"].items()
+        ]
+        hlavicky = {"Server-Timing": ", ".join(casovani)}
+        if tokeny:
+            hlavicky["X-Debug-Tokens"] = "; ".join(tokeny)
+        if souhrn["vlastnosti"]:
+            hlavicky["X-Debug-Trace"] = "; ".join(f"{k}={_ascii(str(v))}" for k, v in souhrn["vlastnosti"].items())
+        return hlavicky
+
+
+def _ascii(text: str) -> str:
+    text = unicodedata.normalize("NFD", text)
+    return "".join(c for c in text if unicodedata.category(c) != "Mn").encode("ascii", "replace").decode()
+
+
+_aktualni_trasa = contextvars.ContextVar("trasa", default=None)
+
+
+def zacni_trasu() -> Trasa:
+    trasa = Trasa()
+    _aktualni_trasa.set(trasa)
+    return trasa
+
+
+def aktualni_trasa() -> Trasa | None:
+    return _aktualni_trasa.get()
+
+
+@contextmanager
+def mereni(etapa: str, banka: str = ""):
+    """Změří blok kódu do histogramu etap a do trasy aktuálního požadavku (pokud nějaká je)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        doba = time.perf_counter() - start
+        DOBA_ETAPY.zaznamenej(doba, etapa=etapa, banka=banka)
+        trasa = _aktualni_trasa.get()
+        if trasa is not None:
+            trasa.pridej_etapu(etapa, banka, doba)
+
+
+def zaznamenej_vlastnosti(**vlastnosti):
+    """Vlastnosti zpracování do trasy aktuálního požadavku (pokud nějaká je)."""
+    trasa = _aktualni_trasa.get()
+    if trasa is not None:
+        trasa.nastav(**vlastnosti)
+
+
+def zaznamenej_tokeny(banka: str, etapa: str, prompt: int, completion: int, model: str = ""):
+    TOKENY.pricti(prompt, banka=banka, etapa=etapa, model=model, druh="prompt")
+    TOKENY.pricti(completion, banka=banka, etapa=etapa, model=model, druh="completion")
+    trasa = _aktualni_trasa.get()
+    if trasa is not None:
+        trasa.pridej_tokeny(banka, prompt, completion, model)
@@ -1,32 +1,46 @@
 import os
+import sys
+import json
+import hashlib
+import shutil
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 import chromadb
-from sentence_transformers import SentenceTransformer
+from chunker import rozdel_na_chunky
+from embeddings import vytvor_lokalni_enkoder, EMBED_MODEL
+from inverted_index import InvertovanyIndex
+from vector_store import exportuj_z_chromy, verze_exportu, PODPOROVANE_DTYPE
+from tabulky import TabulkovyIndex, extrahuj_tabulky, muze_obsahovat_tabulky
+from dedup import Deduplikace, PRAH as DEDUP_PRAH
+from verze_dokumentu import urci_platnosti, platnost_chunku, BEZ_KONCE, VERZE_PLATNOSTI
+from metodiky import VYTAHY_PATH, zdroj_vytahu, vytvor_vytahy, smaz_vytahy
 from PyPDF2 import PdfReader
 from docx import Document
 import pandas as pd
 import re
 
-# Načtení modelu a databáze
-model = SentenceTransformer("intfloat/multilingual-e5-large")
-client = chromadb.PersistentClient(path="./chroma_db")
-if "hypoteky_all" in [c.name for c in client.list_collections()]:
-    client.delete_collection("hypoteky_all")
-collection = client.create_collection(name="hypoteky_all")
+# Cesty a názvy
+CHROMA_PATH = "./chroma_db"
+COLLECTION_NAME = "hypoteky_all"
+MANIFEST_PATH = os.path.join(CHROMA_PATH, f"manifest_{COLLECTION_NAME}.json")
+BM25_PATH = os.path.join(CHROMA_PATH, f"bm25_{COLLECTION_NAME}.sqlite")
+NUMPY_STORE_PATH = os.path.join(CHROMA_PATH, f"numpy_{COLLECTION_NAME}")
+TABULKY_PATH = os.path.join(CHROMA_PATH, f"tabulky_{COLLECTION_NAME}.sqlite")
+DEDUP_PATH = os.path.join(CHROMA_PATH, f"dedup_{COLLECTION_NAME}.sqlite")
 
 # Parametry zpracování
-chunk_size = 1200
-chunk_overlap = 150
-
-# Pomocná funkce: dělení textu na překrývající se úseky
-def split_text(text, size, overlap):
-    chunks = []
-    i = 0
-    while i < len(text):
-        end = i + size
-        chunks.append(text[i:end])
-        i += size - overlap
-    return chunks
+CHUNK_MAX_TOKENU = 300 # rozpočet tokenů na chunk (e5 ořezává vstup na 512 tokenů)
+VERZE_CHUNKOVANI = 2   # při změně chunkeru se vše přeindexuje
+ENCODE_BATCH = 32      # velikost dávky pro model.encode
+ZAPIS_BATCH = 1000     # max. počet záznamů v jednom collection.add
+
+load_dotenv()
+# Stejný enkodér jako dotazy v aplikaci (EMBED_MODEL, EMBED_BACKEND, EMBED_ONNX_FILE z .env)
+MODEL_INDEXU = "stub" if os.getenv("EMBED_BACKEND") == "stub" else os.getenv("EMBED_MODEL", EMBED_MODEL)
 
 # Pomocná funkce: určení banky z názvu nebo obsahu
 def get_banka_from_filename(name):
@@ -49,72 +63,468 @@ def get_banka_from_filename(name):
         return "Oberbank"
     return "Neznámá banka"
 
-# Cesta ke složce se soubory
-folder_path = "./metodiky_bank"
+# === Manifest: hash obsahu každého zaindexovaného souboru ===
+def hash_souboru(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for blok in iter(lambda: f.read(1 << 20), b""):
+            h.update(blok)
+    return h.hexdigest()
 
-# Procházení souborů
-for fname in os.listdir(folder_path):
-    path = os.path.join(folder_path, fname)
-    ext = os.path.splitext(fname)[1].lower()
-    text = ""
+def nacti_manifest():
+    if not os.path.isfile(MANIFEST_PATH):
+        return {"kolekce": COLLECTION_NAME, "verze_chunkovani": VERZE_CHUNKOVANI, "model": MODEL_INDEXU, "soubory": {}}
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("verze_chunkovani") != VERZE_CHUNKOVANI:
+        # Jiný chunker – hashe zneplatníme, aby se přeindexovaly všechny soubory
+        for zaznam in manifest["soubory"].values():
+            zaznam["hash"] = None
+        manifest["verze_chunkovani"] = VERZE_CHUNKOVANI
+    manifest["model"] = MODEL_INDEXU
+    return manifest
+
+def model_indexu():
+    """Model, kterým vznikly vektory v indexu; starší manifesty ho neuvádějí – vznikly výchozím modelem."""
+    if not os.path.isfile(MANIFEST_PATH):
+        return None
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        return json.load(f).get("model", EMBED_MODEL)
+
+def uloz_manifest(manifest):
+    # Každá změna indexu dostane novou verzi – aplikace podle ní zahodí cache vyhledávání
+    manifest["index_verze"] = f"{time.time_ns():x}"
+    # Zápis přes dočasný soubor, aby přerušený běh nenechal rozbitý manifest
+    os.makedirs(CHROMA_PATH, exist_ok=True)
+    tmp = MANIFEST_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, MANIFEST_PATH)
+
+# === Extrakce textu ===
+PODPOROVANE_PRIPONY = (".pdf", ".docx", ".xlsx")
+
+def extrahuj_stranky(path, ext):
+    """
+    Vrátí seznam (strana, text). U PDF jde o skutečné stránky,
+    u DOCX o celý dokument a u XLSX o jednotlivé listy (strana None).
+    """
+    stranky = []
+    if ext == ".pdf":
+        reader = PdfReader(path)
+        for i, page in enumerate(reader.pages):
+            t = page.extract_text()
+            if t:
+                stranky.append((i + 1, t))
 
+    elif ext == ".docx":
+        doc = Document(path)
+        stranky.append((None, "\n".join(para.text for para in doc.paragraphs)))
+
+    elif ext == ".xlsx":
+        xls = pd.ExcelFile(path)
+        for sheet in xls.sheet_names:
+            df = xls.parse(sheet)
+            text = ""
+            for col in df.columns:
+                col_text = df[col].astype(str).str.cat(sep=" ", na_rep="")
+                text += col_text + "\n"
+            stranky.append((None, text))
+    return stranky
+
+def extrahuj_soubor(path):
+    """
+    Běží v samostatném procesu. Vrací (fname, stranky, doba_s, chyba) –
+    výjimky se nevyhazují, aby jeden rozbitý soubor nezastavil celý pool.
+    """
+    fname = os.path.basename(path)
+    ext = os.path.splitext(fname)[1].lower()
+    start = time.perf_counter()
+    if ext not in PODPOROVANE_PRIPONY:
+        return fname, [], 0.0, "nepodporovaný formát"
     try:
-        if ext == ".pdf":
-            reader = PdfReader(path)
-            for i, page in enumerate(reader.pages):
-                t = page.extract_text()
-                if t:
-                    text += t + "\n"
-
-        elif ext == ".docx":
-            doc = Document(path)
-            for para in doc.paragraphs:
-                text += para.text + "\n"
-
-        elif ext == ".xlsx":
-            xls = pd.ExcelFile(path)
-            for sheet in xls.sheet_names:
-                df = xls.parse(sheet)
-                for col in df.columns:
-                    col_text = df[col].astype(str).str.cat(sep=" ", na_rep="")
-                    text += col_text + "\n"
-
-        else:
-            print(f"❌ Nepodporovaný formát: {fname}")
+        stranky = extrahuj_stranky(path, ext)
+        return fname, stranky, time.perf_counter() - start, None
+    except Exception as e:
+        return fname, [], time.perf_counter() - start, str(e)
+
+def extrahuj_paralelne(folder_path, fnames, procesy=None, max_fronta=4):
+    """
+    Paralelně parsuje soubory v process poolu a výsledky vydává v pořadí dokončení.
+    Fronta je omezená: když embedding nestíhá, nepodávají se další soubory
+    a v paměti čeká nejvýš procesy + max_fronta rozparsovaných dokumentů.
+    """
+    procesy = procesy or max(1, (os.cpu_count() or 2) - 1)
+    fronta = queue.Queue(maxsize=max_fronta)
+    KONEC = object()
+
+    # Největší soubory napřed, ať na ně nečeká konec běhu
+    fnames = sorted(fnames, key=lambda f: os.path.getsize(os.path.join(folder_path, f)), reverse=True)
+
+    def podavac():
+        try:
+            with ProcessPoolExecutor(max_workers=procesy) as pool:
+                zbyvajici = iter(fnames)
+                bezi = set()
+                for fname in zbyvajici:
+                    bezi.add(pool.submit(extrahuj_soubor, os.path.join(folder_path, fname)))
+                    if len(bezi) >= procesy:
+                        break
+                while bezi:
+                    hotove, bezi = wait(bezi, return_when=FIRST_COMPLETED)
+                    for future in hotove:
+                        fronta.put(future.result())   # blokuje, dokud je fronta plná
+                        fname = next(zbyvajici, None)
+                        if fname is not None:
+                            bezi.add(pool.submit(extrahuj_soubor, os.path.join(folder_path, fname)))
+        except Exception as e:
+            fronta.put(e)
+        fronta.put(KONEC)
+
+    vlakno = threading.Thread(target=podavac, daemon=True)
+    vlakno.start()
+    while True:
+        polozka = fronta.get()
+        if polozka is KONEC:
+            break
+        if isinstance(polozka, Exception):
+            raise polozka
+        yield polozka
+    vlakno.join()
+
+def priprav_chunky(fname, stranky, pocitej_tokeny):
+    """Rozdělí stránky souboru na chunky a připraví k nim ID a metadata."""
+    banka = get_banka_from_filename(fname)
+    ids, chunks, metadatas = [], [], []
+
+    for i, chunk in enumerate(rozdel_na_chunky(stranky, CHUNK_MAX_TOKENU, pocitej_tokeny)):
+        metadata = {
+            "document_source": fname,
+            "banka": banka,
+            "kapitola": chunk["kapitola"],
+            "nadpis": chunk["nadpis"],
+            "cast": i + 1,
+        }
+        # Skutečné stránky známe jen u PDF
+        if chunk["strana"] is not None:
+            metadata["strana"] = chunk["strana"]
+            metadata["strana_do"] = chunk["strana_do"]
+        ids.append(f"{fname}_{i}")
+        chunks.append(chunk["text"])
+        metadatas.append(metadata)
+    return ids, chunks, metadatas
+
+# === Zápis do ChromaDB po dávkách ===
+def zapis_chunky(model, collection, index, ids, chunks, metadatas):
+    embeddings = model.encode(
+        [f"passage: {chunk}" for chunk in chunks],
+        batch_size=ENCODE_BATCH,
+        show_progress_bar=False
+    ).tolist()
+    for od in range(0, len(ids), ZAPIS_BATCH):
+        do = od + ZAPIS_BATCH
+        collection.add(
+            documents=chunks[od:do],
+            embeddings=embeddings[od:do],
+            metadatas=metadatas[od:do],
+            ids=ids[od:do]
+        )
+    index.pridej(ids, chunks, metadatas)
+
+def smaz_soubor(collection, index, dedup, fname):
+    collection.delete(where={"document_source": fname})
+    index.smaz_soubor(fname)
+    prepis_dalsi_zdroje(collection, dedup, dedup.smaz_soubor(fname))
+
+# === Deduplikace: sloučené duplikáty jsou jen citace v metadatech kanonického chunku ===
+def prepis_dalsi_zdroje(collection, dedup, ids):
+    """Přepíše "dalsi_zdroje" kanonických chunků, které už v kolekci jsou."""
+    if not ids:
+        return
+    vysledek = collection.get(ids=list(ids), include=["metadatas"])
+    metadatas = []
+    for chunk_id, meta in zip(vysledek["ids"], vysledek["metadatas"]):
+        meta = dict(meta)
+        meta["dalsi_zdroje"] = json.dumps(dedup.dalsi_zdroje(chunk_id), ensure_ascii=False)
+        metadatas.append(meta)
+    if metadatas:
+        collection.update(ids=vysledek["ids"], metadatas=metadatas)
+
+def sluc_duplikaty(collection, dedup, ids, chunks, metadatas):
+    """Vyřadí téměř duplicitní chunky; vrací jen chunky k zápisu (s doplněnými dalsi_zdroje)."""
+    ponechane, sloucene = dedup.zpracuj_soubor(ids, chunks, metadatas)
+    vlastni = {ids[i] for i in ponechane}
+    for i in ponechane:
+        if ids[i] in sloucene:
+            metadatas[i]["dalsi_zdroje"] = json.dumps(dedup.dalsi_zdroje(ids[i]), ensure_ascii=False)
+    # Kanonické chunky z jiných souborů jsou už v kolekci – jen jim přibude zdroj
+    prepis_dalsi_zdroje(collection, dedup, [k for k in sloucene if k not in vlastni])
+    return [ids[i] for i in ponechane], [chunks[i] for i in ponechane], [metadatas[i] for i in ponechane]
+
+def dopln_podpisy(collection, dedup):
+    """Index z doby před deduplikací: uložené chunky se zaevidují jako kanonické (sloučí je až --vse)."""
+    if dedup.statistiky()["chunku_celkem"] or not collection.count():
+        return
+    vse = collection.get(include=["documents", "metadatas"])
+    dedup.pridej_existujici(vse["ids"], vse["documents"], vse["metadatas"])
+    print(f"🧬 Podpisy pro deduplikaci doplněny z ChromaDB ({len(vse['ids'])} chunků)")
+
+def dopln_zavisle(soubory, zmenene, odstranene):
+    """
+    Přidá soubory, jejichž duplikáty jsou sloučené do chunků měněných nebo odstraněných
+    souborů (manifest "zavisi_na") – po smazání kanonického chunku musí své chunky zapsat znovu.
+    """
+    dotcene = set(zmenene) | set(odstranene)
+    zavisle = set()
+    while True:
+        nove = {
+            fname for fname, zaznam in soubory.items()
+            if fname not in dotcene and dotcene.intersection(zaznam.get("zavisi_na", []))
+        }
+        if not nove:
+            break
+        dotcene |= nove
+        zavisle |= nove
+    return sorted(set(zmenene) | zavisle), sorted(zavisle)
+
+def dopln_invertovany_index(collection, index):
+    """Index z doby před BM25 doplníme z uložených chunků – bez nového embeddingu."""
+    if index.pocet_chunku() or not collection.count():
+        return
+    vse = collection.get(include=["documents", "metadatas"])
+    index.pridej(vse["ids"], vse["documents"], vse["metadatas"])
+    print(f"🔤 Invertovaný index doplněn z ChromaDB ({len(vse['ids'])} chunků)")
+
+def exportuj_numpy(collection, manifest, dtype):
+    """NumPy úložiště pro VECTOR_BACKEND=numpy; přepíše se jen při nové verzi indexu nebo jiném dtype."""
+    if not dtype:
+        return
+    verze = manifest.get("index_verze") or "?"
+    if verze_exportu(NUMPY_STORE_PATH) == (verze, dtype):
+        return
+    start = time.perf_counter()
+    pocet = exportuj_z_chromy(collection, NUMPY_STORE_PATH, verze, dtype)
+    print(f"🧮 NumPy úložiště exportováno ({pocet} chunků, {dtype}) za {time.perf_counter() - start:.1f} s")
+
+def aktualizuj_tabulky(folder_path, aktualni):
+    """
+    Tabulkové seznamy (XLSX, seznam rizikových zemí v PDF) jako typované řádky pro přímé dotazy.
+    Vlastní evidence hashů – tabulky se doplní i pro soubory, které už v ChromaDB jsou.
+    """
+    tabulky = TabulkovyIndex(TABULKY_PATH)
+    zname = tabulky.soubory()
+    for fname in zname:
+        if fname not in aktualni:
+            tabulky.smaz_soubor(fname)
+    for fname, h in aktualni.items():
+        if zname.get(fname) == h or not muze_obsahovat_tabulky(fname):
+            continue
+        try:
+            nalezene = extrahuj_tabulky(os.path.join(folder_path, fname))
+        except Exception as e:
+            print(f"❌ Chyba při čtení tabulek z {fname}: {e}")
             continue
+        tabulky.nahrad_soubor(fname, h, get_banka_from_filename(fname), nalezene)
+        for tabulka, umisteni, zaznamy in nalezene:
+            print(f"📋 Tabulka {tabulka}: {fname} ({umisteni}) — {len(zaznamy)} řádků")
 
-        if not text.strip():
-            print(f"⚠️ Prázdný obsah: {fname}")
+def aktualizuj_vytahy(folder_path, aktualni):
+    """
+    Výtahy jednotlivých stran PDF pro odkazy citací (aplikace je posílá místo celého dokumentu).
+    Evidence přes hash zdrojového PDF ve složce výtahů – doplní se i pro už zaindexované soubory.
+    """
+    if os.path.isdir(VYTAHY_PATH):
+        for fname in os.listdir(VYTAHY_PATH):
+            if fname not in aktualni:
+                smaz_vytahy(VYTAHY_PATH, fname)
+    for fname, h in aktualni.items():
+        if not fname.lower().endswith(".pdf") or zdroj_vytahu(VYTAHY_PATH, fname) == h:
             continue
+        try:
+            stran = vytvor_vytahy(os.path.join(folder_path, fname), VYTAHY_PATH, fname, h)
+            print(f"📑 Výtahy stran: {fname} — {stran} stran")
+        except Exception as e:
+            print(f"❌ Chyba při vytváření výtahů stran z {fname}: {e}")
+
+# === Platnost vydání: řady dokumentů podle data v názvu, nahrazená vydání se při vyhledávání vynechají ===
+def aktualizuj_platnosti(collection, manifest, vynutit=False):
+    """
+    Doplní platnost_od / platnost_do do manifestu i do metadat chunků. Přibude-li novější
+    vydání, změní se platnost i chunkům staršího – bez nového embeddingu, jen update metadat.
+    """
+    soubory = manifest["soubory"]
+    platnosti = urci_platnosti(list(soubory))
+    zmeneno = vynutit or manifest.get("verze_platnosti") != VERZE_PLATNOSTI or any(
+        {k: soubory[fname].get(k) for k in platnost} != platnost for fname, platnost in platnosti.items()
+    )
+    if not zmeneno:
+        return
+    for fname, platnost in platnosti.items():
+        soubory[fname].update(platnost)
+
+    vse = collection.get(include=["metadatas"])
+    ids, metadatas = [], []
+    for chunk_id, meta in zip(vse["ids"], vse["metadatas"]):
+        od, do = platnost_chunku(meta, platnosti)
+        if (meta.get("platnost_od"), meta.get("platnost_do")) != (od, do):
+            ids.append(chunk_id)
+            metadatas.append({**meta, "platnost_od": od, "platnost_do": do})
+    for od in range(0, len(ids), ZAPIS_BATCH):
+        collection.update(ids=ids[od:od + ZAPIS_BATCH], metadatas=metadatas[od:od + ZAPIS_BATCH])
+
+    manifest["verze_platnosti"] = VERZE_PLATNOSTI
+    uloz_manifest(manifest)
+    nahrazene = sorted(f for f, p in platnosti.items() if p["platnost_do"] != BEZ_KONCE)
+    print(f"📅 Platnost vydání aktualizována ({len(ids)} chunků, {len(nahrazene)} nahrazených vydání)")
+    for fname in nahrazene:
+        print(f"   ↳ {fname} platí do {platnosti[fname]['platnost_do']}")
+
+# === Hlavní běh: přeindexuje jen nové a změněné soubory ===
+def main(folder_path="./metodiky_bank", vse=False, procesy=None, numpy_dtype="float32", dedup_prah=DEDUP_PRAH,
+         vytahy=False):
+    client = chromadb.PersistentClient(path=CHROMA_PATH)
+    if not vse and model_indexu() not in (None, MODEL_INDEXU):
+        # Vektory jiného modelu (a často i jiné dimenze) nejde míchat v jedné kolekci
+        print(f"⚠️ Index vznikl modelem {model_indexu()}, nyní {MODEL_INDEXU} – indexuje se vše znovu")
+        vse = True
+    if vse:
+        if COLLECTION_NAME in [c.name for c in client.list_collections()]:
+            client.delete_collection(COLLECTION_NAME)
+        for cesta in (MANIFEST_PATH, BM25_PATH, TABULKY_PATH, DEDUP_PATH):
+            if os.path.isfile(cesta):
+                os.remove(cesta)
+        shutil.rmtree(NUMPY_STORE_PATH, ignore_errors=True)
+    collection = client.get_or_create_collection(name=COLLECTION_NAME)
+    index = InvertovanyIndex(BM25_PATH)
+    dopln_invertovany_index(collection, index)
+    dedup = Deduplikace(DEDUP_PATH, prah=dedup_prah)
+    dopln_podpisy(collection, dedup)
+    manifest = nacti_manifest()
+    soubory = manifest["soubory"]
+
+    # Starší manifesty neobsahují banku – doplníme ji z názvu souboru
+    bez_banky = [fname for fname, zaznam in soubory.items() if "banka" not in zaznam]
+    for fname in bez_banky:
+        soubory[fname]["banka"] = get_banka_from_filename(fname)
+    if bez_banky:
+        uloz_manifest(manifest)
+
+    # Co je nové, změněné a odstraněné
+    aktualni = {fname: hash_souboru(os.path.join(folder_path, fname)) for fname in sorted(os.listdir(folder_path))}
+    zmenene = [f for f, h in aktualni.items() if soubory.get(f, {}).get("hash") != h]
+    odstranene = [f for f in soubory if f not in aktualni]
+    zmenene, zavisle = dopln_zavisle(soubory, zmenene, odstranene)
+    for fname in zavisle:
+        print(f"🔗 Přeindexuje se kvůli sloučeným duplikátům: {fname}")
+
+    for fname in odstranene:
+        smaz_soubor(collection, index, dedup, fname)
+        del soubory[fname]
+        uloz_manifest(manifest)
+        print(f"🗑️ Odstraněno z indexu: {fname}")
+
+    # Stará data všech přeindexovaných souborů smažeme ještě před zpracováním. Soubory se
+    # zpracují v pořadí dokončení parsování a duplikáty se smí sloučit jen do chunků zapsaných
+    # v tomto běhu – ne do zastaralých chunků souboru, který by se smazal až později.
+    # Záznam v manifestu zmizí napřed, takže přerušený běh soubory zpracuje znovu.
+    for fname in zmenene:
+        soubory.pop(fname, None)
+    if zmenene:
+        uloz_manifest(manifest)
+    for fname in zmenene:
+        smaz_soubor(collection, index, dedup, fname)
 
-        banka = get_banka_from_filename(fname)
-        chunks = split_text(text, chunk_size, chunk_overlap)
-
-        for i, chunk in enumerate(chunks):
-            kapitola = "?"
-            for line in chunk.splitlines():
-                if line.strip().startswith(tuple(str(k) for k in range(1, 10))) and '.' in line:
-                    kapitola = line.strip().split()[0]
-                    break
-
-            metadata = {
-                "document_source": fname,
-                "banka": banka,
-                "kapitola": kapitola,
-                "cast": i + 1,
-                "strana": i + 1  # nově přidáno — lze vylepšit přesnější logikou dle formátu
+    aktualizuj_tabulky(folder_path, aktualni)
+    if vytahy:
+        aktualizuj_vytahy(folder_path, aktualni)
+
+    if not zmenene:
+        print("✅ Index je aktuální, není co přeindexovat.")
+        aktualizuj_platnosti(collection, manifest, vynutit=bool(odstranene))
+        exportuj_numpy(collection, manifest, numpy_dtype)
+        return
+
+    # Stejná továrna enkodéru jako v aplikaci; model se načte až s prvním kódovaným chunkem
+    model = vytvor_lokalni_enkoder()
+    pocitej_tokeny = model.pocet_tokenu
+
+    start = time.perf_counter()
+    cas_parsovani = 0.0
+    cas_embeddingu = 0.0
+
+    # Parsování běží v process poolu, embedding zde v hlavním procesu – obojí se překrývá
+    for fname, stranky, doba_parsovani, chyba in extrahuj_paralelne(folder_path, zmenene, procesy=procesy):
+        cas_parsovani += doba_parsovani
+
+        duplicitnich = 0
+
+        try:
+            if chyba == "nepodporovaný formát":
+                print(f"❌ Nepodporovaný formát: {fname}")
+                ids = []
+            elif chyba:
+                raise RuntimeError(chyba)
+            else:
+                if not any(t.strip() for _, t in stranky):
+                    print(f"⚠️ Prázdný obsah: {fname}")
+                    ids = []
+                else:
+                    t0 = time.perf_counter()
+                    ids, chunks, metadatas = priprav_chunky(fname, stranky, pocitej_tokeny)
+                    vsech = len(ids)
+                    ids, chunks, metadatas = sluc_duplikaty(collection, dedup, ids, chunks, metadatas)
+                    duplicitnich = vsech - len(ids)
+                    if ids:
+                        zapis_chunky(model, collection, index, ids, chunks, metadatas)
+                    doba_embeddingu = time.perf_counter() - t0
+                    cas_embeddingu += doba_embeddingu
+                    print(
+                        f"✅ Zpracováno: {fname} ({get_banka_from_filename(fname)}) — {len(chunks)} bloků"
+                        f"{f' (+{duplicitnich} sloučených duplikátů)' if duplicitnich else ''} "
+                        f"⏱️ parsování {doba_parsovani:.2f} s, embedding {doba_embeddingu:.2f} s"
+                    )
+
+            soubory[fname] = {
+                "hash": aktualni[fname],
+                "banka": get_banka_from_filename(fname),
+                "pocet_chunku": len(ids),
+                "duplicitnich": duplicitnich,
+                "zavisi_na": dedup.zavislosti(fname),
             }
-            embedding = model.encode(f"passage: {chunk}").tolist()
-            collection.add(
-                documents=[chunk],
-                embeddings=[embedding],
-                metadatas=[metadata],
-                ids=[f"{fname}_{i}"]
-            )
-        print(f"✅ Zpracováno: {fname} ({banka}) — {len(chunks)} bloků")
+            uloz_manifest(manifest)
+
+        except Exception as e:
+            print(f"❌ Chyba při zpracování {fname}: {e}")
+
+    # Nové chunky platnost ještě nemají a sloučené duplikáty mohly rozšířit platnost kanonických
+    aktualizuj_platnosti(collection, manifest, vynutit=True)
+    statistiky = dedup.statistiky()
+    manifest["deduplikace"] = statistiky
+    uloz_manifest(manifest)
+
+    celkem = time.perf_counter() - start
+    print(
+        f"\n🧬 Deduplikace: {statistiky['sloucenych']} z {statistiky['chunku_celkem']} chunků sloučeno, "
+        f"index menší o {statistiky['uspora']:.1%} ({statistiky['chunku_v_indexu']} chunků v ChromaDB)"
+    )
+    print(f"⏱️ Celkem {celkem:.1f} s (součet parsování {cas_parsovani:.1f} s, embedding {cas_embeddingu:.1f} s)")
+    print(f"✅ Znalostní databáze úspěšně aktualizována ({len(zmenene)} souborů přeindexováno, {len(odstranene)} odstraněno).")
+    exportuj_numpy(collection, manifest, numpy_dtype)
 
-    except Exception as e:
-        print(f"❌ Chyba při zpracování {fname}: {e}")
 
-print("\n✅ Znalostní databáze úspěšně rozšířena.")
-input("\nStiskni Enter pro ukončení...")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inkrementální indexace metodik do ChromaDB.")
+    parser.add_argument("--vse", action="store_true", help="smaže kolekci i manifest a zaindexuje vše znovu")
+    parser.add_argument("--procesy", type=int, default=None, help="počet procesů pro parsování dokumentů")
+    parser.add_argument("--numpy-dtype", choices=PODPOROVANE_DTYPE, default="float32",
+                        help="typ matice NumPy úložiště (float16/int8 šetří místo, float32 je nejrychlejší)")
+    parser.add_argument("--bez-numpy", action="store_true", help="neexportovat NumPy úložiště")
+    parser.add_argument("--dedup-prah", type=float, default=DEDUP_PRAH,
+                        help="odhad Jaccardovy podobnosti, od kterého se chunky slučují (nad 1 = neslučovat)")
+    parser.add_argument("--vytahy-stran", action="store_true",
+                        help=f"uložit každou stranu PDF zvlášť do {VYTAHY_PATH}/ (odkazy citací na jednu stranu)")
+    args = parser.parse_args()
+    main(vse=args.vse, procesy=args.procesy, numpy_dtype=None if args.bez_numpy else args.numpy_dtype,
+         dedup_prah=args.dedup_prah, vytahy=args.vytahy_stran)
+    if sys.stdin.isatty():
+        input("\nStiskni Enter pro ukončení...")
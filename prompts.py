@@ -0,0 +1,342 @@
+import os
+import json
+import threading
+
+from structured_answer import POKYNY_JSON
+
+# === Systémové prompty (statický prefix – mezi dotazy se nemění, takže ho OpenAI může cachovat) ===
+SYSTEM_PROMPT_VYBER = (
+    "Jsi asistent pro výběr nejrelevantnějšího úryvku textu k danému dotazu. "
+    "Dostaneš dotaz a několik úryvků s citacemi. Vyber jen ten jeden úryvek, "
+    "který je pro zodpovězení dotazu nejrelevantnější. Pokud je to možné, upřednostni chunk, "
+    "který obsahuje nejvíce konkrétních informací k dotazu. V odpovědi vypiš přesně vybraný úryvek "
+    "a jeho citaci ve formátu: <chunk>\nUmístění: <citace>."
+)
+
+# Části promptu pro odpověď; router.py podle typu dotazu vybere jen pokyny pro daný typ
+_UVOD_ODPOVED = (
+    "Jsi expertní asistent na hypotéky a posuzování bonity klientů podle interních metodik bank.\n\n"
+)
+
+_KLASIFIKACE = (
+    "🔍 Nejprve zjisti, co je vstupem uživatele:\n"
+    "1. Pokud jde o plnohodnotný dotaz, klasifikuj ho interně do jedné z těchto kategorií:\n"
+    "   - výčtový\n"
+    "   - Dotazy typu „které banky…“ vždy považuj za výčtové bez ohledu na další strukturu dotazu.\n"
+    "   - srovnávací\n"
+    "   - faktický\n"
+    "   - podmínkový\n"
+    "   - kombinovaný\n"
+)
+
+_ROZSAH = (
+    "Pokud vstup není úplným dotazem (např. jen fragment jako „výživné jako příjem žadatele“), logicky odvoď, co uživatel pravděpodobně zjišťuje, a pokračuj podle odpovídající logiky.\n",
+    "Pokud dotaz neobsahuje název konkrétní banky, agreguj odpovědi napříč všemi dostupnými dokumenty. Nikdy se nespokojuj pouze s jedním úryvkem nebo jednou bankou.\n",
+    "Pokud dotaz obsahuje konkrétní banku, pracuj primárně s dokumenty této banky. Ostatní dokumenty zvaž pouze tehdy, pokud je tato banka výslovně zmíněna jinde nebo pokud vlastní dokument chybí.\n",
+)
+
+POKYNY_TYPU = {
+    "vyctovy": (
+        "- Výčtový: Vypiš každou banku, která podmínku splňuje. Každou zvlášť se stručným shrnutím a citací.\n"
+        "  ➕ Pokud máš chunk pro danou banku, ale nenacházíš v něm přímou zmínku k dotazu, zvaž možnost odpovědi založené na kombinaci dotazu a názvu banky. Shrň i nepřímé nebo kontextové informace, pokud jsou v chuncích uvedeny.\n"
+        "  ➕ Pokud dotaz směřuje na to, **které banky něco umožňují, akceptují, podporují, tolerují nebo zohledňují**, vždy jej považuj za výčtový – i když se zdá být podmínkový nebo faktický.\n"
+    ),
+    "srovnavaci": (
+        "- Srovnávací: Porovnej hodnoty napříč bankami a uveď pouze tu nejlepší (nebo několik s nejvyšší hodnotou).\n"
+    ),
+    "fakticky": (
+        "- Faktický: Odpověz přesně a s citací. Pokud informace chybí, napiš to jasně.\n"
+    ),
+    "podminkovy": (
+        "- Podmínkový: Popiš okolnosti, za kterých situace nastává. Přidej citace.\n"
+        "  ➕ Pokud dotaz obsahuje podmínku („pokud...“, „za jakých podmínek...“), ale cílí na více subjektů (např. „které banky“), nejprve vyfiltruj všechny relevantní banky jako ve výčtovém dotazu a pak u každé z nich uveď podmínky.\n"
+    ),
+    "kombinovany": (
+        "- Kombinovaný: Vyfiltruj banky splňující podmínku a mezi nimi srovnej výhodnost. Výsledek uveď jen pro ty nejlepší.\n"
+    ),
+}
+
+_PRAVIDLA = (
+    "🛑 Pravidla přesnosti:\n"
+    "- Vycházej výhradně z úryvků z dokumentů v databázi (ChromaDB).\n"
+    "- Nevymýšlej informace. Nepoužívej web ani obecné znalosti.\n"
+    "- Nepřiřazuj informace k bankám, které je výslovně neuvádějí.\n"
+    "- V odpovědi používej názvy bank přesně dle dokumentů:\n"
+    "  • Hypoteky_KB.pdf → Komerční banka\n"
+    "  • Hypoteky_mB.pdf → mBank\n"
+    "  • Hypoteky_CS.pdf → Česká spořitelna\n"
+    "  • Hypoteky_ČSOBHB.pdf → ČSOB Hypoteční banka\n"
+    "  • Hypoteky_UCB.pdf → UniCredit Bank\n"
+    "  • Hypoteky_OB.pdf → Oberbank AG\n"
+    "  • Hypoteky_RB_bonita_podnikani.pdf → Raiffeisenbank\n\n"
+    "♻️ Zaměnitelné výrazy:\n"
+    "- „americká hypotéka“ = „neúčelový hypoteční úvěr“ = „neúčelová hypotéka“ = „neúčelová část hypotečního úvěru“\n"
+    "- „účelová hypotéka“ není totéž jako „americká hypotéka“. Nezaměňuj tyto pojmy.\n"
+    "  Pokud je v dotazu zmíněna americká hypotéka, ignoruj informace o účelových hypotékách.\n\n"
+)
+
+_STRUKTURA = (
+    "📋 Struktura odpovědi:\n"
+    "- Použij přehledný formát ve stylu Markdown:\n"
+    "  • Každou banku začni nadpisem třetí úrovně: ### 🏦 [Název banky]\n"
+    "  • Každou část označ tučně: **Podmínky:**, **Výpočet:**, **Doložení:** apod.\n"
+    "  • Podmínky a detaily strukturovaně ve formě odrážek: - ...\n"
+    "  • Pokud existuje více oblastí, rozděl je logicky a vizuálně\n"
+    "  • Na konec každého bloku přidej citaci: 📄 Citace: (dokument: <název>, strana: <číslo>, kapitola: <číslo>)\n\n"
+    "🧠 Poznámka:\n"
+    "- Interní úvahy (např. „Dotaz je výčtový“) nezobrazuj uživateli.\n"
+    "- Odpověď začni rovnou užitečnou informací.\n"
+    "  Například místo:\n"
+    "  „Dotaz je výčtový. Uživatel se ptá, které banky akceptují výživné...“\n"
+    "  napiš přímo:\n"
+    "  „Banky, které akceptují výživné jako příjem žadatele:“\n"
+)
+
+SYSTEM_PROMPT_ODPOVED = (
+    _UVOD_ODPOVED
+    + _KLASIFIKACE
+    + "".join(f"{i}. {pokyn}" for i, pokyn in enumerate(_ROZSAH, start=2))
+    + "\n🧩 Instrukce podle typu dotazu:\n"
+    + "".join(POKYNY_TYPU.values())
+    + "\n"
+    + _PRAVIDLA
+    + _STRUKTURA
+)
+
+NAZVY_TYPU = {
+    "vyctovy": "výčtový",
+    "srovnavaci": "srovnávací",
+    "fakticky": "faktický",
+    "podminkovy": "podmínkový",
+    "kombinovany": "kombinovaný",
+}
+
+# Typ určil router předem – model dotaz znovu neklasifikuje a dostane jen pokyny pro svůj typ.
+# Každý prompt je pořád statický, takže i tyto prefixy může OpenAI cachovat.
+SYSTEM_PROMPTY_TYPU = {
+    typ: (
+        _UVOD_ODPOVED
+        + f"🔍 Dotaz je {NAZVY_TYPU[typ]} (typ je určen předem, neklasifikuj ho znovu).\n"
+        + "".join(f"- {pokyn}" for pokyn in _ROZSAH)
+        + "\n🧩 Instrukce pro tento typ dotazu:\n"
+        + pokyny
+        + "\n"
+        + _PRAVIDLA
+        + _STRUKTURA
+    )
+    for typ, pokyny in POKYNY_TYPU.items()
+}
+
+# Režim jednoho volání: stejná pravidla, ale místo Markdownu JSON, který vykreslíme sami
+SYSTEM_PROMPT_JSON = (
+    SYSTEM_PROMPT_ODPOVED.split("📋 Struktura odpovědi:")[0]
+    + POKYNY_JSON
+    + "- Hodnota \"banka\" je přesně název z nadpisu „## Banka: …“, pod kterým je úryvek uveden.\n"
+)
+
+
+# === Počítání tokenů ===
+TOKENIZER_MODEL = os.getenv("LLM_MODEL", "gpt-4o")
+_kodovani = None
+_kodovani_lock = threading.Lock()
+_bez_tiktokenu = False
+
+
+def _ziskej_kodovani():
+    """tiktoken se načítá líně; bez balíčku nebo bez staženého slovníku (offline) se tokeny odhadují."""
+    global _kodovani, _bez_tiktokenu
+    if _kodovani is not None or _bez_tiktokenu:
+        return _kodovani
+    with _kodovani_lock:
+        if _kodovani is None and not _bez_tiktokenu:
+            try:
+                import tiktoken
+                try:
+                    _kodovani = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+                except KeyError:
+                    _kodovani = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                print(f"⚠️ tiktoken není k dispozici ({e}), tokeny se odhadují")
+                _bez_tiktokenu = True
+    return _kodovani
+
+
+def pocet_tokenu(text: str) -> int:
+    kodovani = _ziskej_kodovani()
+    if kodovani is None:
+        return max(1, len(text) // 4)
+    return len(kodovani.encode(text))
+
+
+def tokenizer_popis() -> str:
+    return "tiktoken" if _ziskej_kodovani() is not None else "odhad"
+
+
+def zkrat_na_tokeny(text: str, max_tokenu: int) -> str:
+    kodovani = _ziskej_kodovani()
+    if kodovani is None:
+        return text[: max_tokenu * 4]
+    tokeny = kodovani.encode(text)
+    return text if len(tokeny) <= max_tokenu else kodovani.decode(tokeny[:max_tokenu])
+
+
+# === Komprese kontextu ===
+PROMPT_MAX_TOKENU = int(os.getenv("PROMPT_MAX_TOKENS", "4000"))             # celý vstup jednoho volání pro banku
+PROMPT_MAX_TOKENU_JSON = int(os.getenv("PROMPT_MAX_TOKENS_JSON", "12000"))  # jedno volání pro všechny banky
+MIN_TOKENU_USEKU = 80     # kratší zbytek úryvku už do promptu nedáváme
+MAX_PREKRYV = 300         # znaky; starší chunkování mělo mezi sousedy překryv 150 znaků
+MIN_PREKRYV = 20
+
+
+def odstran_prekryv(predchozi: str, dalsi: str) -> str:
+    """Odřízne ze začátku `dalsi` text, kterým končí `predchozi` (překryv sousedních chunků)."""
+    for delka in range(min(MAX_PREKRYV, len(predchozi), len(dalsi)), MIN_PREKRYV - 1, -1):
+        if predchozi.endswith(dalsi[:delka]):
+            return dalsi[delka:].lstrip()
+    return dalsi
+
+
+def _rozsah_stran(metadata: list[dict]):
+    strany = [m["strana"] for m in metadata if isinstance(m.get("strana"), int)]
+    if not strany:
+        return "?"
+    od = min(strany)
+    do = max(m.get("strana_do", m["strana"]) for m in metadata if isinstance(m.get("strana"), int))
+    return str(od) if od == do else f"{od}–{do}"
+
+
+def dalsi_zdroje(meta: dict) -> list[dict]:
+    """Místa, odkud byly do chunku sloučeny téměř shodné pasáže (prepare_db.py, dedup.py)."""
+    try:
+        return json.loads(meta.get("dalsi_zdroje") or "[]")
+    except ValueError:
+        return []
+
+
+def citace_z_metadat(meta: dict, strana=None) -> str:
+    """Citace chunku; u sloučených duplikátů následují citace všech dalších míst se stejným textem."""
+    strana = meta.get("strana", "?") if strana is None else strana
+    citace = [f"(dokument: {meta.get('document_source', '?')}, strana: {strana}, kapitola: {meta.get('kapitola', '?')})"]
+    for zdroj in dalsi_zdroje(meta):
+        citace.append(
+            f"(dokument: {zdroj.get('document_source', '?')}, strana: {_rozsah_stran([zdroj])}, "
+            f"kapitola: {zdroj.get('kapitola', '?')})"
+        )
+    return " ".join(citace)
+
+
+def sluc_sousedni(banka_data: dict) -> list[tuple[str, str]]:
+    """
+    Úryvky banky jako (text, citace) v pořadí relevance. Chunky stejného dokumentu,
+    které po sobě v dokumentu bezprostředně následují (metadata "cast"), se slijí
+    do jednoho úryvku bez překryvu; pořadí sloučeného úryvku určuje jeho nejlepší část.
+    """
+    chunks, citace = banka_data["chunks"], banka_data["citace"]
+    metadata = banka_data.get("metadata")
+    if not metadata:
+        return list(zip(chunks, citace))
+
+    # skupina = souvislý úsek (dokument, cast..cast+n); index v seznamu = pořadí relevance
+    podle_pozice = sorted(
+        (i for i in range(len(chunks)) if isinstance(metadata[i].get("cast"), int)),
+        key=lambda i: (metadata[i].get("document_source", ""), metadata[i]["cast"]),
+    )
+    skupiny = []
+    for i in podle_pozice:
+        posledni = skupiny[-1][-1] if skupiny else None
+        if (
+            posledni is not None
+            and metadata[posledni].get("document_source") == metadata[i].get("document_source")
+            and metadata[i]["cast"] - metadata[posledni]["cast"] == 1
+        ):
+            skupiny[-1].append(i)
+        else:
+            skupiny.append([i])
+    ve_skupine = {i for skupina in skupiny for i in skupina}
+    skupiny += [[i] for i in range(len(chunks)) if i not in ve_skupine]
+    skupiny.sort(key=min)
+
+    uryvky = []
+    for skupina in skupiny:
+        if len(skupina) == 1:
+            uryvky.append((chunks[skupina[0]], citace[skupina[0]]))
+            continue
+        text = chunks[skupina[0]]
+        for i in skupina[1:]:
+            text = text + "\n" + odstran_prekryv(text, chunks[i])
+        cit = citace_z_metadat(metadata[skupina[0]], strana=_rozsah_stran([metadata[i] for i in skupina]))
+        uryvky.append((text, cit))
+    return uryvky
+
+
+def vyber_do_rozpoctu(uryvky: list[tuple[str, str]], rozpocet: int) -> list[tuple[str, str]]:
+    """Úryvky v pořadí relevance, dokud se vejdou do rozpočtu tokenů; poslední se případně zkrátí."""
+    vybrane, zbyva = [], rozpocet
+    for text, cit in uryvky:
+        n = pocet_tokenu(text) + pocet_tokenu(cit) + 4
+        if n <= zbyva:
+            vybrane.append((text, cit))
+            zbyva -= n
+            continue
+        if zbyva - pocet_tokenu(cit) - 4 >= MIN_TOKENU_USEKU:
+            vybrane.append((zkrat_na_tokeny(text, zbyva - pocet_tokenu(cit) - 4) + " …", cit))
+        break
+    return vybrane
+
+
+def formatuj_uryvky(uryvky: list[tuple[str, str]]) -> str:
+    return "\n\n".join(f"{text}\nUmístění: {cit}" for text, cit in uryvky)
+
+
+def _rozpocet(celkem: int, system: str, *dynamicke: str) -> int:
+    return max(MIN_TOKENU_USEKU, celkem - pocet_tokenu(system) - sum(pocet_tokenu(t) for t in dynamicke) - 20)
+
+
+# === Sestavení zpráv ===
+# Systémový prompt je vždy první a beze změn; vše proměnné (dotaz, úryvky) je až v uživatelské zprávě.
+def prompt_vyber(dotaz: str, banka_data: dict) -> list[dict]:
+    hlavicka = f"Dotaz: {dotaz}\n\nÚryvky:\n\n"
+    uryvky = vyber_do_rozpoctu(
+        sluc_sousedni(banka_data), _rozpocet(PROMPT_MAX_TOKENU, SYSTEM_PROMPT_VYBER, hlavicka)
+    )
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT_VYBER},
+        {"role": "user", "content": hlavicka + formatuj_uryvky(uryvky)},
+    ]
+
+
+def prompt_odpoved(
+    dotaz: str, banka_nazev: str, banka_data: dict = None, vybrany_uryvek: str = None, typ: str = None
+) -> list[dict]:
+    """
+    Odpověď pro banku – buď nad úryvky po reranku, nebo nad úryvkem vybraným přes GPT.
+    Se známým typem dotazu (router.py) se použije kratší prompt jen s pokyny pro tento typ.
+    """
+    system = SYSTEM_PROMPTY_TYPU.get(typ, SYSTEM_PROMPT_ODPOVED)
+    if vybrany_uryvek is not None:
+        uvod = f"Zde je nejrelevantnější úryvek pro banku {banka_nazev}:\n\n"
+        obsah = zkrat_na_tokeny(vybrany_uryvek, _rozpocet(PROMPT_MAX_TOKENU, system, dotaz, uvod))
+    else:
+        uvod = f"Zde jsou nejrelevantnější úryvky pro banku {banka_nazev}:\n\n"
+        obsah = formatuj_uryvky(vyber_do_rozpoctu(
+            sluc_sousedni(banka_data), _rozpocet(PROMPT_MAX_TOKENU, system, dotaz, uvod)
+        ))
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": f"Dotaz: {dotaz}\n\n{uvod}{obsah}"},
+    ]
+
+
+def prompt_json(dotaz: str, banky: list[tuple[str, dict]]) -> list[dict]:
+    """Jedno volání pro všechny banky; rozpočet úryvků se dělí mezi banky rovným dílem."""
+    hlavicka = f"Dotaz: {dotaz}\n\nÚryvky podle bank:\n\n"
+    rozpocet = _rozpocet(PROMPT_MAX_TOKENU_JSON, SYSTEM_PROMPT_JSON, hlavicka)
+    na_banku = max(MIN_TOKENU_USEKU, rozpocet // max(1, len(banky)))
+    bloky = [
+        f"## Banka: {nazev}\n\n" + formatuj_uryvky(vyber_do_rozpoctu(sluc_sousedni(data), na_banku))
+        for nazev, data in banky
+    ]
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT_JSON},
+        {"role": "user", "content": hlavicka + "\n\n".join(bloky)},
+    ]
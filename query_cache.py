@@ -0,0 +1,107 @@
+import os
+import re
+import json
+import time
+import threading
+import unicodedata
+from cachetools import TTLCache
+
+
+def normalizuj_dotaz(dotaz: str) -> str:
+    """Klíč cache: bez rozdílu velikosti písmen, mezer a koncové interpunkce."""
+    dotaz = unicodedata.normalize("NFC", dotaz).casefold()
+    dotaz = re.sub(r"\s+", " ", dotaz)
+    return dotaz.strip(" ?!.,;:")
+
+
+class CacheDotazu:
+    """
+    LRU cache s TTL a počítadly zásahů. Hodnota se počítá mimo zámek,
+    takže pomalý výpočet (embedding, dotaz do DB) neblokuje ostatní vlákna.
+    """
+
+    def __init__(self, nazev: str, maxsize: int, ttl: float):
+        self.nazev = nazev
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.cas_vypoctu_s = 0.0
+
+    def ziskej(self, klic, vypocet):
+        with self._lock:
+            if klic in self._cache:
+                self.hits += 1
+                return self._cache[klic]
+            self.misses += 1
+
+        start = time.perf_counter()
+        hodnota = vypocet()
+        doba = time.perf_counter() - start
+
+        with self._lock:
+            self.cas_vypoctu_s += doba
+            self._cache[klic] = hodnota
+        return hodnota
+
+    def vymaz(self):
+        with self._lock:
+            self._cache.clear()
+
+    def statistiky(self) -> dict:
+        with self._lock:
+            prumer = self.cas_vypoctu_s / self.misses if self.misses else 0.0
+            return {
+                "nazev": self.nazev,
+                "velikost": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "prumerny_vypocet_s": round(prumer, 4),
+                "usetreno_s": round(self.hits * prumer, 2),
+            }
+
+
+class VerzeIndexu:
+    """
+    Sleduje verzi indexu, kterou prepare_db.py zapisuje do manifestu.
+    Manifest se znovu načte jen při změně mtime; při nové verzi se zavolá pri_zmene.
+    """
+
+    def __init__(self, manifest_path: str, pri_zmene=None):
+        self.manifest_path = manifest_path
+        self.pri_zmene = pri_zmene
+        self._mtime = None
+        self._verze = "?"
+        self._manifest = {}
+        self._lock = threading.Lock()
+
+    def aktualni(self) -> str:
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        with self._lock:
+            if mtime == self._mtime:
+                return self._verze
+            self._mtime = mtime
+            verze, manifest = "?", {}
+            if mtime is not None:
+                try:
+                    with open(self.manifest_path, "r", encoding="utf-8") as f:
+                        manifest = json.load(f)
+                    verze = manifest.get("index_verze") or str(mtime)
+                except (OSError, ValueError):
+                    verze = str(mtime)
+            zmena = verze != self._verze
+            self._verze = verze
+            self._manifest = manifest
+
+        if zmena and self.pri_zmene:
+            self.pri_zmene()
+        return verze
+
+    def manifest(self) -> dict:
+        """Aktuální obsah manifestu (soubory, banky, počty chunků)."""
+        self.aktualni()
+        return self._manifest
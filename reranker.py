@@ -0,0 +1,82 @@
+import threading
+import numpy as np
+
+
+class CrossEncoderReranker:
+    """Lokální cross-encoder (CPU); model se načte až při prvním použití."""
+
+    def __init__(self, nazev_modelu: str, batch_size: int = 32):
+        self.nazev_modelu = nazev_modelu
+        self.batch_size = batch_size
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _nacti(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                self._model = CrossEncoder(self.nazev_modelu, max_length=512)
+        return self._model
+
+    def skoruj(self, dotaz: str, texty: list[str]) -> list[float]:
+        if not texty:
+            return []
+        skore = self._nacti().predict([(dotaz, text) for text in texty], batch_size=self.batch_size)
+        return [float(s) for s in skore]
+
+
+class BiEncoderReranker:
+    """
+    Kosinová podobnost dotazu a úryvků stejným e5 modelem jako pro vyhledávání.
+    Nepotřebuje další model; úryvky všech bank se kódují v jedné dávce.
+    """
+
+    def __init__(self, model, batch_size: int = 32):
+        self.model = model
+        self.batch_size = batch_size
+
+    def skoruj(self, dotaz: str, texty: list[str]) -> list[float]:
+        if not texty:
+            return []
+        vektory = self.model.encode(
+            [f"query: {dotaz}"] + [f"passage: {text}" for text in texty],
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+        return [float(s) for s in np.asarray(vektory[1:]) @ np.asarray(vektory[0])]
+
+
+def vytvor_reranker(rezim: str, nazev_modelu: str, model):
+    """Režim "cross" = cross-encoder, "bi" = e5 bi-encoder, "gpt" (a cokoli jiného) = výběr úryvku přes GPT."""
+    if rezim == "cross":
+        return CrossEncoderReranker(nazev_modelu)
+    if rezim == "bi":
+        return BiEncoderReranker(model)
+    return None
+
+
+def preranguj_banky(reranker, dotaz: str, banky_map: dict, top_n: int):
+    """
+    Ohodnotí všechny kandidátní chunky všech bank jedním dávkovým průchodem
+    a u každé banky ponechá top_n nejlepších (chunks, citace i metadata ve stejném pořadí).
+    """
+    polozky = [
+        (banka, i)
+        for banka, data in banky_map.items()
+        for i in range(len(data["chunks"]))
+    ]
+    skore = reranker.skoruj(dotaz, [banky_map[banka]["chunks"][i] for banka, i in polozky])
+
+    po_bankach = {}
+    for (banka, i), s in zip(polozky, skore):
+        po_bankach.setdefault(banka, []).append((s, i))
+
+    for banka, data in banky_map.items():
+        nejlepsi = [i for _, i in sorted(po_bankach.get(banka, []), key=lambda x: -x[0])[:top_n]]
+        data["chunks"] = [data["chunks"][i] for i in nejlepsi]
+        data["citace"] = [data["citace"][i] for i in nejlepsi]
+        if "metadata" in data:
+            data["metadata"] = [data["metadata"][i] for i in nejlepsi]
+        data["prerankovano"] = True
+    return banky_map
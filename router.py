@@ -0,0 +1,132 @@
+import os
+import re
+import json
+import threading
+import unicodedata
+import numpy as np
+
+TYPY = ("vyctovy", "srovnavaci", "fakticky", "podminkovy", "kombinovany")
+PRIKLADY_PATH = os.path.join("data", "intent_priklady.json")
+K_SOUSEDU = 3            # skóre typu = průměr podobností tří nejbližších příkladů
+# Menší odstup nejlepšího a druhého typu = nejistá klasifikace; práh podle odstupů na sadě příkladů
+# (benchmark.py, sekce "router") – e5 dává podobnosti v úzkém pásmu, 0.01 propouštělo i záměny
+MIN_ODSTUP = float(os.getenv("ROUTER_MIN_ODSTUP", "0.03"))
+
+# Pravidla ze systémového promptu mají přednost před podobností
+VYCTOVY_RE = re.compile(r"\bktere banky\b|\bkde (akceptuj|umoznuj|beru|financuj)")
+SROVNAVACI_RE = re.compile(r"\bnej(vyssi|nizsi|delsi|kratsi|lepsi|vyhodnejsi|mirnejsi|vetsi|mensi)|\b(porovn|srovn)")
+PODMINKOVY_RE = re.compile(r"\bza jakych podminek\b")
+
+# Parametry pipeline podle typu: hloubka vyhledávání (chunků na banku), kolik bank dostane
+# vlastní volání LLM (None = všechny s výsledky) a úroveň modelu.
+# Faktický dotaz má odpověď v pár chuncích bank s nejlepšími zásahy; výčtový potřebuje všechny banky,
+# ale od každé jen krátké ano/ne. Podmínky a srovnání potřebují víc kontextu a plný model.
+# Zúžené profily (mini, omezení bank) mají jen typy s vysokou přesností na sadě příkladů
+# (benchmark.py, sekce "router" → "po_typech").
+PROFILY = {
+    "fakticky": {"k_na_banku": 4, "max_bank": 4, "model": "mini"},
+    "vyctovy": {"k_na_banku": 4, "max_bank": None, "model": "mini"},
+    "podminkovy": {"k_na_banku": 6, "max_bank": None, "model": "plny"},
+    "srovnavaci": {"k_na_banku": 6, "max_bank": None, "model": "plny"},
+    "kombinovany": {"k_na_banku": 8, "max_bank": None, "model": "plny"},
+}
+# Nejistý typ = původní chování: obecný prompt, výchozí hloubka, všechny banky, plný model
+NEJISTY = {"k_na_banku": None, "max_bank": None, "model": "plny"}
+
+
+def _bez_diakritiky(text: str) -> str:
+    text = unicodedata.normalize("NFD", text.lower())
+    return "".join(c for c in text if unicodedata.category(c) != "Mn")
+
+
+def typ_podle_pravidel(dotaz: str) -> str | None:
+    """„Které banky…“ je vždy výčtový, superlativ srovnávací, obojí kombinovaný."""
+    text = _bez_diakritiky(dotaz)
+    vyctovy, srovnavaci = bool(VYCTOVY_RE.search(text)), bool(SROVNAVACI_RE.search(text))
+    if vyctovy and srovnavaci:
+        return "kombinovany"
+    if vyctovy:
+        return "vyctovy"
+    if srovnavaci:
+        return "srovnavaci"
+    if PODMINKOVY_RE.search(text):
+        return "podminkovy"
+    return None
+
+
+class Router:
+    """
+    Lokální (CPU) určení typu dotazu jednou za dotaz: pravidla z promptu, jinak kosinová
+    podobnost embeddingu dotazu k označeným příkladům (data/intent_priklady.json).
+    Embedding dotazu je týž jako pro vyhledávání – klasifikace je jedno násobení malé matice.
+    Příklady se zakódují při prvním použití (nebo při warm-upu).
+    """
+
+    def __init__(self, koduj, cesta: str = PRIKLADY_PATH, k: int = K_SOUSEDU, min_odstup: float = MIN_ODSTUP):
+        self._koduj = koduj          # seznam textů → matice embeddingů (stejný enkodér a prefix jako dotazy)
+        self.cesta = cesta
+        self.k = k
+        self.min_odstup = min_odstup
+        self._matice = None
+        self._stitky = None
+        self._lock = threading.Lock()
+
+    def _nacti(self):
+        with self._lock:
+            if self._matice is None:
+                with open(self.cesta, "r", encoding="utf-8") as f:
+                    priklady = json.load(f)
+                texty = [(typ, text) for typ in TYPY for text in priklady.get(typ, [])]
+                matice = np.asarray(self._koduj([text for _, text in texty]), dtype=np.float32)
+                normy = np.linalg.norm(matice, axis=1, keepdims=True)
+                self._stitky = np.asarray([TYPY.index(typ) for typ, _ in texty])
+                self._matice = matice / np.where(normy == 0, 1.0, normy)
+        return self._matice, self._stitky
+
+    def klasifikuj(self, dotaz: str, embedding) -> tuple[str | None, float]:
+        """(typ, odstup od druhého nejlepšího typu); typ None = klasifikace je nejistá."""
+        typ = typ_podle_pravidel(dotaz)
+        if typ is not None:
+            return typ, 1.0
+        matice, stitky = self._nacti()
+        vektor = np.asarray(embedding, dtype=np.float32)
+        typ, odstup = self._nejlepsi_typ(matice @ (vektor / (np.linalg.norm(vektor) or 1.0)), stitky)
+        return (typ if odstup >= self.min_odstup else None), round(odstup, 4)
+
+    def _nejlepsi_typ(self, skore, stitky) -> tuple[str | None, float]:
+        po_typech = sorted(
+            (
+                (float(np.sort(skore[stitky == i])[::-1][:self.k].mean()), typ)
+                for i, typ in enumerate(TYPY) if np.any(stitky == i)
+            ),
+            reverse=True,
+        )
+        if not po_typech:
+            return None, 0.0
+        return po_typech[0][1], po_typech[0][0] - (po_typech[1][0] if len(po_typech) > 1 else 0.0)
+
+    def odstupy_prikladu(self) -> list[dict]:
+        """
+        Leave-one-out nad sadou příkladů: každý příklad se klasifikuje podle ostatních.
+        [{"typ", "predikce", "odstup"}] – podklad pro volbu MIN_ODSTUP (benchmark.py).
+        """
+        matice, stitky = self._nacti()
+        vysledky = []
+        for i in range(len(stitky)):
+            ostatni = np.arange(len(stitky)) != i
+            predikce, odstup = self._nejlepsi_typ(matice[ostatni] @ matice[i], stitky[ostatni])
+            vysledky.append({"typ": TYPY[stitky[i]], "predikce": predikce, "odstup": round(odstup, 4)})
+        return vysledky
+
+    def nasmeruj(self, dotaz: str, embedding, zminene_banky: set) -> dict:
+        """
+        {"typ", "jistota", "banky", "k_na_banku", "max_bank", "model"} podle profilu typu.
+        Dotaz na jmenované banky se rozesílá jen jim; podmínkový dotaz na jednu banku stačí menšímu modelu.
+        """
+        typ, jistota = self.klasifikuj(dotaz, embedding)
+        smer = dict(PROFILY.get(typ, NEJISTY), typ=typ, jistota=jistota, banky=sorted(zminene_banky))
+        if zminene_banky:
+            smer["max_bank"] = len(zminene_banky)
+            if len(zminene_banky) == 1 and typ == "podminkovy":
+                smer["model"] = "mini"
+        return smer
@@ -0,0 +1,74 @@
+from pydantic import BaseModel
+
+
+# === Strukturovaná odpověď jednoho volání pro všechny banky ===
+class CitaceJson(BaseModel):
+    dokument: str
+    strana: str | int = "?"
+    kapitola: str | int = "?"
+
+
+class OdpovedBankyJson(BaseModel):
+    banka: str
+    podminky: list[str] = []
+    vypocet: list[str] = []
+    dolozeni: list[str] = []
+    citace: list[CitaceJson] = []
+
+
+class OdpovedJson(BaseModel):
+    banky: list[OdpovedBankyJson] = []
+
+
+POKYNY_JSON = (
+    "📋 Formát odpovědi:\n"
+    "- Odpověz výhradně jedním JSON objektem bez dalšího textu ve tvaru:\n"
+    '  {"banky": [{"banka": "<název banky>", "podminky": ["..."], "vypocet": ["..."], '
+    '"dolozeni": ["..."], "citace": [{"dokument": "<název souboru>", "strana": "<číslo>", "kapitola": "<číslo>"}]}]}\n'
+    "- Každá banka je v poli \"banky\" nejvýše jednou; banky, ke kterým úryvky nic neříkají, vynech.\n"
+    "- Položky polí \"podminky\", \"vypocet\" a \"dolozeni\" jsou krátké samostatné body; nepotřebná pole nech prázdná.\n"
+    "- Citace přebírej přesně z řádků \"Umístění:\" u použitých úryvků.\n"
+)
+
+SEKCE = (
+    ("podminky", "Podmínky"),
+    ("vypocet", "Výpočet"),
+    ("dolozeni", "Doložení"),
+)
+
+
+def vyrenderuj_banku(odpoved: OdpovedBankyJson) -> str:
+    """Markdown blok banky ve stejné podobě, jakou dříve psal GPT (### 🏦, tučné sekce, citace)."""
+    radky = [f"### 🏦 {odpoved.banka}", ""]
+    for pole, nadpis in SEKCE:
+        body = [bod.strip() for bod in getattr(odpoved, pole) if bod.strip()]
+        if body:
+            radky.append(f"**{nadpis}:**")
+            radky.append("")
+            radky.extend(f"- {bod}" for bod in body)
+            radky.append("")
+    for citace in odpoved.citace:
+        radky.append(f"📄 Citace: (dokument: {citace.dokument}, strana: {citace.strana}, kapitola: {citace.kapitola})")
+        radky.append("")
+    return "\n".join(radky).strip()
+
+
+def rozloz_odpoved_json(text: str) -> list[dict]:
+    """
+    JSON z modelu → seznam {"banka", "markdown", "strukturovana"} v pořadí bank.
+    Duplicitní banky se sloučí zde, bez regexů nad Markdownem. Nevalidní JSON vyhodí ValidationError.
+    """
+    odpoved = OdpovedJson.model_validate_json(text)
+    sloucene: dict[str, OdpovedBankyJson] = {}
+    for banka in odpoved.banky:
+        if banka.banka not in sloucene:
+            sloucene[banka.banka] = banka.model_copy(deep=True)
+            continue
+        cil = sloucene[banka.banka]
+        for pole in ("podminky", "vypocet", "dolozeni", "citace"):
+            stavajici = getattr(cil, pole)
+            stavajici.extend(x for x in getattr(banka, pole) if x not in stavajici)
+    return [
+        {"banka": nazev, "markdown": vyrenderuj_banku(banka), "strukturovana": True}
+        for nazev, banka in sloucene.items()
+    ]
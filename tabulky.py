@@ -0,0 +1,536 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+import unicodedata
+from collections import defaultdict
+
+SLOVO_RE = re.compile(r"[a-z0-9]+")
+ICO_RE = re.compile(r"\bic(?:o)?\s*:?\s*(\d{6,8})\b|\b(\d{8})\b")
+KOD_ZEME_RE = re.compile(r"(?<![\w])([A-Z]{3})\s+(?=[A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ])")
+PRAVNI_FORMA_RE = re.compile(r"(?: (?:spol s r o|s r o|a s|k s|v o s|o p s|se))+$")
+MAX_ZASAHU = 20
+MAX_DELKA_NGRAMU = 5
+MIN_DELKA_PREFIXU = 5    # jednoslovný prefix kratší by chytal běžná slova dotazu
+MAX_KONCOVKA = 3         # kmen jména ve tvaru z dotazu („rusk“ z „Ruska“) + nejvýš tolik písmen koncovky
+VERZE_KLICU = 2          # PRAGMA user_version; při změně se klíče přegenerují z uložených záznamů
+
+
+def slozeny_klic(text) -> str:
+    """Vyhledávací klíč: malá písmena bez diakritiky, jen slova oddělená mezerou („Pietro filipi, a.s.“ → „pietro filipi a s“)."""
+    text = unicodedata.normalize("NFD", str(text).lower())
+    text = "".join(c for c in text if unicodedata.category(c) != "Mn")
+    return " ".join(SLOVO_RE.findall(text))
+
+
+def bez_pravni_formy(klic: str) -> str:
+    """„sberbank cz a s“ → „sberbank cz“; klíč bez právní formy na konci (a.s., s.r.o., k.s., spol. s r.o.…)."""
+    return PRAVNI_FORMA_RE.sub("", klic)
+
+
+# === Definice tabulek ===
+# hlavicka: složený název sloupce v souboru → pole záznamu; klice: pole, podle kterých se hledá;
+# temata: tvary slova, kterým se dotaz na tabulku ptá (celé slovo, ne prefix – „zemědělec“ není „země“)
+TABULKY = {
+    "rizikovi_zamestnavatele": {
+        "nadpis": "Seznam rizikových zaměstnavatelů",
+        "hlavicka": {"nazev": "nazev", "ic": "ico", "rizikovost": "rizikovost", "poznamka": "poznamka"},
+        "klice": ("nazev", "ico"),
+        "temata": r"zamestnavatel\w*",
+    },
+    "odhadci": {
+        "nadpis": "Externí odhadci",
+        "hlavicka": {
+            "region": "region", "jmeno": "jmeno", "evidencni cislo": "evidencni_cislo", "typ": "typ",
+            "pracoviste": "pracoviste", "psc": "psc", "obec": "obec", "email": "email", "mobil": "mobil",
+        },
+        "klice": ("jmeno", "evidencni_cislo", "obec", "region", "psc"),
+        "temata": r"odhadc\w*",
+    },
+    "produkty": {
+        "nadpis": "Produkty a služby",
+        # Ostatní sloupce (účely, délky, fixace…) jdou beze změny názvu do "vlastnosti"
+        "hlavicka": {"produkt sluzba": "nazev"},
+        "klice": ("nazev",),
+        "temata": r"produkt\w*",
+    },
+    "rizikove_zeme": {
+        "nadpis": "Vysoce rizikové země",
+        "hlavicka": {},
+        "klice": ("nazev", "kod"),
+        "temata": r"zem(?:e|i|ich|im|emi)",
+    },
+}
+
+# Slova, která v dotazu na seznam popisují téma, ne hledaný subjekt
+POMOCNA_SLOVA = {
+    "a", "v", "ve", "z", "ze", "u", "na", "do", "od", "pro", "po", "je", "jsou", "byl", "byla", "mame", "ma",
+    "muze", "lze", "jak", "jaky", "jaka", "jake", "ktery", "ktera", "ktere", "kde", "kdo", "co", "ci", "nebo",
+    "seznam", "seznamu", "rizikovy", "rizikova", "rizikove", "rizikovych", "rizikovem", "rizikovost", "vysoce",
+    "firma", "firmy", "spolecnost", "ico", "ic", "mi", "dej", "ukaz", "prosim", "externi", "externich", "externiho",
+}
+# Slova o úvěru a žadateli: subjektem v tabulce nejsou, ale dotaz s nimi se ptá na víc než na seznam
+UVEROVA_SLOVA = {
+    "klient", "klienta", "zadatel", "zadatele", "banka", "banky", "hypoteka", "hypoteky", "hypoteku",
+    "uver", "uveru", "prijem", "prijmu", "akceptovat", "akceptuje",
+}
+STOP_SLOVA = POMOCNA_SLOVA | UVEROVA_SLOVA
+# Výslovná žádost o výpis tabulky („seznam odhadců“, „vypiš rizikové země“); „na seznamu“ se ptá na subjekt
+VYPIS_SLOVA = {"seznam", "vypis", "vypiste", "vypsat", "vsechny", "vsechni"}
+TEMATA_RE = {tabulka: re.compile(definice["temata"]) for tabulka, definice in TABULKY.items()}
+
+
+def _je_tematicke(slovo: str) -> bool:
+    return slovo in STOP_SLOVA or slovo in VYPIS_SLOVA or any(r.fullmatch(slovo) for r in TEMATA_RE.values())
+
+
+def _je_pomocne(slovo: str) -> bool:
+    return slovo in POMOCNA_SLOVA or slovo in VYPIS_SLOVA or any(r.fullmatch(slovo) for r in TEMATA_RE.values())
+
+
+def temata_dotazu(klic_dotazu: str) -> list[str]:
+    """Tabulky, na které se dotaz ptá podle klíčových slov („zaměstnavatel“, „odhadce“, „země“…)."""
+    slova = klic_dotazu.split()
+    return [tabulka for tabulka, vzor in TEMATA_RE.items() if any(vzor.fullmatch(slovo) for slovo in slova)]
+
+
+def je_vypis(klic_dotazu: str) -> bool:
+    return bool(VYPIS_SLOVA.intersection(klic_dotazu.split()))
+
+
+def ico_v_dotazu(dotaz: str) -> list[str]:
+    """IČO zapsaná v dotazu – za „IČ/IČO“ 6–8 číslic, jinak samostatné osmimístné číslo."""
+    return [(a or b).zfill(8) for a, b in ICO_RE.findall(slozeny_klic(dotaz))]
+
+
+# === Extrakce řádků ze souborů (prepare_db.py) ===
+def _hodnota(hodnota, ano_ne: bool = False):
+    """Buňka z pandas → JSON hodnota: NaN → None, celá čísla z Excelu bez „.0“, volitelně A/N → bool."""
+    if hodnota is None or (isinstance(hodnota, float) and hodnota != hodnota):
+        return None
+    if isinstance(hodnota, float) and hodnota.is_integer():
+        return int(hodnota)
+    if hasattr(hodnota, "isoformat"):
+        return hodnota.isoformat()[:10]
+    if isinstance(hodnota, str):
+        hodnota = hodnota.strip()
+        if ano_ne and hodnota.upper() in ("A", "N"):
+            return hodnota.upper() == "A"
+        return hodnota or None
+    return hodnota
+
+
+def _typuj(tabulka: str, zaznam: dict) -> dict:
+    if zaznam.get("ico") is not None:
+        zaznam["ico"] = re.sub(r"\D", "", str(zaznam["ico"])).zfill(8)
+    if tabulka == "odhadci":
+        for pole in ("psc", "evidencni_cislo", "mobil"):
+            if zaznam.get(pole) is not None:
+                zaznam[pole] = str(zaznam[pole])
+    return zaznam
+
+
+def radky_z_listu(radky: list[list]) -> tuple[str, list[dict]] | None:
+    """
+    Najde v listu hlavičku některé z tabulek (první řádek, který obsahuje všechny její sloupce)
+    a vrátí (tabulka, záznamy). Řádky nad hlavičkou (titulek, platnost) se přeskočí.
+    """
+    for i, radek in enumerate(radky):
+        nazvy = [slozeny_klic(h) if _hodnota(h) is not None else "" for h in radek]
+        for tabulka, definice in TABULKY.items():
+            if not definice["hlavicka"] or not all(s in nazvy for s in definice["hlavicka"]):
+                continue
+            zaznamy = []
+            for cislo, data in enumerate(radky[i + 1:], start=i + 2):
+                zaznam = {"radek": cislo}
+                vlastnosti = {}
+                for nazev, puvodni, hodnota in zip(nazvy, radek, data):
+                    if not nazev:
+                        continue
+                    if nazev in definice["hlavicka"]:
+                        zaznam[definice["hlavicka"][nazev]] = _hodnota(hodnota)
+                    elif _hodnota(hodnota) is not None:
+                        vlastnosti[str(puvodni).strip()] = _hodnota(hodnota, ano_ne=True)
+                if vlastnosti and tabulka == "produkty":
+                    zaznam["vlastnosti"] = vlastnosti
+                hlavni = definice["klice"][0]
+                if zaznam.get(hlavni) is not None:
+                    zaznamy.append(_typuj(tabulka, zaznam))
+            return tabulka, zaznamy
+    return None
+
+
+DUVODY_ZEME = ("Seznam EU", "Opatření", "Neúvěrovatelný", "Neakceptovatelné", "Usnesení")
+
+
+def zeme_z_textu(text: str) -> list[dict]:
+    """
+    Řádky seznamu rizikových zemí z textu PDF: ISO kód (3 písmena), název země, důvod zařazení.
+    Text tabulky je po extrakci rozházený do řádků, proto se dělí podle kódů, ne podle řádků.
+    """
+    text = " ".join(text.split())
+    zacatky = [m for m in KOD_ZEME_RE.finditer(text) if m.group(1) not in ("ISO", "CPL")]
+    zaznamy = []
+    for m, dalsi in zip(zacatky, zacatky[1:] + [None]):
+        usek = text[m.end():dalsi.start() if dalsi else len(text)].strip()
+        pozice = [usek.find(d) for d in DUVODY_ZEME if usek.find(d) > 0]
+        konec_nazvu = min(pozice) if pozice else len(usek)
+        nazev, duvod = usek[:konec_nazvu].strip(" ,"), usek[konec_nazvu:].strip()
+        if 1 < len(nazev) <= 60 and not any(c.isdigit() for c in nazev):
+            zaznamy.append({"kod": m.group(1), "nazev": nazev, "duvod": duvod or None})
+    return zaznamy
+
+
+def muze_obsahovat_tabulky(fname: str) -> bool:
+    ext = os.path.splitext(fname)[1].lower()
+    return ext == ".xlsx" or (ext == ".pdf" and "rizikovych zemi" in slozeny_klic(fname))
+
+
+def extrahuj_tabulky(path: str) -> list[tuple[str, str, list[dict]]]:
+    """Seznam (tabulka, list nebo strana, záznamy) nalezených v souboru."""
+    fname = os.path.basename(path)
+    ext = os.path.splitext(fname)[1].lower()
+    nalezene = []
+    if ext == ".xlsx":
+        import pandas as pd
+        xls = pd.ExcelFile(path)
+        for sheet in xls.sheet_names:
+            df = xls.parse(sheet, header=None)
+            tabulka = radky_z_listu(df.values.tolist())
+            if tabulka:
+                nalezene.append((tabulka[0], sheet, tabulka[1]))
+    elif ext == ".pdf" and muze_obsahovat_tabulky(fname):
+        from PyPDF2 import PdfReader
+        for i, page in enumerate(PdfReader(path).pages):
+            zeme = zeme_z_textu(page.extract_text() or "")
+            if zeme:
+                nalezene.append(("rizikove_zeme", str(i + 1), zeme))
+    return nalezene
+
+
+# === Úložiště ===
+def klice_zaznamu(tabulka: str, zaznam: dict) -> set[str]:
+    """Složené klíče záznamu; názvy firem i bez právní formy („Sberbank CZ, a.s.“ → „sberbank cz“)."""
+    klice = {slozeny_klic(zaznam[pole]) for pole in TABULKY[tabulka]["klice"] if zaznam.get(pole) is not None}
+    return {k for klic in klice for k in (klic, bez_pravni_formy(klic)) if k}
+
+
+class TabulkovyIndex:
+    """
+    Tabulkové seznamy (rizikoví zaměstnavatelé, odhadci, produkty, rizikové země) jako typované
+    řádky v SQLite. Hledá se podle složených klíčů (název, IČO, země…) přes index – přesně, nebo
+    omezeným prefixem po celých slovech – takže dotaz typu „je firma X na seznamu“ nepotřebuje
+    embedding ani LLM.
+    """
+
+    def __init__(self, cesta: str):
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(cesta) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(cesta, check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS soubory (
+                soubor TEXT PRIMARY KEY,
+                hash TEXT NOT NULL,
+                banka TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS zaznamy (
+                id INTEGER PRIMARY KEY,
+                tabulka TEXT NOT NULL,
+                soubor TEXT NOT NULL,
+                umisteni TEXT NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS klice (
+                klic TEXT NOT NULL,
+                tabulka TEXT NOT NULL,
+                zaznam_id INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_klice_klic ON klice(klic, tabulka);
+            CREATE INDEX IF NOT EXISTS idx_klice_zaznam ON klice(zaznam_id);
+            CREATE INDEX IF NOT EXISTS idx_zaznamy_soubor ON zaznamy(soubor);
+            """
+        )
+        self._conn.commit()
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != VERZE_KLICU:
+            self._pregeneruj_klice()
+
+    def _pregeneruj_klice(self):
+        """Klíče starší verze se odvodí znovu z uložených dat – bez nové extrakce souborů."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("DELETE FROM klice")
+            for zaznam_id, tabulka, data in self._conn.execute("SELECT id, tabulka, data FROM zaznamy").fetchall():
+                self._conn.executemany(
+                    "INSERT INTO klice VALUES (?, ?, ?)",
+                    [(k, tabulka, zaznam_id) for k in klice_zaznamu(tabulka, json.loads(data))],
+                )
+            self._conn.execute(f"PRAGMA user_version = {VERZE_KLICU}")
+            self._conn.commit()
+
+    # === Zápis (prepare_db.py) ===
+    def soubory(self) -> dict:
+        """{soubor: hash} všech souborů, které už prošly extrakcí tabulek (i bez nalezené tabulky)."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT soubor, hash FROM soubory").fetchall())
+
+    def smaz_soubor(self, soubor: str):
+        with self._lock:
+            self._smaz(soubor)
+            self._conn.commit()
+
+    def _smaz(self, soubor: str):
+        self._conn.execute(
+            "DELETE FROM klice WHERE zaznam_id IN (SELECT id FROM zaznamy WHERE soubor = ?)", (soubor,)
+        )
+        self._conn.execute("DELETE FROM zaznamy WHERE soubor = ?", (soubor,))
+        self._conn.execute("DELETE FROM soubory WHERE soubor = ?", (soubor,))
+
+    def nahrad_soubor(self, soubor: str, hash_souboru: str, banka: str, tabulky: list[tuple]):
+        """Nahradí všechny řádky souboru; tabulky = výstup extrahuj_tabulky."""
+        with self._lock:
+            self._smaz(soubor)
+            self._conn.execute("INSERT INTO soubory VALUES (?, ?, ?)", (soubor, hash_souboru, banka))
+            for tabulka, umisteni, zaznamy in tabulky:
+                for zaznam in zaznamy:
+                    zaznam_id = self._conn.execute(
+                        "INSERT INTO zaznamy (tabulka, soubor, umisteni, data) VALUES (?, ?, ?, ?)",
+                        (tabulka, soubor, umisteni, json.dumps(zaznam, ensure_ascii=False)),
+                    ).lastrowid
+                    self._conn.executemany(
+                        "INSERT INTO klice VALUES (?, ?, ?)",
+                        [(k, tabulka, zaznam_id) for k in klice_zaznamu(tabulka, zaznam)],
+                    )
+            self._conn.commit()
+
+    def pocet_zaznamu(self) -> dict:
+        with self._lock:
+            return dict(self._conn.execute("SELECT tabulka, COUNT(*) FROM zaznamy GROUP BY tabulka").fetchall())
+
+    # === Čtení (aplikace) ===
+    def hledej(self, tabulky: list[str], klic: str, druh: str = "presne") -> list[int]:
+        """
+        ID záznamů v daných tabulkách, jejichž klíč se rovná `klic` (druh "presne"), začíná celými
+        slovy `klic` („sberbank“ → „sberbank cz“, druh "slova"), nebo je jednoslovný a od `klic`
+        se liší jen koncovkou („rusk“ → „rusko“, druh "kmen").
+        """
+        mista = ",".join("?" * len(tabulky))
+        if druh == "slova":
+            # Klíče obsahují jen [a-z0-9 ], takže „!“ (hned za mezerou) uzavře rozsah „klic …“
+            podminka, parametry = "(klic = ? OR (klic >= ? AND klic < ?))", (klic, klic + " ", klic + "!")
+        elif druh == "kmen":
+            podminka = "klic >= ? AND klic < ? AND instr(klic, ' ') = 0 AND length(klic) <= ?"
+            parametry = (klic, klic + "\uffff", len(klic) + MAX_KONCOVKA)
+        else:
+            podminka, parametry = "klic = ?", (klic,)
+        with self._lock:
+            radky = self._conn.execute(
+                f"SELECT DISTINCT zaznam_id FROM klice WHERE {podminka} AND tabulka IN ({mista}) "
+                f"ORDER BY zaznam_id LIMIT ?",
+                (*parametry, *tabulky, MAX_ZASAHU + 1),
+            ).fetchall()
+        return [r[0] for r in radky]
+
+    def vypis(self, tabulky: list[str]) -> list[int]:
+        """ID prvních záznamů daných tabulek (o jeden víc než MAX_ZASAHU, aby šlo poznat zkrácení)."""
+        mista = ",".join("?" * len(tabulky))
+        with self._lock:
+            radky = self._conn.execute(
+                f"SELECT id FROM zaznamy WHERE tabulka IN ({mista}) ORDER BY id LIMIT ?",
+                (*tabulky, MAX_ZASAHU + 1),
+            ).fetchall()
+        return [r[0] for r in radky]
+
+    def nacti(self, ids: list[int]) -> list[dict]:
+        """Záznamy včetně tabulky, souboru, banky a umístění (list / strana) pro citaci."""
+        if not ids:
+            return []
+        with self._lock:
+            radky = self._conn.execute(
+                f"SELECT z.id, z.tabulka, z.soubor, s.banka, z.umisteni, z.data FROM zaznamy z "
+                f"JOIN soubory s ON s.soubor = z.soubor WHERE z.id IN ({','.join('?' * len(ids))})",
+                ids,
+            ).fetchall()
+        podle_id = {
+            r[0]: {"tabulka": r[1], "soubor": r[2], "banka": r[3], "umisteni": r[4], "data": json.loads(r[5])}
+            for r in radky
+        }
+        return [podle_id[i] for i in ids if i in podle_id]
+
+    def soubory_tabulky(self, tabulka: str) -> list[tuple]:
+        """(soubor, banka, umístění) všech zdrojů dané tabulky – pro citaci u negativní odpovědi."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT DISTINCT z.soubor, s.banka, z.umisteni FROM zaznamy z JOIN soubory s ON s.soubor = z.soubor "
+                "WHERE z.tabulka = ? ORDER BY z.soubor",
+                (tabulka,),
+            ).fetchall()
+
+    def najdi(self, dotaz: str) -> tuple[list[dict], list[str], list[str], bool]:
+        """
+        Záznamy zmíněné v dotazu: IČO, potom nejdelší úseky slov – nejdřív přesně, pak prefixem:
+        víceslovný úsek nebo slovo od MIN_DELKA_PREFIXU písmen jen po celých slovech klíče
+        („Sberbank“ → „Sberbank CZ“) a jen jméno psané velkým písmenem i bez koncovky („Ruska“ → „Rusko“).
+        Běžná slova dotazu („odhad“, „platí“) tak na tisíce jmen odhadců a obcí nenarazí.
+        Bez tématu se subjekty hledají jen u dotazu „… na seznamu“. Bez shody a bez IČO vrátí výslovná
+        žádost o výpis („seznam odhadců“) první záznamy tabulky.
+        Vrací (záznamy, témata dotazu, nenalezená IČO, jen seznam); „jen seznam“ = kromě nalezených
+        subjektů, IČO a slov tématu dotaz nic dalšího neobsahuje.
+        """
+        klic_dotazu = slozeny_klic(dotaz)
+        temata = temata_dotazu(klic_dotazu)
+        hledane = temata or list(TABULKY)
+        ids = []
+        nenalezena_ico = []
+        ica = ico_v_dotazu(dotaz)
+        for ico in ica:
+            nalezene = self.hledej(hledane, ico)
+            ids.extend(nalezene)
+            if not nalezene:
+                nenalezena_ico.append(ico)
+
+        slova = klic_dotazu.split()
+        na_seznamu = bool(temata) or any(slovo.startswith("seznam") for slovo in slova)
+        jmena = {slozeny_klic(slovo) for slovo in re.findall(r"\w+", dotaz) if slovo[:1].isupper()}
+        pouzite = set()
+        if na_seznamu:
+            for prefix in (False, True):
+                for delka in range(min(MAX_DELKA_NGRAMU, len(slova)), 0, -1):
+                    for i in range(len(slova) - delka + 1):
+                        usek = range(i, i + delka)
+                        if pouzite.intersection(usek):
+                            continue
+                        ngram = slova[i:i + delka]
+                        if _je_tematicke(ngram[0]) or _je_tematicke(ngram[-1]) or ngram[0].isdigit():
+                            continue
+                        for kandidat, druh in _kandidati(ngram, prefix, jmena):
+                            nalezene = self.hledej(hledane, kandidat, druh)
+                            if nalezene:
+                                ids.extend(nalezene)
+                                pouzite.update(usek)
+                                break
+            if temata and not ids and not nenalezena_ico and je_vypis(klic_dotazu):
+                ids = self.vypis(temata)
+        zbyla = [
+            slovo for i, slovo in enumerate(slova)
+            if i not in pouzite and not _je_pomocne(slovo) and not (slovo.isdigit() and slovo.zfill(8) in ica)
+        ]
+        jen_seznam = (na_seznamu or bool(ica)) and not zbyla
+        return self.nacti(list(dict.fromkeys(ids))), temata, nenalezena_ico, jen_seznam
+
+
+def _kandidati(ngram: list[str], prefix: bool, jmena: set) -> list[tuple[str, str]]:
+    """(klíč, druh hledání) pro úsek dotazu; prefixy jen pro víceslovné úseky, dlouhá slova a jména."""
+    if not prefix:
+        return [(" ".join(ngram), "presne")]
+    kandidati = []
+    if len(ngram) > 1 or len(ngram[0]) >= MIN_DELKA_PREFIXU:
+        kandidati.append((" ".join(ngram), "slova"))
+    if len(ngram) == 1 and len(ngram[0]) >= MIN_DELKA_PREFIXU and ngram[0] in jmena:
+        kandidati += [(kmen, "kmen") for kmen in (ngram[0][:-1], ngram[0][:-2]) if len(kmen) >= 4]
+    return kandidati
+
+
+# === Odpověď z tabulek ===
+def _ano_ne(hodnota) -> str:
+    if isinstance(hodnota, bool):
+        return "ano" if hodnota else "ne"
+    return str(hodnota)
+
+
+def formatuj_zaznam(tabulka: str, data: dict) -> str:
+    if tabulka == "rizikovi_zamestnavatele":
+        radek = f"**{data['nazev']}** (IČO {data.get('ico') or '–'}) – rizikovost: {data.get('rizikovost') or '–'}"
+        return radek + (f". {data['poznamka']}" if data.get("poznamka") else "")
+    if tabulka == "rizikove_zeme":
+        return f"**{data['nazev']}** ({data['kod']})" + (f" – {data['duvod']}" if data.get("duvod") else "")
+    if tabulka == "odhadci":
+        casti = [
+            f"ev. č. {data['evidencni_cislo']}" if data.get("evidencni_cislo") else None,
+            data.get("typ"), data.get("pracoviste"),
+            " ".join(str(data[p]) for p in ("psc", "obec") if data.get(p)) or None,
+            data.get("region"), data.get("email"), data.get("mobil"),
+        ]
+        return f"**{data['jmeno']}** – " + ", ".join(str(c) for c in casti if c)
+    vlastnosti = ", ".join(f"{k}: {_ano_ne(v)}" for k, v in data.get("vlastnosti", {}).items())
+    return f"**{data['nazev']}**" + (f" – {vlastnosti}" if vlastnosti else "")
+
+
+def _umisteni(soubor: str, umisteni: str) -> str:
+    if soubor.lower().endswith(".pdf"):
+        return f"(dokument: {soubor}, strana: {umisteni})"
+    return f"(dokument: {soubor}, list: {umisteni})"
+
+
+def _citace(soubor: str, umisteni: str) -> str:
+    return f"📄 Citace: {_umisteni(soubor, umisteni)}"
+
+
+def odpovez_z_tabulek(
+    index: TabulkovyIndex, dotaz: str, normalizuj_banku=lambda b: b, zminene_banky=()
+) -> list[dict] | None:
+    """
+    Odpověď přímo z tabulek ve stejném tvaru jako odpovědi LLM ({"banka", "markdown", "strukturovana"}),
+    jen když se dotaz ptá čistě na seznam („Je Sberbank na seznamu?“, „seznam odhadců“) a nejmenuje banku.
+    Jinak None a dotaz jde běžnou cestou RAG (nalezené řádky doplní podklady_z_tabulek).
+    Negativní odpověď dáváme jen u IČO a dotazu na rizikové zaměstnavatele – tam je shoda jednoznačná.
+    """
+    zaznamy, temata, nenalezena_ico, jen_seznam = index.najdi(dotaz)
+    if not jen_seznam or zminene_banky:
+        return None
+    negativni = nenalezena_ico if "rizikovi_zamestnavatele" in temata else []
+    if not zaznamy and not negativni:
+        return None
+
+    # banka → tabulka → {"radky": [...], "citace": [...], "celkem": n}
+    bloky = defaultdict(lambda: defaultdict(lambda: {"radky": [], "citace": [], "celkem": 0}))
+    for zaznam in zaznamy:
+        blok = bloky[normalizuj_banku(zaznam["banka"])][zaznam["tabulka"]]
+        blok["celkem"] += 1
+        if len(blok["radky"]) < MAX_ZASAHU:
+            blok["radky"].append(formatuj_zaznam(zaznam["tabulka"], zaznam["data"]))
+        citace = _citace(zaznam["soubor"], zaznam["umisteni"])
+        if citace not in blok["citace"]:
+            blok["citace"].append(citace)
+    for ico in negativni:
+        for soubor, banka, umisteni in index.soubory_tabulky("rizikovi_zamestnavatele"):
+            blok = bloky[normalizuj_banku(banka)]["rizikovi_zamestnavatele"]
+            blok["radky"].append(f"IČO {ico} na seznamu není.")
+            citace = _citace(soubor, umisteni)
+            if citace not in blok["citace"]:
+                blok["citace"].append(citace)
+
+    odpovedi = []
+    for banka, tabulky in bloky.items():
+        radky = [f"### 🏦 {banka}", ""]
+        citace = []
+        for tabulka, blok in tabulky.items():
+            radky += [f"**{TABULKY[tabulka]['nadpis']}:**", ""]
+            radky += [f"- {r}" for r in blok["radky"]]
+            if blok["celkem"] > MAX_ZASAHU:
+                radky.append(f"- … zobrazeno prvních {MAX_ZASAHU} záznamů, upřesněte dotaz")
+            radky.append("")
+            citace += blok["citace"]
+        for c in citace:
+            radky += [c, ""]
+        odpovedi.append({"banka": banka, "markdown": "\n".join(radky).strip(), "strukturovana": True})
+    return odpovedi
+
+
+def podklady_z_tabulek(index: TabulkovyIndex, dotaz: str) -> list[dict]:
+    """
+    Nalezené řádky tabulek jako doplňkové úryvky pro RAG ({"banka", "text", "citace", "metadata"}),
+    když se dotaz ptá na víc než na seznam („podmínky u KB pro žadatele ze země Írán“).
+    """
+    zaznamy = index.najdi(dotaz)[0][:MAX_ZASAHU]
+    return [
+        {
+            "banka": zaznam["banka"],
+            "text": f"{TABULKY[zaznam['tabulka']]['nadpis']}: {formatuj_zaznam(zaznam['tabulka'], zaznam['data'])}",
+            "citace": _umisteni(zaznam["soubor"], zaznam["umisteni"]),
+            "metadata": {"document_source": zaznam["soubor"], "banka": zaznam["banka"]},
+        }
+        for zaznam in zaznamy
+    ]
@@ -6,11 +6,11 @@ collection = client.get_collection("hypoteky_all")  # Ujisti se, že název odpo
 
 # Získání dokumentů podle názvu PDF
 results = collection.get(
-    where={"dokument": {"$eq": "Hypoteky_RB_ucely_rekonstrukce.pdf"}}
+    where={"document_source": {"$eq": "Hypoteky_RB_ucely_rekonstrukce.pdf"}}
 )
 
 # Výpis obsahu
 for doc, meta in zip(results["documents"], results["metadatas"]):
-    print(f"📄 {meta.get('dokument')} | strana {meta.get('strana')} | kapitola: {meta.get('kapitola', '?')}")
+    print(f"📄 {meta.get('document_source')} | strana {meta.get('strana', '?')}–{meta.get('strana_do', '?')} | kapitola: {meta.get('kapitola', '?')} {meta.get('nadpis', '')}")
     print(doc)
     print("=" * 80)
\ No newline at end of file
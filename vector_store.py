@@ -0,0 +1,213 @@
+import os
+import json
+import shutil
+import numpy as np
+
+from verze_dokumentu import BEZ_ZACATKU, BEZ_KONCE, filtr_platnosti
+
+PODPOROVANE_DTYPE = ("float32", "float16", "int8")
+SLOUPCE = (
+    "document_source", "banka", "kapitola", "nadpis", "cast", "strana", "strana_do", "dalsi_zdroje",
+    "platnost_od", "platnost_do",
+)
+
+
+# === Export z ChromaDB (prepare_db.py) ===
+def exportuj_z_chromy(collection, adresar: str, verze: str, dtype: str = "float32"):
+    """
+    Zapíše celou kolekci jako NumPy úložiště:
+      vektory.npy  – normalizovaná matice (N × D) v zadaném dtype (int8 + meritka.npy na řádek)
+      texty.bin    – texty chunků v UTF-8 za sebou, offsety.npy – začátky (N + 1)
+      meta.json    – verze indexu, ID a sloupcová metadata
+    Zapisuje se do dočasného adresáře, který pak nahradí původní – běžící workery
+    si ponechají svoje mmapy starých souborů, dokud si nenačtou novou verzi.
+    """
+    if dtype not in PODPOROVANE_DTYPE:
+        raise ValueError(f"Nepodporovaný dtype {dtype}, povolené: {', '.join(PODPOROVANE_DTYPE)}")
+    vse = collection.get(include=["embeddings", "documents", "metadatas"])
+    ids = list(vse["ids"])
+    vektory = np.asarray(vse["embeddings"], dtype=np.float32).reshape(len(ids), -1)
+    normy = np.linalg.norm(vektory, axis=1, keepdims=True)
+    vektory /= np.where(normy == 0, 1.0, normy)
+
+    docasny = adresar + ".tmp"
+    shutil.rmtree(docasny, ignore_errors=True)
+    os.makedirs(docasny)
+
+    if dtype == "int8":
+        meritka = np.abs(vektory).max(axis=1) / 127.0
+        meritka[meritka == 0] = 1.0
+        np.save(os.path.join(docasny, "vektory.npy"), np.round(vektory / meritka[:, None]).astype(np.int8))
+        np.save(os.path.join(docasny, "meritka.npy"), meritka.astype(np.float32))
+    else:
+        np.save(os.path.join(docasny, "vektory.npy"), vektory.astype(dtype))
+
+    offsety = [0]
+    with open(os.path.join(docasny, "texty.bin"), "wb") as f:
+        for text in vse["documents"]:
+            data = (text or "").encode("utf-8")
+            f.write(data)
+            offsety.append(offsety[-1] + len(data))
+    np.save(os.path.join(docasny, "offsety.npy"), np.asarray(offsety, dtype=np.int64))
+
+    with open(os.path.join(docasny, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "verze": verze,
+            "dtype": dtype,
+            "ids": ids,
+            "sloupce": {s: [(m or {}).get(s) for m in vse["metadatas"]] for s in SLOUPCE},
+        }, f, ensure_ascii=False)
+
+    stary = adresar + ".old"
+    shutil.rmtree(stary, ignore_errors=True)
+    if os.path.isdir(adresar):
+        os.rename(adresar, stary)
+    os.rename(docasny, adresar)
+    shutil.rmtree(stary, ignore_errors=True)
+    return len(ids)
+
+
+def verze_exportu(adresar: str):
+    """(verze, dtype) existujícího exportu, nebo None."""
+    try:
+        with open(os.path.join(adresar, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return meta.get("verze"), meta.get("dtype")
+    except (OSError, ValueError):
+        return None
+
+
+# === Vyhledávání ===
+class NumpyUloziste:
+    """
+    Přesné vyhledávání jedním maticovým násobením nad mmapovanou maticí.
+    Stránky matice i textů sdílí všechny workery přes page cache; každý drží
+    v paměti jen ID a sloupcová metadata. Vzdálenost = 1 − kosinová podobnost.
+    """
+
+    def __init__(self, adresar: str):
+        with open(os.path.join(adresar, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.verze = meta["verze"]
+        self.dtype = meta["dtype"]
+        self.ids = meta["ids"]
+        self.sloupce = meta["sloupce"]
+        self._pozice = {chunk_id: i for i, chunk_id in enumerate(self.ids)}
+
+        self._vektory = np.load(os.path.join(adresar, "vektory.npy"), mmap_mode="r")
+        cesta_meritek = os.path.join(adresar, "meritka.npy")
+        self._meritka = np.load(cesta_meritek) if os.path.isfile(cesta_meritek) else None
+        self._offsety = np.load(os.path.join(adresar, "offsety.npy"))
+        velikost_textu = int(self._offsety[-1])
+        self._texty = (
+            np.memmap(os.path.join(adresar, "texty.bin"), dtype=np.uint8, mode="r")
+            if velikost_textu else np.zeros(0, dtype=np.uint8)
+        )
+
+        # Filtry přes booleovské masky: banka jako kódy do slovníku hodnot
+        self._banky, self._kody_bank = np.unique(
+            np.asarray([b or "" for b in self.sloupce["banka"]], dtype=object).astype(str), return_inverse=True
+        )
+        # Platnost vydání jako celá čísla RRRRMMDD; export bez platnosti = platí vždy
+        self._platnost_od = np.asarray(
+            [BEZ_ZACATKU if v is None else v for v in self.sloupce.get("platnost_od", [None] * len(self.ids))], dtype=np.int64
+        )
+        self._platnost_do = np.asarray(
+            [BEZ_KONCE if v is None else v for v in self.sloupce.get("platnost_do", [None] * len(self.ids))], dtype=np.int64
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _skore(self, embedding) -> np.ndarray:
+        dotaz = np.asarray(embedding, dtype=np.float32)
+        dotaz = dotaz / (np.linalg.norm(dotaz) or 1.0)
+        if self._meritka is not None:
+            return (self._vektory @ dotaz) * self._meritka
+        if self._vektory.dtype != np.float32:
+            # NumPy nemá BLAS jádro pro float16 – násobí se ve float32
+            return self._vektory.astype(np.float32) @ dotaz
+        return self._vektory @ dotaz
+
+    def _text(self, i: int) -> str:
+        return bytes(self._texty[self._offsety[i]:self._offsety[i + 1]]).decode("utf-8")
+
+    def _meta(self, i: int) -> dict:
+        return {s: hodnoty[i] for s, hodnoty in self.sloupce.items() if hodnoty[i] is not None}
+
+    def _vysledek(self, i: int, skore: float) -> tuple:
+        return self.ids[i], self._text(i), self._meta(i), 1.0 - float(skore)
+
+    def _nejlepsi(self, skore: np.ndarray, kandidati: np.ndarray, k: int) -> list[int]:
+        if k <= 0 or not len(kandidati):
+            return []
+        if len(kandidati) > k:
+            kandidati = kandidati[np.argpartition(-skore[kandidati], k - 1)[:k]]
+        return kandidati[np.argsort(-skore[kandidati], kind="stable")].tolist()
+
+    def maska_banky(self, banka: str) -> np.ndarray:
+        kod = np.searchsorted(self._banky, banka)
+        if kod >= len(self._banky) or self._banky[kod] != banka:
+            return np.zeros(len(self.ids), dtype=bool)
+        return self._kody_bank == kod
+
+    def maska_platnosti(self, k_datu: int | None) -> np.ndarray:
+        if k_datu is None:
+            return np.ones(len(self.ids), dtype=bool)
+        return (self._platnost_od <= k_datu) & (self._platnost_do > k_datu)
+
+    def hledej(self, embedding, k: int, banka: str | None = None, k_datu: int | None = None) -> list[tuple]:
+        """Top-k (id, text, metadata, vzdálenost), volitelně jen pro jednu banku a vydání platná k datu."""
+        skore = self._skore(embedding)
+        maska = self.maska_platnosti(k_datu)
+        if banka is not None:
+            maska &= self.maska_banky(banka)
+        return [self._vysledek(i, skore[i]) for i in self._nejlepsi(skore, np.flatnonzero(maska), k)]
+
+    def hledej_po_bankach(self, embedding, banky: list[str], k: int, k_datu: int | None = None) -> dict:
+        """Top-k pro každou banku z jediného násobení matice: {banka: [(id, text, metadata, vzdálenost), ...]}."""
+        skore = self._skore(embedding)
+        platne = self.maska_platnosti(k_datu)
+        return {
+            banka: [
+                self._vysledek(i, skore[i])
+                for i in self._nejlepsi(skore, np.flatnonzero(platne & self.maska_banky(banka)), k)
+            ]
+            for banka in banky
+        }
+
+    def nacti(self, ids: list[str]) -> list[tuple]:
+        """(id, text, metadata) pro zadaná ID (neznámá se vynechají)."""
+        return [(chunk_id, self._text(self._pozice[chunk_id]), self._meta(self._pozice[chunk_id]))
+                for chunk_id in ids if chunk_id in self._pozice]
+
+
+class ChromaUloziste:
+    """Stejné rozhraní nad kolekcí ChromaDB (HNSW). Dotazy po bankách běží souběžně v executoru."""
+
+    def __init__(self, ziskej_kolekci, executor):
+        self._ziskej_kolekci = ziskej_kolekci
+        self._executor = executor
+        self.verze = None
+
+    def hledej(self, embedding, k: int, banka: str | None = None, k_datu: int | None = None) -> list[tuple]:
+        podminky = []
+        if banka is not None:
+            podminky.append({"banka": banka})
+        if k_datu is not None:
+            podminky.extend(filtr_platnosti(k_datu)["$and"])
+        results = self._ziskej_kolekci().query(
+            query_embeddings=[embedding],
+            n_results=k,
+            where=(podminky[0] if len(podminky) == 1 else {"$and": podminky}) if podminky else None,
+            include=["documents", "metadatas", "distances"]
+        )
+        return list(zip(results["ids"][0], results["documents"][0], results["metadatas"][0], results["distances"][0]))
+
+    def hledej_po_bankach(self, embedding, banky: list[str], k: int, k_datu: int | None = None) -> dict:
+        # Chroma uplatní jeden `where` na všechny query_embeddings – dotaz na banku je samostatné volání
+        return dict(zip(banky, self._executor.map(lambda banka: self.hledej(embedding, k, banka, k_datu), banky)))
+
+    def nacti(self, ids: list[str]) -> list[tuple]:
+        vysledek = self._ziskej_kolekci().get(ids=ids, include=["documents", "metadatas"])
+        return list(zip(vysledek["ids"], vysledek["documents"], vysledek["metadatas"]))
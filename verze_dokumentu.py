@@ -0,0 +1,134 @@
+import os
+import re
+import json
+import datetime
+import unicodedata
+from collections import defaultdict
+
+BEZ_ZACATKU = 0
+BEZ_KONCE = 99991231     # platnost_do posledního vydání (Chroma filtruje jen čísla, None neumí)
+VERZE_PLATNOSTI = 1
+
+# "01_01_2024", "3_7_2024", "24_6_2024"; "od 01_01_2024" je datum účinnosti
+DATUM_RE = re.compile(r"(?<!\d)(\d{1,2})_(\d{1,2})_(\d{4})(?!\d)")
+OD_DATUM_RE = re.compile(r"\bod\s*(\d{1,2})_(\d{1,2})_(\d{4})(?!\d)", re.IGNORECASE)
+# "Manuál 112024" = listopad 2024
+MESIC_ROK_RE = re.compile(r"(?<!\d)(0[1-9]|1[0-2])(20\d{2})(?!\d)")
+
+
+def jako_cislo(den: datetime.date) -> int:
+    return den.year * 10000 + den.month * 100 + den.day
+
+
+def dnes() -> int:
+    return jako_cislo(datetime.date.today())
+
+
+def parsuj_datum(text: str) -> int:
+    """„2024-03-01“ nebo „1. 3. 2024“ → 20240301; neplatné datum vyhodí ValueError."""
+    text = text.strip()
+    m = re.fullmatch(r"(\d{4})-(\d{1,2})-(\d{1,2})", text)
+    if m:
+        return jako_cislo(datetime.date(int(m.group(1)), int(m.group(2)), int(m.group(3))))
+    m = re.fullmatch(r"(\d{1,2})\.\s*(\d{1,2})\.\s*(\d{4})", text)
+    if m:
+        return jako_cislo(datetime.date(int(m.group(3)), int(m.group(2)), int(m.group(1))))
+    raise ValueError(f"Neplatné datum: {text!r} (očekává se RRRR-MM-DD nebo D. M. RRRR)")
+
+
+def _datum(den, mesic, rok) -> int | None:
+    try:
+        return jako_cislo(datetime.date(int(rok), int(mesic), int(den)))
+    except ValueError:
+        return None
+
+
+def datum_z_nazvu(fname: str) -> int | None:
+    """
+    Datum účinnosti z názvu souboru: přednost má „od D_M_RRRR“, jinak poslední
+    datum v názvu, nakonec „MMRRRR“ (první den měsíce). Bez data None.
+    """
+    nazev = os.path.splitext(fname)[0]
+    m = OD_DATUM_RE.search(nazev)
+    if m:
+        return _datum(*m.groups())
+    data = [_datum(*d) for d in DATUM_RE.findall(nazev)]
+    data = [d for d in data if d]
+    if data:
+        return data[-1]
+    m = MESIC_ROK_RE.search(nazev)
+    if m:
+        return _datum(1, m.group(1), m.group(2))
+    return None
+
+
+def linie_z_nazvu(fname: str) -> str:
+    """
+    Klíč řady vydání: název bez přípony, dat a „od“, bez diakritiky a interpunkce.
+    „_Přehled procesních změn 11_9_2023.docx“ → „prehled procesnich zmen“.
+    """
+    nazev = os.path.splitext(fname)[0]
+    nazev = OD_DATUM_RE.sub(" ", nazev)
+    nazev = DATUM_RE.sub(" ", nazev)
+    nazev = MESIC_ROK_RE.sub(" ", nazev)
+    nazev = unicodedata.normalize("NFD", nazev.lower())
+    nazev = "".join(c for c in nazev if unicodedata.category(c) != "Mn")
+    return " ".join(re.findall(r"[a-z0-9]+", nazev))
+
+
+def urci_platnosti(soubory: list[str]) -> dict:
+    """
+    {soubor: {"linie", "datum", "platnost_od", "platnost_do"}}. V rámci řady vydání platí
+    každé od svého data do data následujícího (bez něj); poslední bez konce. Dokumenty
+    bez data v názvu platí vždy. Dvě vydání se stejným datem platí souběžně.
+    """
+    linie = defaultdict(list)
+    for fname in soubory:
+        linie[linie_z_nazvu(fname)].append((datum_z_nazvu(fname), fname))
+
+    platnosti = {}
+    for klic, vydani in linie.items():
+        data = sorted({d for d, _ in vydani if d is not None})
+        for datum, fname in vydani:
+            if datum is None:
+                od, do = BEZ_ZACATKU, BEZ_KONCE
+            else:
+                nasledujici = [d for d in data if d > datum]
+                # Nejstarší vydání řady platí i zpětně – starší pravidla v indexu nejsou
+                od = datum if datum != data[0] else BEZ_ZACATKU
+                do = nasledujici[0] if nasledujici else BEZ_KONCE
+            platnosti[fname] = {"linie": klic, "datum": datum, "platnost_od": od, "platnost_do": do}
+    return platnosti
+
+
+def platnost_chunku(meta: dict, platnosti: dict) -> tuple[int, int]:
+    """
+    Platnost chunku = sjednocení platností všech souborů, které zastupuje
+    (vlastní dokument + duplikáty sloučené do "dalsi_zdroje").
+    """
+    soubory = [meta.get("document_source")]
+    try:
+        soubory += [z.get("document_source") for z in json.loads(meta.get("dalsi_zdroje") or "[]")]
+    except ValueError:
+        pass
+    okna = [platnosti[s] for s in soubory if s in platnosti]
+    if not okna:
+        return BEZ_ZACATKU, BEZ_KONCE
+    return min(o["platnost_od"] for o in okna), max(o["platnost_do"] for o in okna)
+
+
+def je_platny(od: int, do: int, k_datu: int) -> bool:
+    return od <= k_datu < do
+
+
+def platne_soubory(soubory: dict, k_datu: int) -> set[str]:
+    """Soubory z manifestu platné k datu (záznamy bez platnosti platí vždy)."""
+    return {
+        fname for fname, zaznam in soubory.items()
+        if je_platny(zaznam.get("platnost_od", BEZ_ZACATKU), zaznam.get("platnost_do", BEZ_KONCE), k_datu)
+    }
+
+
+def filtr_platnosti(k_datu: int) -> dict:
+    """Podmínka `where` pro ChromaDB."""
+    return {"$and": [{"platnost_od": {"$lte": k_datu}}, {"platnost_do": {"$gt": k_datu}}]}